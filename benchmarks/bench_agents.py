@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark del camino del agente de Azure AI Foundry contra un sustituto local de la API de
+agentes (benchmarks/fake_agents.py).
+
+Compara el comportamiento anterior (crear un agente nuevo al arrancar, como hacía
+agent_init.initialize_agent, y un hilo y un run por comentario esperando el run con el
+intervalo de un segundo de `create_and_process_run`, sin eliminar los hilos) con
+src/agent_sessions.py: el agente se resuelve por su id, los hilos se reutilizan y cada run puede
+llevar varios comentarios. Reporta el tiempo hasta el primer resultado (incluido el arranque), el
+rendimiento estable después del primer resultado, las llamadas por operación y los hilos que
+quedan vivos.
+
+Uso: python benchmarks/bench_agents.py --rows 200 --concurrency 8 --texts-per-run 10 --output bench_agents.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fake_agents import FakeAgentsClient, FakeAgentsConfig  # noqa: E402
+from synthetic import synthetic_tweets  # noqa: E402
+
+AGENT_ID = "asst_bench"
+# Intervalo de consulta de `create_and_process_run` en azure-ai-projects
+SDK_POLL_INTERVAL = 1.0
+
+
+def score_per_text(agents: FakeAgentsClient, agent_id: str, text: str) -> Dict[str, Any]:
+    """Un hilo y un run por comentario, esperando como create_and_process_run."""
+    from sentiment import _parse_result
+
+    thread = agents.create_thread()
+    agents.create_message(thread_id=thread.id, role="user", content=text)
+    run = agents.create_run(thread_id=thread.id, agent_id=agent_id)
+    while run.status not in ("completed", "failed", "cancelled", "expired"):
+        time.sleep(SDK_POLL_INTERVAL)
+        run = agents.get_run(thread_id=thread.id, run_id=run.id)
+    messages = agents.list_messages(thread_id=thread.id)
+    reply = next(m for m in messages.data if m.role == "assistant")
+    return _parse_result(reply.content[0].text.value)
+
+
+def run_mode(name: str, texts: List[str], concurrency: int, texts_per_run: int,
+             config: FakeAgentsConfig) -> Dict[str, Any]:
+    from agent_sessions import AgentSessionManager
+    from metrics import METRICS
+
+    METRICS.reset()
+    agents = FakeAgentsClient(config)
+    agents.add_agent(AGENT_ID)
+    start = time.perf_counter()
+    manager = None
+    if name == "per_text":
+        agent_id = agents.create_agent(model="gpt-4", name="Sentimental", instructions="...").id
+        setup = time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda text: score_per_text(agents, agent_id, text), texts))
+    else:
+        manager = AgentSessionManager.connect(agents, AGENT_ID, texts_per_run=texts_per_run)
+        setup = time.perf_counter() - start
+        results = manager.score_texts(texts, concurrency)
+    elapsed = time.perf_counter() - start
+    alive_before_close = len(agents.threads)
+    if manager:
+        manager.close()
+    first = agents.first_result_at - start if agents.first_result_at else None
+    steady = len(texts) / (elapsed - first) if first is not None and elapsed > first else None
+    return {
+        "mode": name,
+        "rows": len(texts),
+        "texts_per_run": 1 if name == "per_text" else texts_per_run,
+        "setup_seconds": round(setup, 3),
+        "time_to_first_result_seconds": round(first, 3) if first is not None else None,
+        "seconds": round(elapsed, 3),
+        "tweets_per_second": round(len(texts) / elapsed, 1) if elapsed else None,
+        "steady_tweets_per_second": round(steady, 1) if steady else None,
+        "runs": agents.calls["create_run"],
+        "calls": dict(agents.calls),
+        "threads_created": agents.threads_created,
+        "threads_alive_after_scoring": alive_before_close,
+        "threads_alive_after_close": len(agents.threads),
+        "errors": sum(1 for r in results if r.get("failure")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del agente de AI Foundry: sesiones reutilizables "
+                                                 "frente a un agente y un hilo nuevos por comentario")
+    parser.add_argument("--rows", type=int, default=200, help="Comentarios sintéticos a puntuar")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--texts-per-run", type=int, default=10, help="Comentarios por run en el modo por lotes")
+    parser.add_argument("--create-agent-ms", type=float, default=1500.0, help="Latencia de crear un agente")
+    parser.add_argument("--call-ms", type=float, default=40.0, help="Latencia de cada llamada de datos")
+    parser.add_argument("--run-ms", type=float, default=400.0, help="Duración base de un run")
+    parser.add_argument("--run-text-ms", type=float, default=30.0, help="Duración adicional por comentario del run")
+    parser.add_argument("--modes", nargs="*", help="Subconjunto de modos a ejecutar (por defecto todos)")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    texts = synthetic_tweets(args.rows)["text"].tolist()
+    config = FakeAgentsConfig(create_agent_ms=args.create_agent_ms, call_ms=args.call_ms, run_ms=args.run_ms,
+                              run_text_ms=args.run_text_ms)
+    modes = {"per_text": 1, "sessions": 1, "sessions_batch": args.texts_per_run}
+    selected = args.modes or list(modes)
+    results = [run_mode(name, texts, args.concurrency, modes[name], config) for name in selected]
+
+    report = {
+        "benchmark": "agents",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
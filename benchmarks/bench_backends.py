@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark del pool de backends (src/backends.py) durante una degradación regional.
+
+Levanta dos servidores locales que imitan Azure OpenAI en "regiones" distintas. A mitad de la
+ejecución la primera región se vuelve `--slowdown` veces más lenta y, opcionalmente, empieza a
+fallar. Compara la latencia por comentario (p50/p95/p99) y el rendimiento de un solo backend,
+reparto por pesos, enrutamiento por latencia y enrutamiento por latencia con hedging.
+
+Uso: python benchmarks/bench_backends.py --rows 400 --concurrency 8 --slowdown 8 --output bench_backends.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fake_azure import FakeAzureConfig, FakeAzureServer  # noqa: E402
+from synthetic import synthetic_tweets  # noqa: E402
+
+DEPLOYMENT = "gpt-4-bench"
+
+
+def run_mode(name: str, servers: List[FakeAzureServer], texts: List[str], concurrency: int, routing: str,
+             hedge: bool, regions: int, slowdown: float, failure_ratio: float, latency_ms: float) -> Dict[str, Any]:
+    from backends import Backend, BackendPool
+    from metrics import METRICS
+
+    METRICS.reset()
+    for server in servers:
+        server.config.latency_ms = latency_ms
+        server.config.rate_limit_ratio = 0.0
+    backends = [Backend(f"region-{i}", "openai", server.url, "x", DEPLOYMENT)
+                for i, server in enumerate(servers[:regions])]
+    pool = BackendPool(backends, routing, hedge=hedge, eject_after=3, eject_seconds=5, seed=0)
+
+    half = len(texts) // 2
+    start = time.perf_counter()
+    results = pool.score_texts(texts[:half], concurrency)
+    # Degradación de la primera región: más latencia y, opcionalmente, errores 429
+    servers[0].config.latency_ms = latency_ms * slowdown
+    servers[0].config.rate_limit_ratio = failure_ratio
+    results += pool.score_texts(texts[half:], concurrency)
+    elapsed = time.perf_counter() - start
+
+    summary = METRICS.summary()
+    latency = summary.get("latencies", {}).get("pool_request", {})
+    return {
+        "mode": name,
+        "rows": len(texts),
+        "seconds": round(elapsed, 3),
+        "tweets_per_second": round(len(texts) / elapsed, 1) if elapsed else None,
+        "latency_ms": {key: latency.get(key) for key in ("p50_ms", "p95_ms", "p99_ms")},
+        "errors": sum(1 for r in results if r.get("label") == "error"),
+        "events": {key: summary["events"].get(key, 0)
+                   for key in ("hedged", "hedge_wins", "backend_failovers", "backend_ejected", "retries")},
+        "backends": pool.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pool de backends con una región degradada")
+    parser.add_argument("--rows", type=int, default=400, help="Comentarios sintéticos a puntuar")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=60.0, help="Latencia mediana de cada región")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Dispersión lognormal de la latencia")
+    parser.add_argument("--slowdown", type=float, default=8.0, help="Factor de latencia de la región degradada")
+    parser.add_argument("--failure-ratio", type=float, default=0.0,
+                        help="Fracción de 429 de la región degradada durante la segunda mitad")
+    parser.add_argument("--modes", nargs="*", help="Subconjunto de modos a ejecutar (por defecto todos)")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AZURE_OPENAI_KEY", "x")
+    texts = synthetic_tweets(args.rows)["text"].tolist()
+    modes = {
+        "single": ("latency", False, 1),
+        "weighted": ("weighted", False, 2),
+        "latency": ("latency", False, 2),
+        "latency_hedge": ("latency", True, 2),
+    }
+    selected = args.modes or list(modes)
+    servers = [FakeAzureServer(FakeAzureConfig(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                                               retry_after=0.05, seed=i)).start() for i in range(2)]
+    try:
+        results = [run_mode(name, servers, texts, args.concurrency, *modes[name], args.slowdown,
+                            args.failure_ratio, args.latency_ms) for name in selected]
+    finally:
+        for server in servers:
+            server.stop()
+
+    report = {
+        "benchmark": "backends",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los formatos de exportación de resultados.
+
+Compara tiempo de escritura, tamaño en disco y tiempo de relectura de los exportadores JSON y
+CSV de una sola vez, de la exportación incremental por bloques (JSON, JSONL, CSV) y de la salida
+columnar (Parquet y Arrow IPC, con y sin partición por día) sobre resultados sintéticos.
+
+Uso: python benchmarks/bench_export.py --rows 200000 --output bench_export.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pandas as pd  # noqa: E402
+
+from aggregation import load_results  # noqa: E402
+from export import export_to_csv, export_to_json, open_exporter  # noqa: E402
+from synthetic import synthetic_tweets  # noqa: E402
+from utils import KeywordMatcher, preprocess_texts  # noqa: E402
+
+KEYWORDS = ["golazo", "falta", "penal", "vinotinto", "mundial2026"]
+
+
+def synthetic_results(rows: int) -> List[Dict[str, Any]]:
+    """Resultados con la forma que produce chat_app, con puntajes deterministas."""
+    df = synthetic_tweets(rows, start="2024-06-27T22:00:00")
+    prep = preprocess_texts(df["text"], KeywordMatcher(KEYWORDS))
+    scores = [round((zlib.crc32(text.encode("utf-8")) % 201 - 100) / 100, 2) for text in df["text"]]
+    df["score"] = scores
+    df["label"] = ["positivo" if s > 0.2 else "negativo" if s < -0.2 else "neutral" for s in scores]
+    df["hashtags"] = prep["hashtags"].tolist()
+    df["keywords"] = prep["keywords"].tolist()
+    columns = ["tweet_id", "username", "text", "created_at", "score", "label", "hashtags", "keywords",
+               "retweets", "likes"]
+    return df[columns].to_dict(orient="records")
+
+
+def size_on_disk(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    return os.path.getsize(path)
+
+
+def incremental(records: List[Dict], chunk_size: int, partition_by_day: bool = False) -> Callable[[str], None]:
+    def write(path: str):
+        exporter = open_exporter(path, partition_by_day=partition_by_day)
+        for start in range(0, len(records), chunk_size):
+            exporter.write(records[start:start + chunk_size])
+        exporter.finalize()
+    return write
+
+
+def run_mode(name: str, filename: str, write: Callable[[str], None], workdir: str, rows: int) -> Dict[str, Any]:
+    path = os.path.join(workdir, filename)
+    start = time.perf_counter()
+    write(path)
+    write_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    frame = load_results(path)
+    read_seconds = time.perf_counter() - start
+    assert len(frame) == rows, f"{name}: {len(frame)} filas releídas"
+    result = {
+        "mode": name,
+        "write_seconds": round(write_seconds, 3),
+        "rows_per_second": round(rows / write_seconds, 1) if write_seconds else None,
+        "size_bytes": size_on_disk(path),
+        "read_seconds": round(read_seconds, 3),
+    }
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de escritura y lectura de los formatos de exportación")
+    parser.add_argument("--rows", type=int, default=100000, help="Resultados sintéticos a exportar")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Filas por bloque en la exportación incremental")
+    parser.add_argument("--modes", nargs="*", help="Subconjunto de modos a ejecutar (por defecto todos)")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    records = synthetic_results(args.rows)
+    modes = {
+        "json": ("results.json", lambda path: export_to_json(records, path)),
+        "csv": ("results.csv", lambda path: export_to_csv(records, path)),
+        "incremental_json": ("inc.json", incremental(records, args.chunk_size)),
+        "incremental_jsonl": ("inc.jsonl", incremental(records, args.chunk_size)),
+        "incremental_csv": ("inc.csv", incremental(records, args.chunk_size)),
+        "parquet": ("results.parquet", incremental(records, args.chunk_size)),
+        "parquet_by_day": ("by_day.parquet", incremental(records, args.chunk_size, partition_by_day=True)),
+        "arrow": ("results.arrow", incremental(records, args.chunk_size)),
+    }
+    selected = args.modes or list(modes)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run_mode(name, *modes[name], workdir, args.rows) for name in selected]
+
+    report = {
+        "benchmark": "export",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "config": vars(args),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
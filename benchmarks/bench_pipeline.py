@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark del puntaje de sentimiento contra un servidor local que imita Azure OpenAI.
+
+Mide comentarios por segundo, latencia por llamada (p50/p95/p99) y memoria máxima de cada modo
+de ejecución (secuencial, concurrente, por lotes y por lotes concurrentes) sobre datos
+sintéticos, y emite los resultados en JSON para comparar entre ejecuciones.
+
+Uso: python benchmarks/bench_pipeline.py --rows 500 --latency-ms 80 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fake_azure import FakeAzureConfig, FakeAzureServer  # noqa: E402
+from synthetic import synthetic_tweets  # noqa: E402
+
+DEPLOYMENT = "gpt-4-bench"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class TimedCompletions:
+    """Envuelve `chat.completions` de un cliente para registrar la latencia de cada llamada."""
+
+    def __init__(self, completions, latencies: List[float]):
+        self._completions = completions
+        self._latencies = latencies
+        if hasattr(completions, "with_raw_response"):
+            self.with_raw_response = type(self)(completions.with_raw_response, latencies)
+
+    def create(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._completions.create(*args, **kwargs)
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+
+
+class AsyncTimedCompletions(TimedCompletions):
+    async def create(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self._completions.create(*args, **kwargs)
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+
+
+class TimedClient:
+    def __init__(self, client, latencies: List[float], is_async: bool = False):
+        wrapper = AsyncTimedCompletions if is_async else TimedCompletions
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = wrapper(client.chat.completions, latencies)
+
+
+def run_mode(name: str, fn: Callable[[List[str], List[float]], List[Dict[str, Any]]],
+             texts: List[str]) -> Dict[str, Any]:
+    from metrics import METRICS
+
+    METRICS.reset()
+    latencies: List[float] = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = fn(texts, latencies)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": name,
+        "tweets": len(texts),
+        "seconds": round(elapsed, 4),
+        "tweets_per_sec": round(len(texts) / elapsed, 2) if elapsed else None,
+        "calls": len(latencies),
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)},
+        "peak_memory_mb": round(peak / 2 ** 20, 2),
+        "labels": dict(Counter(result.get("label") for result in results)),
+        "events": METRICS.summary()["events"],
+    }
+
+
+def build_modes(concurrency: int, batch_size: int) -> Dict[str, Callable]:
+    import sentiment
+
+    def serial(texts, latencies):
+        client = TimedClient(sentiment.get_chat_client(), latencies)
+        return [sentiment.get_sentiment_score(text, client, DEPLOYMENT) for text in texts]
+
+    def concurrent(texts, latencies):
+        client = TimedClient(sentiment.get_async_chat_client(), latencies, is_async=True)
+        return asyncio.run(sentiment.score_texts_async(texts, client, DEPLOYMENT, concurrency=concurrency))
+
+    def batched(texts, latencies):
+        client = TimedClient(sentiment.get_chat_client(), latencies)
+        return sentiment.get_sentiment_scores(texts, client, DEPLOYMENT, batch_size)
+
+    def batched_concurrent(texts, latencies):
+        client = TimedClient(sentiment.get_async_chat_client(), latencies, is_async=True)
+        return asyncio.run(sentiment.score_texts_async(texts, client, DEPLOYMENT, concurrency=concurrency,
+                                                       batch_size=batch_size))
+
+    return {
+        "serial": serial,
+        f"concurrent_{concurrency}": concurrent,
+        f"batch_{batch_size}": batched,
+        f"batch_{batch_size}_concurrent_{concurrency}": batched_concurrent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline contra un Azure OpenAI simulado")
+    parser.add_argument("--rows", type=int, default=200, help="Comentarios sintéticos a puntuar")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latencia mediana simulada por llamada")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="Dispersión lognormal de la latencia")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fracción de respuestas 429")
+    parser.add_argument("--content-filter-ratio", type=float, default=0.0,
+                        help="Fracción de rechazos del filtro de contenido")
+    parser.add_argument("--rpm", type=float, help="Cuota simulada de peticiones por minuto")
+    parser.add_argument("--tpm", type=float, help="Cuota simulada de tokens por minuto")
+    parser.add_argument("--no-limiter", action="store_true",
+                        help="Con --rpm/--tpm, no usar el limitador del cliente (solo reintentos)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--modes", nargs="*", help="Subconjunto de modos a ejecutar (por defecto todos)")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    config = FakeAzureConfig(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                             rate_limit_ratio=args.rate_limit_ratio,
+                             content_filter_ratio=args.content_filter_ratio, rpm=args.rpm, tpm=args.tpm)
+    texts = synthetic_tweets(args.rows)["text"].tolist()
+
+    with FakeAzureServer(config) as server:
+        os.environ["AZURE_OPENAI_ENDPOINT"] = server.url
+        os.environ["AZURE_OPENAI_KEY"] = "benchmark"
+        if not args.no_limiter:
+            from ratelimit import configure_rate_limiter
+            configure_rate_limiter(args.rpm, args.tpm)
+        modes = build_modes(args.concurrency, args.batch_size)
+        selected = args.modes or list(modes)
+        results = [run_mode(name, modes[name], texts) for name in selected]
+        server_counters = dict(server.counters)
+
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "server": server_counters,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
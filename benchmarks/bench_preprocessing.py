@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del preprocesamiento: funciones por fila de utils frente a la versión vectorizada
+(preprocess_texts + KeywordMatcher), con listas de palabras clave de distinto tamaño.
+
+Uso: python benchmarks/bench_preprocessing.py --rows 50000 --keywords 10 1000 5000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils import (clean_text, extract_hashtags, extract_keywords,  # noqa: E402
+                   KeywordMatcher, preprocess_texts)
+
+BASE_TEXTS = [
+    "GOLAZOOOO de la #Vinotinto!!! https://t.co/abc123",
+    "Penal para México 🇲🇽 Me quiero matar.",
+    "Qué falta tan clara, el árbitro no la vio #Mundial2026",
+    "SALOOOOOOOOOOOOO DE PENAAAAAAAAAAAAAAALLLL TOMAPAPAAAAAAAAA!!!!!",
+    "vamos vinotinto, hoy se gana @SeleVinotinto",
+]
+
+
+def synthetic_texts(rows: int, seed: int = 0) -> pd.Series:
+    rng = random.Random(seed)
+    return pd.Series([rng.choice(BASE_TEXTS) + " " + "".join(rng.choices(string.ascii_lowercase, k=8))
+                      for _ in range(rows)])
+
+
+def synthetic_keywords(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    keywords = ["golazo", "falta", "penal", "vinotinto", "mundial2026"]
+    while len(keywords) < count:
+        keywords.append("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))))
+    return keywords[:count]
+
+
+def bench_per_row(texts: pd.Series, keywords):
+    for text in texts:
+        cleaned = clean_text(text)
+        extract_hashtags(cleaned)
+        extract_keywords(cleaned, keywords)
+
+
+def bench_vectorized(texts: pd.Series, keywords):
+    preprocess_texts(texts, KeywordMatcher(keywords))
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de preprocesamiento por fila vs vectorizado")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--keywords", type=int, nargs="+", default=[5, 100, 1000, 5000])
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.rows)
+    print(f"{'keywords':>9} {'por fila (s)':>13} {'vectorizado (s)':>16} {'speedup':>8}")
+    for count in args.keywords:
+        keywords = synthetic_keywords(count)
+        per_row = timed(bench_per_row, texts, keywords)
+        vectorized = timed(bench_vectorized, texts, keywords)
+        print(f"{count:>9} {per_row:>13.3f} {vectorized:>16.3f} {per_row / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las variantes de prompt (sentiment.PROMPT_VARIANTS): `full` (SYSTEM_PROMPT y
+respuesta libre) frente a `compact` (prompt reducido, structured outputs y tope de respuesta).
+
+Para cada variante y tamaño de lote reporta tokens de prompt y de respuesta por comentario, costo
+estimado por 1000 comentarios, latencia por llamada (p50/p95) y comentarios por segundo. Con una
+muestra etiquetada (`--sample`, columnas `text` y `label`) mide además la exactitud frente a las
+etiquetas y la concordancia de cada variante con `full`, para comprobar que el ahorro no cuesta
+precisión.
+
+Por defecto usa el servidor local de benchmarks/fake_azure.py, cuyos puntajes son deterministas:
+sirve para medir tokens y latencia, no la exactitud. Con `--live` usa el deployment configurado en
+AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY y MODEL_DEPLOYMENT (consume cuota).
+
+Uso: python benchmarks/bench_prompts.py --rows 300 --batch-sizes 1 10 --output bench_prompts.json
+     python benchmarks/bench_prompts.py --live --sample etiquetados.csv --batch-sizes 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pandas as pd  # noqa: E402
+
+from fake_azure import FakeAzureConfig, FakeAzureServer  # noqa: E402
+from synthetic import synthetic_tweets  # noqa: E402
+
+DEPLOYMENT = "gpt-4-bench"
+
+
+def load_sample(path: str) -> pd.DataFrame:
+    df = pd.read_json(path, lines=True) if path.endswith((".jsonl", ".ndjson")) else pd.read_csv(path)
+    if "text" not in df or "label" not in df:
+        raise SystemExit(f"La muestra {path} necesita las columnas text y label")
+    return df
+
+
+def run_mode(variant: str, batch_size: int, texts: List[str], client, deployment: str, concurrency: int,
+             prompt_price: float, completion_price: float) -> Dict[str, Any]:
+    from metrics import METRICS
+    from sentiment import configure_prompt, score_texts_async
+
+    prompt = configure_prompt(variant)
+    METRICS.reset()
+    METRICS.set_prices(prompt_price, completion_price)
+    start = time.perf_counter()
+    results = asyncio.run(score_texts_async(texts, client, deployment, concurrency=concurrency,
+                                            batch_size=batch_size))
+    elapsed = time.perf_counter() - start
+    summary = METRICS.summary()
+    calls = summary["calls"].get("openai", {})
+    return {
+        "variant": variant,
+        "prompt_version": prompt.version,
+        "batch_size": batch_size,
+        "rows": len(texts),
+        "seconds": round(elapsed, 3),
+        "tweets_per_second": round(len(texts) / elapsed, 1) if elapsed else None,
+        "calls": calls.get("count", 0),
+        "call_latency_ms": {key: calls.get(key) for key in ("p50_ms", "p95_ms")},
+        "tokens_per_tweet": {kind: round(n / len(texts), 2) for kind, n in summary["tokens"].items()},
+        "cost_per_1000_tweets_usd": round(summary["estimated_cost_usd"] / len(texts) * 1000, 4),
+        "events": {key: summary["events"].get(key, 0)
+                   for key in ("errors", "completion_truncated", "batch_retries", "content_filtered")},
+        "_results": results,
+    }
+
+
+def compare(result: Dict[str, Any], reference: Optional[Dict[str, Any]], labels: Optional[List[str]]):
+    """Exactitud frente a la muestra etiquetada y concordancia con la variante de referencia."""
+    predicted = [r.get("label") for r in result["_results"]]
+    if labels is not None:
+        result["accuracy"] = round(sum(p == l for p, l in zip(predicted, labels)) / len(labels), 4)
+    if reference is not None and reference is not result:
+        ref_results = reference["_results"]
+        result["agreement_with_full"] = round(
+            sum(p == r.get("label") for p, r in zip(predicted, ref_results)) / len(predicted), 4)
+        diffs = [abs(float(r.get("score", 0)) - float(ref.get("score", 0)))
+                 for r, ref in zip(result["_results"], ref_results)
+                 if isinstance(r.get("score"), (int, float)) and isinstance(ref.get("score"), (int, float))]
+        result["mean_abs_score_diff"] = round(sum(diffs) / len(diffs), 4) if diffs else None
+
+
+def main():
+    from metrics import DEFAULT_COMPLETION_PRICE, DEFAULT_PROMPT_PRICE
+    from sentiment import PROMPT_VARIANTS, get_async_chat_client
+
+    parser = argparse.ArgumentParser(description="Benchmark de tokens, latencia y exactitud por variante de prompt")
+    parser.add_argument("--sample", help="CSV/JSONL etiquetado (columnas text y label); por defecto datos sintéticos")
+    parser.add_argument("--rows", type=int, default=300, help="Comentarios sintéticos (o máximo de la muestra)")
+    parser.add_argument("--variants", nargs="*", default=list(PROMPT_VARIANTS), choices=list(PROMPT_VARIANTS))
+    parser.add_argument("--batch-sizes", nargs="*", type=int, default=[1, 10])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--live", action="store_true",
+                        help="Usar el deployment de AZURE_OPENAI_ENDPOINT/MODEL_DEPLOYMENT en lugar del servidor local")
+    parser.add_argument("--latency-ms", type=float, default=60.0, help="Servidor local: latencia base por llamada")
+    parser.add_argument("--token-latency-ms", type=float, default=20.0,
+                        help="Servidor local: latencia por token de respuesta")
+    parser.add_argument("--prompt-price", type=float, default=DEFAULT_PROMPT_PRICE)
+    parser.add_argument("--completion-price", type=float, default=DEFAULT_COMPLETION_PRICE)
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto, salida estándar)")
+    args = parser.parse_args()
+
+    if args.sample:
+        df = load_sample(args.sample).head(args.rows)
+        labels = df["label"].astype(str).tolist()
+    else:
+        df, labels = synthetic_tweets(args.rows), None
+    texts = df["text"].astype(str).tolist()
+
+    server = None
+    if args.live:
+        from config import MODEL_DEPLOYMENT
+        deployment = MODEL_DEPLOYMENT
+        if not deployment:
+            raise SystemExit("--live requiere MODEL_DEPLOYMENT")
+        client_args = ()
+    else:
+        deployment = DEPLOYMENT
+        server = FakeAzureServer(FakeAzureConfig(latency_ms=args.latency_ms,
+                                                 token_latency_ms=args.token_latency_ms)).start()
+        client_args = (server.url, "x")
+    try:
+        results = []
+        for batch_size in args.batch_sizes:
+            by_variant = {}
+            for variant in args.variants:
+                # Cliente nuevo por modo: su pool de conexiones queda ligado al bucle de asyncio.run
+                client = get_async_chat_client(*client_args)
+                by_variant[variant] = run_mode(variant, batch_size, texts, client, deployment, args.concurrency,
+                                               args.prompt_price, args.completion_price)
+            for result in by_variant.values():
+                compare(result, by_variant.get("full"), labels)
+                results.append(result)
+    finally:
+        if server:
+            server.stop()
+
+    report = {
+        "benchmark": "prompts",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "endpoint": "live" if args.live else "fake",
+        "config": vars(args),
+        "results": [{key: value for key, value in result.items() if key != "_results"} for result in results],
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
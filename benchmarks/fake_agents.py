@@ -0,0 +1,144 @@
+"""
+Sustituto local de la API de agentes de Azure AI Foundry (`AIProjectClient.agents`).
+
+Implementa en proceso las operaciones que usan src/agent_sessions.py y agent_init.py (agentes,
+hilos, mensajes y runs) con la latencia de cada llamada al servicio simulada con `time.sleep`:
+crear un agente es una operación lenta del plano de control, cada llamada de datos cuesta un
+viaje de red y un run tarda una latencia base más un tiempo por comentario. Las respuestas son
+los puntajes deterministas de fake_azure.py, también para lotes. Registra las llamadas por
+operación, los hilos vivos y el instante de la primera respuesta.
+"""
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from fake_azure import canned_reply
+
+
+class FakeAgentsConfig:
+    """Latencias simuladas en milisegundos."""
+
+    def __init__(self, create_agent_ms: float = 1500.0, get_agent_ms: float = 150.0, call_ms: float = 40.0,
+                 run_ms: float = 400.0, run_text_ms: float = 30.0, latency_sigma: float = 0.2, seed: int = 0):
+        self.create_agent_ms = create_agent_ms
+        self.get_agent_ms = get_agent_ms
+        # Un viaje de red de cualquier otra operación (hilos, mensajes, consultas de runs)
+        self.call_ms = call_ms
+        # Duración de un run: base + por comentario del mensaje
+        self.run_ms = run_ms
+        self.run_text_ms = run_text_ms
+        self.latency_sigma = latency_sigma
+        self.seed = seed
+
+
+class ResourceNotFoundError(Exception):
+    pass
+
+
+class FakeAgentsClient:
+    """Imita `AIProjectClient.agents` (azure-ai-projects 1.0.0b) sin red ni credenciales."""
+
+    def __init__(self, config: Optional[FakeAgentsConfig] = None):
+        self.config = config or FakeAgentsConfig()
+        self.calls: Counter = Counter()
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.threads: Dict[str, Dict[str, Any]] = {}
+        self.threads_created = 0
+        self.first_result_at: Optional[float] = None
+        self._ids = itertools.count(1)
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+
+    def _wait(self, operation: str, ms: float):
+        with self._lock:
+            self.calls[operation] += 1
+            factor = self._random.lognormvariate(0, self.config.latency_sigma)
+        time.sleep(ms * factor / 1000)
+
+    def _new_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}_{next(self._ids):06d}"
+
+    def create_agent(self, model: str, name: str, instructions: str = "", **kwargs) -> SimpleNamespace:
+        self._wait("create_agent", self.config.create_agent_ms)
+        agent_id = self._new_id("asst")
+        self.agents[agent_id] = {"model": model, "name": name}
+        return SimpleNamespace(id=agent_id, name=name, model=model)
+
+    def get_agent(self, agent_id: str) -> SimpleNamespace:
+        self._wait("get_agent", self.config.get_agent_ms)
+        if agent_id not in self.agents:
+            raise ResourceNotFoundError(f"No existe el agente {agent_id}")
+        return SimpleNamespace(id=agent_id, **self.agents[agent_id])
+
+    def add_agent(self, agent_id: str, model: str = "gpt-4o", name: str = "Sentimental"):
+        """Registra un agente ya existente sin coste (como el de Sentimental.agent.yaml)."""
+        self.agents[agent_id] = {"model": model, "name": name}
+
+    def create_thread(self, **kwargs) -> SimpleNamespace:
+        self._wait("create_thread", self.config.call_ms)
+        thread_id = self._new_id("thread")
+        with self._lock:
+            self.threads[thread_id] = {"messages": [], "runs": {}}
+            self.threads_created += 1
+        return SimpleNamespace(id=thread_id)
+
+    def delete_thread(self, thread_id: str):
+        self._wait("delete_thread", self.config.call_ms)
+        with self._lock:
+            self.threads.pop(thread_id, None)
+
+    def create_message(self, thread_id: str, role: str, content: str, **kwargs) -> SimpleNamespace:
+        self._wait("create_message", self.config.call_ms)
+        with self._lock:
+            self.threads[thread_id]["messages"].append({"role": role, "content": content, "run_id": None})
+        return SimpleNamespace(id=self._new_id("msg"), role=role)
+
+    def create_run(self, thread_id: str, agent_id: str, additional_instructions: str = None,
+                   truncation_strategy: Any = None, **kwargs) -> SimpleNamespace:
+        self._wait("create_run", self.config.call_ms)
+        thread = self.threads[thread_id]
+        content = thread["messages"][-1]["content"]
+        reply = canned_reply([{"role": "user", "content": content}])
+        size = content.count('"text"') or 1
+        with self._lock:
+            factor = self._random.lognormvariate(0, self.config.latency_sigma)
+        duration = (self.config.run_ms + self.config.run_text_ms * size) * factor / 1000
+        run_id = self._new_id("run")
+        # Sin truncado el run vuelve a leer todo el historial del hilo
+        history = 1 if truncation_strategy else len(thread["messages"])
+        usage = SimpleNamespace(prompt_tokens=sum(len(m["content"]) for m in thread["messages"][-history:]) // 4,
+                                completion_tokens=len(reply) // 4)
+        thread["runs"][run_id] = {"done_at": time.monotonic() + duration, "reply": reply, "usage": usage}
+        return SimpleNamespace(id=run_id, status="queued", usage=None)
+
+    def get_run(self, thread_id: str, run_id: str) -> SimpleNamespace:
+        self._wait("get_run", self.config.call_ms)
+        run = self.threads[thread_id]["runs"][run_id]
+        if time.monotonic() < run["done_at"]:
+            return SimpleNamespace(id=run_id, status="in_progress", usage=None)
+        with self._lock:
+            if "message" not in run:
+                run["message"] = {"role": "assistant", "content": run["reply"], "run_id": run_id}
+                self.threads[thread_id]["messages"].append(run["message"])
+        return SimpleNamespace(id=run_id, status="completed", usage=run["usage"])
+
+    def cancel_run(self, thread_id: str, run_id: str) -> SimpleNamespace:
+        self._wait("cancel_run", self.config.call_ms)
+        return SimpleNamespace(id=run_id, status="cancelling")
+
+    def list_messages(self, thread_id: str, run_id: str = None, **kwargs) -> SimpleNamespace:
+        self._wait("list_messages", self.config.call_ms)
+        with self._lock:
+            messages = [m for m in reversed(self.threads[thread_id]["messages"])
+                        if run_id is None or m["run_id"] == run_id]
+            if self.first_result_at is None and any(m["role"] == "assistant" for m in messages):
+                self.first_result_at = time.perf_counter()
+        return SimpleNamespace(data=[
+            SimpleNamespace(role=m["role"], content=[SimpleNamespace(text=SimpleNamespace(value=m["content"]))])
+            for m in messages
+        ])
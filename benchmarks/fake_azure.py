@@ -0,0 +1,377 @@
+"""
+Servidor HTTP local que imita la API de chat completions de Azure OpenAI.
+
+Permite medir el pipeline sin consumir cuota: la latencia sigue una distribución lognormal
+configurable y se pueden inyectar respuestas 429 y rechazos del filtro de contenido. También
+puede aplicar una cuota RPM/TPM como la de Azure (ventanas de 10 s, max_tokens descontado
+completo), con cabeceras `x-ratelimit-remaining-*` y 429 con `Retry-After` al excederla. Las
+respuestas son JSON con puntajes deterministas derivados del texto, tanto para un comentario
+como para lotes (arreglo de objetos con "id"). Con `response_format` de tipo `json_schema` responde
+solo `score` y `label` (lotes dentro de "results"), como structured outputs. Respeta `max_tokens`
+(respuesta cortada con `finish_reason: length`) y puede sumar latencia por token de respuesta.
+
+FakeAzureBatchServer agrega los endpoints de archivos y batches de la Batch API; los batches
+terminan `batch_seconds` después de crearse. Para usarlo desde chat_app:
+`python benchmarks/fake_azure.py --port 8000 --batch-seconds 5` y
+`AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8000`.
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+CHAT_PATH = re.compile(r"^/openai/deployments/(?P<deployment>[^/]+)/chat/completions")
+FILES_PATH = re.compile(r"^/openai/files(?:/(?P<file_id>[^/?]+)(?P<content>/content)?)?(?:\?|$)")
+BATCHES_PATH = re.compile(r"^/openai/batches(?:/(?P<batch_id>[^/?]+)(?P<cancel>/cancel)?)?(?:\?|$)")
+
+
+class FakeAzureConfig:
+    """Parámetros de comportamiento del servidor."""
+
+    def __init__(self, latency_ms: float = 50.0, latency_sigma: float = 0.3, rate_limit_ratio: float = 0.0,
+                 content_filter_ratio: float = 0.0, retry_after: float = 0.05, seed: int = 0,
+                 rpm: Optional[float] = None, tpm: Optional[float] = None, batch_seconds: float = 2.0,
+                 token_latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_limit_ratio = rate_limit_ratio
+        self.content_filter_ratio = content_filter_ratio
+        self.retry_after = retry_after
+        self.seed = seed
+        self.rpm = rpm
+        self.tpm = tpm
+        self.batch_seconds = batch_seconds
+        # Tiempo de generación por token de respuesta, que se suma a la latencia base
+        self.token_latency_ms = token_latency_ms
+
+
+def canned_score(text: str) -> Dict[str, Any]:
+    """Puntaje determinista para un texto."""
+    score = round((zlib.crc32(text.encode("utf-8")) % 201 - 100) / 100, 2)
+    label = "positivo" if score > 0.2 else "negativo" if score < -0.2 else "neutral"
+    return {"score": score, "label": label}
+
+
+def completion_body(messages: List[Dict[str, str]], deployment: str, completion_id: str,
+                    request: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Cuerpo de una respuesta de chat completions con puntaje determinista y uso de tokens.
+    `request` es el resto del cuerpo de la petición (`response_format`, `max_tokens`).
+    """
+    request = request or {}
+    structured = (request.get("response_format") or {}).get("type") == "json_schema"
+    content = canned_reply(messages, structured)
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+    completion_tokens = len(content) // 4
+    finish_reason = "stop"
+    max_tokens = request.get("max_tokens")
+    if max_tokens and completion_tokens > max_tokens:
+        content, completion_tokens, finish_reason = content[:max_tokens * 4], max_tokens, "length"
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": deployment,
+        "choices": [{"index": 0, "finish_reason": finish_reason,
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def canned_reply(messages: List[Dict[str, str]], structured: bool = False) -> str:
+    """Genera la respuesta del modelo para los mensajes recibidos."""
+    content = messages[-1].get("content", "") if messages else ""
+    try:
+        items = json.loads(content)
+    except ValueError:
+        items = None
+    if isinstance(items, list):
+        results = [{"id": item.get("id"), **canned_score(item.get("text", ""))} for item in items]
+        return json.dumps({"results": results} if structured else results)
+    reply = canned_score(content)
+    if not structured:
+        reply.update({"hashtags": [], "keywords": [], "retweets": 0, "likes": 0})
+    return json.dumps(reply)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeAzureServer"
+
+    def log_message(self, format, *args):  # noqa: A002 - silencia el log por petición
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_bytes(self, status: int, payload: bytes, content_type: str = "application/octet-stream"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        match = CHAT_PATH.match(self.path)
+        if not match:
+            return self.server.handle_extra(self, "POST")
+        body = self._read_json()
+        config = self.server.config
+        rng = self.server.next_random()
+        self.server.count("requests")
+
+        if rng.random() < config.rate_limit_ratio:
+            self.server.count("rate_limited")
+            return self._send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                                   {"Retry-After": str(config.retry_after),
+                                    "x-ratelimit-remaining-requests": "0"})
+        messages = body.get("messages", [])
+        estimated = sum(len(m.get("content", "")) for m in messages) // 4 + (body.get("max_tokens") or 0)
+        wait, remaining = self.server.consume_quota(estimated)
+        if wait:
+            self.server.count("quota_exceeded")
+            return self._send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                                   {"Retry-After": str(max(1, math.ceil(wait))),
+                                    "retry-after-ms": str(int(wait * 1000)), **remaining})
+        reply = completion_body(messages, match.group("deployment"), f"chatcmpl-{self.server.counters['requests']}",
+                                body)
+        time.sleep(rng.lognormvariate(0, config.latency_sigma) * config.latency_ms / 1000
+                   + reply["usage"]["completion_tokens"] * config.token_latency_ms / 1000)
+        if rng.random() < config.content_filter_ratio:
+            self.server.count("content_filtered")
+            return self._send_json(400, {"error": {"code": "content_filter", "status": 400,
+                                                   "message": "The response was filtered"}})
+
+        self.server.count("completed")
+        self._send_json(200, reply, remaining)
+
+    def do_GET(self):
+        return self.server.handle_extra(self, "GET")
+
+    def do_DELETE(self):
+        return self.server.handle_extra(self, "DELETE")
+
+
+class FakeAzureServer(ThreadingHTTPServer):
+    """Servidor en un hilo de fondo; usar como context manager o con start()/stop()."""
+
+    daemon_threads = True
+
+    def __init__(self, config: Optional[FakeAzureConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.config = config or FakeAzureConfig()
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._thread = None
+        self._quota: Dict[str, float] = {}
+        self._quota_updated = time.monotonic()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_random(self) -> random.Random:
+        with self._lock:
+            return random.Random(self._rng.random())
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def consume_quota(self, tokens: int):
+        """
+        Descuenta una petición de la cuota simulada. Devuelve la espera necesaria (0 si se acepta)
+        y las cabeceras `x-ratelimit-remaining-*`.
+        """
+        config = self.config
+        limits = {"requests": (config.rpm, 1), "tokens": (config.tpm, tokens)}
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self._quota_updated = now - self._quota_updated, now
+            wait = 0.0
+            for kind, (quota, amount) in limits.items():
+                if quota:
+                    capacity = quota / 6
+                    level = min(capacity, self._quota.get(kind, capacity) + elapsed * quota / 60)
+                    self._quota[kind] = level
+                    if level < amount:
+                        wait = max(wait, (amount - level) / (quota / 60))
+            if not wait:
+                for kind, (quota, amount) in limits.items():
+                    if quota:
+                        self._quota[kind] -= amount
+            remaining = {f"x-ratelimit-remaining-{kind}": str(int(self._quota[kind])) if quota else "1000000"
+                         for kind, (quota, _) in limits.items()}
+        return wait, remaining
+
+    def handle_extra(self, handler: _Handler, method: str):
+        """Punto de extensión para otras rutas de la API; por defecto responde 404."""
+        handler._send_json(404, {"error": {"code": "NotFound", "message": f"{method} {handler.path}"}})
+
+    def start(self) -> "FakeAzureServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeAzureServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeAzureBatchServer(FakeAzureServer):
+    """
+    FakeAzureServer con los endpoints de archivos y batches que usa la Batch API.
+
+    Un batch pasa por `validating` e `in_progress` y queda `completed` tras `batch_seconds`;
+    las peticiones rechazadas por `content_filter_ratio` van al archivo de errores.
+    """
+
+    def __init__(self, config: Optional[FakeAzureConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(config, host, port)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._batch_lock = threading.Lock()
+
+    def _add_file(self, content: bytes, filename: str, purpose: str) -> Dict[str, Any]:
+        file_id = f"file-{next(self._ids)}"
+        self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                               "filename": filename, "purpose": purpose, "status": "processed", "content": content}
+        return self.files[file_id]
+
+    def _run_batch(self, batch: Dict[str, Any]):
+        """Genera los archivos de salida y de errores del batch."""
+        rng = self.next_random()
+        outputs, errors = [], []
+        for line in self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request.get("body", {})
+            entry_id = f"batch_req_{next(self._ids)}"
+            if rng.random() < self.config.content_filter_ratio:
+                errors.append({"id": entry_id, "custom_id": request["custom_id"], "error": None, "response": {
+                    "status_code": 400, "request_id": entry_id,
+                    "body": {"error": {"code": "content_filter", "message": "The response was filtered"}}}})
+                continue
+            outputs.append({"id": entry_id, "custom_id": request["custom_id"], "error": None, "response": {
+                "status_code": 200, "request_id": entry_id,
+                "body": completion_body(body.get("messages", []), body.get("model", ""), entry_id, body)}})
+        for key, entries in (("output_file_id", outputs), ("error_file_id", errors)):
+            if entries:
+                content = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+                batch[key] = self._add_file(content, f"{batch['id']}_{key}.jsonl", "batch_output")["id"]
+        batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs),
+                                   "failed": len(errors)}
+        self.count("batch_requests", len(outputs) + len(errors))
+
+    def _refresh(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        if batch["status"] in ("completed", "cancelled"):
+            return batch
+        elapsed = time.time() - batch["created_at"]
+        if elapsed >= self.config.batch_seconds:
+            self._run_batch(batch)
+            batch.update(status="completed", completed_at=int(time.time()))
+        elif elapsed >= self.config.batch_seconds / 5:
+            batch["status"] = "in_progress"
+        return batch
+
+    @staticmethod
+    def _public(record: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in record.items() if key != "content"}
+
+    def handle_extra(self, handler: _Handler, method: str):
+        files, batches = FILES_PATH.match(handler.path), BATCHES_PATH.match(handler.path)
+        with self._batch_lock:
+            if files and method == "POST" and not files.group("file_id"):
+                message = BytesParser(policy=email_policy).parsebytes(
+                    f"Content-Type: {handler.headers['Content-Type']}\r\n\r\n".encode("utf-8") + handler._read_body())
+                fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+                upload = fields["file"]
+                record = self._add_file(upload.get_payload(decode=True), upload.get_filename() or "upload.jsonl",
+                                        fields["purpose"].get_content().strip() if "purpose" in fields else "batch")
+                return handler._send_json(200, self._public(record))
+            if files and method == "GET" and files.group("file_id") in self.files:
+                record = self.files[files.group("file_id")]
+                if files.group("content"):
+                    return handler._send_bytes(200, record["content"])
+                return handler._send_json(200, self._public(record))
+            if batches and method == "POST" and not batches.group("batch_id"):
+                body = handler._read_json()
+                if body.get("input_file_id") not in self.files:
+                    return handler._send_json(400, {"error": {"code": "invalidPayload", "message": "input_file_id"}})
+                batch_id = f"batch_{next(self._ids)}"
+                self.batches[batch_id] = {
+                    "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+                    "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window"),
+                    "status": "validating", "created_at": int(time.time()), "output_file_id": None,
+                    "error_file_id": None, "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                }
+                self.count("batches_created")
+                return handler._send_json(200, self.batches[batch_id])
+            if batches and batches.group("batch_id") in self.batches:
+                batch = self.batches[batches.group("batch_id")]
+                if method == "POST" and batches.group("cancel"):
+                    if batch["status"] != "completed":
+                        batch["status"] = "cancelled"
+                    return handler._send_json(200, batch)
+                if method == "GET":
+                    return handler._send_json(200, self._refresh(batch))
+        super().handle_extra(handler, method)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita Azure OpenAI (chat completions y Batch API)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Latencia adicional por token de respuesta")
+    parser.add_argument("--batch-seconds", type=float, default=2.0, help="Duración de cada batch")
+    parser.add_argument("--content-filter-ratio", type=float, default=0.0)
+    parser.add_argument("--rpm", type=float)
+    parser.add_argument("--tpm", type=float)
+    args = parser.parse_args()
+    config = FakeAzureConfig(latency_ms=args.latency_ms, content_filter_ratio=args.content_filter_ratio,
+                             rpm=args.rpm, tpm=args.tpm, batch_seconds=args.batch_seconds,
+                             token_latency_ms=args.token_latency_ms)
+    server = FakeAzureBatchServer(config, port=args.port)
+    print(f"Servidor en {server.url} (Ctrl+C para terminar)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
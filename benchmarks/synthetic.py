@@ -0,0 +1,43 @@
+"""Datos sintéticos con la misma forma que tweets.csv (tweet_id, username, text, created_at, retweets, likes)."""
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+TEMPLATES = [
+    "GOLAZOOOO de {player}!!! #Vinotinto {emoji}",
+    "Penal para {rival} {emoji} Me quiero matar.",
+    "Qué falta tan clara, el árbitro no la vio #Mundial2026",
+    "{player} PARA PRESIDENTEEEEE!!!!!! https://t.co/{code}",
+    "vamos vinotinto, hoy se gana contra {rival} @SeleVinotinto",
+    "no puede ser, otra vez perdiendo con {rival} {emoji}",
+    "RT @{user}: {player} la rompió hoy #Vinotinto",
+    "El partido está trancado, {player} no aparece",
+]
+PLAYERS = ["Rondón", "Soteldo", "Savarino", "Machís", "Herrera", "Romo", "Rincón", "Cádiz"]
+RIVALS = ["México", "Ecuador", "Jamaica", "Argentina", "Brasil", "Colombia"]
+EMOJIS = ["🍷", "🔥", "😭", "😡", "🇻🇪", "😍", ""]
+USERS = [f"user{i}" for i in range(500)] + ["tomapapa", "laVinotinto", "fanatico_fvf"]
+
+
+def synthetic_tweets(rows: int, seed: int = 0, start: str = "2024-06-27T01:00:00") -> pd.DataFrame:
+    """Genera `rows` comentarios sintéticos con duplicados, retuits y métricas de interacción."""
+    rng = random.Random(seed)
+    start_time = datetime.fromisoformat(start)
+    records = []
+    for i in range(rows):
+        text = rng.choice(TEMPLATES).format(
+            player=rng.choice(PLAYERS), rival=rng.choice(RIVALS), emoji=rng.choice(EMOJIS),
+            code="".join(rng.choices("abcdefghijk0123456789", k=8)), user=rng.choice(USERS),
+        )
+        if rng.random() < 0.5:
+            text += f" {rng.randint(0, 99999)}"
+        records.append({
+            "tweet_id": 1806100000000000000 + i,
+            "username": rng.choice(USERS),
+            "text": text,
+            "created_at": (start_time + timedelta(seconds=i * 7200 / max(rows, 1))).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "retweets": int(rng.paretovariate(1.5)) - 1,
+            "likes": int(rng.paretovariate(1.2)) - 1,
+        })
+    return pd.DataFrame.from_records(records)
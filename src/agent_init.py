@@ -3,10 +3,17 @@ from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
 from typing import Optional
 
-def initialize_agent(instructions: str) -> Optional[str]:
-    """Initialize an AI agent with the given instructions"""
+from agent_sessions import load_agent_id
+
+def initialize_agent(instructions: str, agent_id: Optional[str] = None) -> Optional[str]:
+    """
+    Return the id of the Sentimental agent, creating it only if it does not exist yet.
+
+    The id comes from `agent_id`, AGENT_ID or Sentimental.agent.yaml; an existing agent is
+    reused so startup does not pay for (or leak) a new agent on every call.
+    """
     try:
-        connection_string = os.getenv("PROJECT_CONNECTION_STRING")
+        connection_string = os.getenv("PROJECT_CONNECTION_STRING") or os.getenv("AZURE_PROJECT_CONNECTION_STRING")
         if not connection_string:
             return None
             
@@ -14,6 +21,12 @@ def initialize_agent(instructions: str) -> Optional[str]:
             credential=DefaultAzureCredential(),
             conn_str=connection_string
         ) as project_client:
+            agent_id = agent_id or load_agent_id()
+            if agent_id:
+                try:
+                    return project_client.agents.get_agent(agent_id).id
+                except Exception as e:
+                    print(f"Agent {agent_id} not found, creating a new one: {str(e)}")
             agent = project_client.agents.create_agent(
                 model="gpt-4",
                 name="Sentimental",
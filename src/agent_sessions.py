@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from metrics import METRICS
+from sentiment import (AGENT_DEFINITION_PATH, BATCH_PROMPT, _build_batch_messages, _fallback_result,
+                       _parse_batch_timed, _parse_timed, _split_pending, load_agent_definition)
+
+DEFAULT_IDLE_SECONDS = 300.0
+# Un hilo se reemplaza tras estos runs para que su historial no crezca sin límite
+MAX_RUNS_PER_THREAD = 100
+RUN_TIMEOUT = 120.0
+# Consulta del estado del run: empieza rápido para no retrasar las respuestas cortas y se espacia
+RUN_POLL_MIN = 0.05
+RUN_POLL_MAX = 1.0
+TERMINAL_RUN_STATES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+# Cada run ve solo el último mensaje del hilo: reutilizar el hilo no vuelve a facturar el historial
+TRUNCATION_STRATEGY = {"type": "last_messages", "last_messages": 1}
+
+logger = logging.getLogger(__name__)
+
+
+def load_agent_id(path: str = AGENT_DEFINITION_PATH) -> Optional[str]:
+    """Id del agente: variable AGENT_ID o campo `id` de Sentimental.agent.yaml."""
+    if os.getenv("AGENT_ID"):
+        return os.getenv("AGENT_ID")
+    try:
+        definition = load_agent_definition(path)
+    except OSError:
+        return None
+    return definition.get("id")
+
+
+def get_agents_client(connection_string: str = None) -> Any:
+    """Operaciones de agentes (`AIProjectClient.agents`) del proyecto de Azure AI Foundry."""
+    from azure.ai.projects import AIProjectClient
+    from auth_helper import get_azure_credential
+
+    connection_string = connection_string or os.getenv("AZURE_PROJECT_CONNECTION_STRING")
+    if not connection_string:
+        raise ValueError("Falta la variable de entorno AZURE_PROJECT_CONNECTION_STRING")
+    project_client = AIProjectClient.from_connection_string(credential=get_azure_credential(),
+                                                            conn_str=connection_string)
+    return project_client.agents
+
+
+class _Thread:
+    __slots__ = ("id", "runs", "last_used")
+
+    def __init__(self, thread_id: str):
+        self.id = thread_id
+        self.runs = 0
+        self.last_used = time.monotonic()
+
+
+class AgentSessionManager:
+    """
+    Sesiones reutilizables con un agente de Azure AI Foundry ya creado.
+
+    El agente se resuelve una vez por su id (sin crear uno nuevo en cada arranque) y los hilos
+    se reutilizan entre runs: cada petición toma un hilo libre o crea uno, y al terminar lo
+    devuelve al pool. Cada run puede llevar varios comentarios (`texts_per_run`) con el formato
+    de lote de sentiment.py; lo que falte en la respuesta se reintenta en runs más pequeños. Los
+    hilos sin uso durante `idle_seconds` se eliminan, y `close` elimina el resto.
+    """
+
+    def __init__(self, agents, agent_id: str, texts_per_run: int = 1, idle_seconds: float = DEFAULT_IDLE_SECONDS,
+                 max_runs_per_thread: int = MAX_RUNS_PER_THREAD, run_timeout: float = RUN_TIMEOUT):
+        self.agents = agents
+        self.agent_id = agent_id
+        self.texts_per_run = max(1, texts_per_run)
+        self.idle_seconds = idle_seconds
+        self.max_runs_per_thread = max_runs_per_thread
+        self.run_timeout = run_timeout
+        self._idle: List[_Thread] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, agents=None, agent_id: str = None, **kwargs) -> "AgentSessionManager":
+        """Resuelve el agente por id (una sola consulta al plano de control) y crea el gestor."""
+        agent_id = agent_id or load_agent_id()
+        if not agent_id:
+            raise ValueError(f"No hay id de agente: define AGENT_ID o el campo id de {AGENT_DEFINITION_PATH}")
+        agents = agents if agents is not None else get_agents_client()
+        start = time.perf_counter()
+        agent = agents.get_agent(agent_id)
+        METRICS.record_latency("agent_resolve", time.perf_counter() - start)
+        return cls(agents, agent.id, **kwargs)
+
+    @property
+    def model_key(self) -> str:
+        """Identifica el agente en la clave de la caché de resultados."""
+        return f"agent:{self.agent_id}"
+
+    def _acquire(self) -> _Thread:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        thread = _Thread(self.agents.create_thread().id)
+        METRICS.count("agent_threads_created")
+        return thread
+
+    def _release(self, thread: _Thread, reusable: bool = True):
+        thread.last_used = time.monotonic()
+        if reusable and thread.runs < self.max_runs_per_thread:
+            with self._lock:
+                self._idle.append(thread)
+        else:
+            self._delete(thread)
+
+    def _delete(self, thread: _Thread):
+        try:
+            self.agents.delete_thread(thread.id)
+            METRICS.count("agent_threads_deleted")
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar el hilo {thread.id} del agente: {e}")
+
+    def cleanup(self, idle_seconds: Optional[float] = None) -> int:
+        """Elimina los hilos libres sin uso durante `idle_seconds`. Devuelve cuántos se eliminaron."""
+        limit = self.idle_seconds if idle_seconds is None else idle_seconds
+        now = time.monotonic()
+        with self._lock:
+            stale = [thread for thread in self._idle if now - thread.last_used >= limit]
+            self._idle = [thread for thread in self._idle if now - thread.last_used < limit]
+        for thread in stale:
+            self._delete(thread)
+        return len(stale)
+
+    def close(self):
+        """Elimina todos los hilos libres."""
+        self.cleanup(0)
+
+    def _run(self, content: str, additional_instructions: Optional[str] = None) -> str:
+        """Envía un mensaje en un hilo del pool, espera el run y devuelve la respuesta del agente."""
+        thread = self._acquire()
+        reusable = False
+        start = time.perf_counter()
+        run = None
+        try:
+            self.agents.create_message(thread_id=thread.id, role="user", content=content)
+            run = self.agents.create_run(thread_id=thread.id, agent_id=self.agent_id,
+                                         additional_instructions=additional_instructions,
+                                         truncation_strategy=TRUNCATION_STRATEGY)
+            thread.runs += 1
+            delay = RUN_POLL_MIN
+            while run.status not in TERMINAL_RUN_STATES:
+                if time.perf_counter() - start > self.run_timeout:
+                    # Un run activo bloquea el hilo: se cancela y el hilo se descarta
+                    self.agents.cancel_run(thread_id=thread.id, run_id=run.id)
+                    raise TimeoutError(f"El run {run.id} superó {self.run_timeout:.0f} s")
+                time.sleep(delay)
+                delay = min(delay * 2, RUN_POLL_MAX)
+                run = self.agents.get_run(thread_id=thread.id, run_id=run.id)
+            if run.status == "requires_action":
+                # El run sigue activo esperando herramientas: se cancela y el hilo se descarta
+                self.agents.cancel_run(thread_id=thread.id, run_id=run.id)
+            else:
+                reusable = True
+            if run.status != "completed":
+                raise RuntimeError(f"El run {run.id} terminó como {run.status}: {getattr(run, 'last_error', None)}")
+            messages = self.agents.list_messages(thread_id=thread.id, run_id=run.id)
+            return "".join(part.text.value for message in messages.data if message.role == "assistant"
+                           for part in message.content if getattr(part, "text", None))
+        finally:
+            METRICS.record_call("agent", time.perf_counter() - start, getattr(run, "usage", None))
+            self._release(thread, reusable)
+
+    def score_text(self, text: str) -> Dict[str, Any]:
+        """Puntúa un comentario en un run propio; los errores se devuelven como resultado fallido."""
+        try:
+            return _parse_timed(self._run(text))
+        except Exception as e:
+            logger.error(f"Error invoking agent: {e}")
+            METRICS.count("errors")
+            return _fallback_result(failure="agent_error")
+
+    def _score_group(self, texts: List[str], indices: List[int], results: List[Dict[str, Any]]):
+        """Puntúa `indices` en un solo run y reintenta en runs más pequeños lo que falte."""
+        if len(indices) == 1:
+            results[indices[0]] = self.score_text(texts[indices[0]])
+            return
+        content = _build_batch_messages([texts[i] for i in indices])[-1]["content"]
+        try:
+            parsed = _parse_batch_timed(self._run(content, BATCH_PROMPT), len(indices))
+        except Exception as e:
+            logger.error(f"Error del agente en un run de {len(indices)} comentarios: {e}")
+            METRICS.count("batch_errors")
+            parsed = {}
+        for pos, i in enumerate(indices):
+            if pos in parsed:
+                results[i] = parsed[pos]
+        for pending in _split_pending(indices, parsed):
+            METRICS.count("batch_retries")
+            self._score_group(texts, pending, results)
+
+    def score_texts(self, texts: List[str], concurrency: int = 1) -> List[Dict[str, Any]]:
+        """Puntúa los textos con hasta `concurrency` runs en paralelo, conservando el orden."""
+        self.cleanup()
+        results: List[Dict[str, Any]] = [None] * len(texts)
+        groups = [list(range(start, min(start + self.texts_per_run, len(texts))))
+                  for start in range(0, len(texts), self.texts_per_run)]
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(groups) or 1))) as executor:
+            for future in [executor.submit(self._score_group, texts, indices, results) for indices in groups]:
+                future.result()
+        return results
@@ -0,0 +1,240 @@
+import argparse
+import json
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils import to_utc
+
+GRANULARITIES = {"minute": "min", "hour": "h", "day": "D"}
+LABELS = ["positivo", "neutral", "negativo"]
+# Etiqueta de los comentarios que no se puntuaron por falta de presupuesto; cuentan en el volumen
+# pero no en las medias
+UNSCORED_LABEL = "unscored"
+BUCKET_COLUMNS = ["count", "score_sum", "weighted_sum", "weight_sum"] + LABELS + ["otros", "unscored"]
+# Los retweets pesan más que los "me gusta", como indica el prompt del sistema
+RETWEET_WEIGHT = 2.0
+DEFAULT_SPIKE_BASELINE = 10
+DEFAULT_SPIKE_ZSCORE = 3.0
+
+
+def engagement_weight(retweets, likes):
+    """Peso de un comentario según su interacción: 1 + log(1 + 2·retweets + likes). Acepta escalares o arreglos."""
+    retweets = np.nan_to_num(np.asarray(retweets, dtype=float))
+    likes = np.nan_to_num(np.asarray(likes, dtype=float))
+    return 1.0 + np.log1p(np.clip(RETWEET_WEIGHT * retweets + likes, 0, None))
+
+
+class SentimentAggregator:
+    """
+    Agregación incremental de resultados por ventanas de tiempo.
+
+    `update` cuesta O(1) por registro: acumula en el bucket de su ventana fija (minuto, hora o
+    día). Las ventanas deslizantes, medias ponderadas y picos se calculan al pedir `series`.
+    """
+
+    def __init__(self, granularity: str = "minute", window: int = 1):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad no soportada: {granularity}")
+        self.granularity = granularity
+        self.window = max(1, window)
+        self.buckets: Dict[pd.Timestamp, List[float]] = {}
+        self.skipped = 0
+
+    def update(self, record: Dict[str, Any]):
+        """Añade un resultado (con `created_at`, `score`, `label`, `retweets` y `likes`)."""
+        created_at = record.get("created_at")
+        if isinstance(created_at, (int, float)) and not isinstance(created_at, bool):
+            ts = pd.Timestamp(created_at, unit="ms") if not math.isnan(created_at) else pd.NaT
+        else:
+            ts = pd.Timestamp(created_at) if created_at not in (None, "") else pd.NaT
+        if pd.isna(ts):
+            self.skipped += 1
+            return
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert("UTC").tz_localize(None)
+        key = ts.floor(GRANULARITIES[self.granularity])
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [0.0] * len(BUCKET_COLUMNS)
+        label = record.get("label")
+        bucket[0] += 1
+        score = record.get("score")
+        if label == UNSCORED_LABEL or score is None or (isinstance(score, float) and math.isnan(score)):
+            bucket[8] += 1
+            return
+        if label not in LABELS:
+            # Errores y rechazos del filtro llevan puntaje 0: se cuentan, pero no entran en las medias
+            bucket[7] += 1
+            return
+        score = float(score)
+        weight = float(engagement_weight(record.get("retweets") or 0, record.get("likes") or 0))
+        bucket[1] += score
+        bucket[2] += weight * score
+        bucket[3] += weight
+        bucket[4 + LABELS.index(label)] += 1
+
+    def update_many(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            self.update(record)
+
+    def update_frame(self, df: pd.DataFrame):
+        """Equivale a `update_many` sobre un DataFrame de resultados, sumando los buckets de `bucket_frame`."""
+        self.skipped += int(to_utc(df["created_at"]).isna().sum())
+        grouped = bucket_frame(df, self.granularity)
+        for key, values in zip(grouped.index, grouped.to_numpy().tolist()):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = values
+            else:
+                for i, value in enumerate(values):
+                    bucket[i] += value
+
+    def buckets_frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame.from_dict(self.buckets, orient="index", columns=BUCKET_COLUMNS)
+        return frame.sort_index()
+
+    def series(self, spike_baseline: int = DEFAULT_SPIKE_BASELINE,
+               spike_zscore: float = DEFAULT_SPIKE_ZSCORE) -> Dict[str, Any]:
+        result = finalize_buckets(self.buckets_frame(), self.granularity, self.window, spike_baseline, spike_zscore)
+        result["skipped"] = self.skipped
+        return result
+
+
+def bucket_frame(df: pd.DataFrame, granularity: str = "minute") -> pd.DataFrame:
+    """Versión vectorizada de SentimentAggregator.update para un DataFrame de resultados."""
+    timestamps = to_utc(df["created_at"].reset_index(drop=True))
+    valid = timestamps.notna().to_numpy()
+    scores = pd.to_numeric(df["score"], errors="coerce").to_numpy(dtype=float)[valid]
+    retweets = df["retweets"].to_numpy()[valid] if "retweets" in df else np.zeros(valid.sum())
+    likes = df["likes"].to_numpy()[valid] if "likes" in df else np.zeros(valid.sum())
+    labels = df["label"].to_numpy()[valid]
+    scored = ~np.isnan(scores) & (labels != UNSCORED_LABEL)
+    known = np.isin(labels, LABELS)
+    # Solo las etiquetas de sentimiento entran en las medias; errores y rechazos del filtro van a "otros"
+    averaged = scored & known
+    scores = np.where(averaged, scores, 0.0)
+    weights = engagement_weight(retweets, likes) * averaged
+    frame = pd.DataFrame({
+        "key": timestamps[valid].dt.floor(GRANULARITIES[granularity]).to_numpy(),
+        "count": 1.0,
+        "score_sum": scores,
+        "weighted_sum": weights * scores,
+        "weight_sum": weights,
+        **{label: (labels == label).astype(float) for label in LABELS},
+        "otros": (~known & scored).astype(float),
+        "unscored": (~scored).astype(float),
+    })
+    grouped = frame.groupby("key")[BUCKET_COLUMNS].sum()
+    grouped.index.name = None
+    return grouped
+
+
+def finalize_buckets(buckets: pd.DataFrame, granularity: str, window: int = 1,
+                     spike_baseline: int = DEFAULT_SPIKE_BASELINE,
+                     spike_zscore: float = DEFAULT_SPIKE_ZSCORE) -> Dict[str, Any]:
+    """
+    Convierte buckets fijos en la serie final: ventanas deslizantes de `window` buckets
+    (1 = ventanas fijas), medias simple y ponderada, conteo por etiqueta y picos.
+    """
+    if buckets.empty:
+        return {"granularity": granularity, "window": window, "series": [], "spikes": []}
+    freq = GRANULARITIES[granularity]
+    # Se rellenan los buckets vacíos para que las ventanas deslizantes cubran tiempo real
+    full_index = pd.date_range(buckets.index.min(), buckets.index.max(), freq=freq)
+    buckets = buckets.reindex(full_index, fill_value=0.0)
+    windows = buckets.rolling(window, min_periods=1).sum() if window > 1 else buckets
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = windows["score_sum"] / (windows["count"] - windows["unscored"] - windows["otros"])
+        weighted = windows["weighted_sum"] / windows["weight_sum"]
+    series = pd.DataFrame({
+        "window_start": (windows.index - pd.tseries.frequencies.to_offset(freq) * (window - 1)),
+        "window_end": windows.index + pd.tseries.frequencies.to_offset(freq),
+        "count": windows["count"].astype(int),
+        "mean_score": mean.round(4),
+        "weighted_mean_score": weighted.round(4),
+        **{label: windows[label].astype(int) for label in LABELS + ["otros", "unscored"]},
+    })
+
+    spikes = []
+    for metric in ("count", "weighted_mean_score"):
+        values = series[metric].astype(float)
+        baseline = values.shift(1).rolling(spike_baseline, min_periods=max(2, spike_baseline // 2))
+        zscores = (values - baseline.mean()) / baseline.std()
+        flagged = zscores.abs() >= spike_zscore
+        for i in np.flatnonzero(flagged.fillna(False).to_numpy()):
+            spikes.append({
+                "window_start": series["window_start"].iloc[i].isoformat(),
+                "metric": metric,
+                "value": round(float(values.iloc[i]), 4),
+                "zscore": round(float(zscores.iloc[i]), 2),
+            })
+
+    records = series.assign(
+        window_start=series["window_start"].map(pd.Timestamp.isoformat),
+        window_end=series["window_end"].map(pd.Timestamp.isoformat),
+    ).replace({np.nan: None}).to_dict(orient="records")
+    return {"granularity": granularity, "window": window, "series": records, "spikes": spikes}
+
+
+def aggregate_frame(df: pd.DataFrame, granularity: str = "minute", window: int = 1,
+                    spike_baseline: int = DEFAULT_SPIKE_BASELINE,
+                    spike_zscore: float = DEFAULT_SPIKE_ZSCORE) -> Dict[str, Any]:
+    """Agrega un DataFrame de resultados completo de forma vectorizada."""
+    result = finalize_buckets(bucket_frame(df, granularity), granularity, window, spike_baseline, spike_zscore)
+    result["skipped"] = int(to_utc(df["created_at"]).isna().sum())
+    return result
+
+
+def load_results(file_path: str, chunksize: Optional[int] = None):
+    """Lee un archivo de resultados exportado (JSON, JSONL, CSV o directorio Parquet/Arrow)."""
+    if file_path.rstrip("/\\").endswith((".parquet", ".arrow")):
+        import pyarrow.dataset as ds
+        dataset = ds.dataset(file_path, format="parquet" if file_path.rstrip("/\\").endswith(".parquet") else "ipc",
+                             partitioning="hive")
+        if not chunksize:
+            return dataset.to_table().to_pandas()
+        return (batch.to_pandas() for batch in dataset.to_batches(batch_size=chunksize))
+    if file_path.endswith(".csv"):
+        return pd.read_csv(file_path, chunksize=chunksize)
+    if file_path.endswith((".jsonl", ".ndjson")):
+        return pd.read_json(file_path, lines=True, chunksize=chunksize, convert_dates=False)
+    if file_path.endswith(".json"):
+        df = pd.read_json(file_path, convert_dates=False)
+        return [df] if chunksize else df
+    raise ValueError("Formato de archivo no soportado")
+
+
+def write_aggregation(result: Dict[str, Any], file_path: str):
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrega resultados de sentimiento por ventanas de tiempo")
+    parser.add_argument("input", help="Archivo de resultados (JSON, JSONL o CSV)")
+    parser.add_argument("--output", required=True, help="Archivo JSON de salida")
+    parser.add_argument("--granularity", choices=list(GRANULARITIES), default="minute")
+    parser.add_argument("--window", type=int, default=1, help="Tamaño de la ventana deslizante en buckets (1 = fija)")
+    parser.add_argument("--spike-zscore", type=float, default=DEFAULT_SPIKE_ZSCORE,
+                        help="Desviación (z-score) respecto a las ventanas previas para marcar un pico")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="Filas por bloque al leer CSV/JSONL")
+    args = parser.parse_args()
+
+    buckets = []
+    skipped = 0
+    for chunk in load_results(args.input, chunksize=args.chunk_size):
+        buckets.append(bucket_frame(chunk, args.granularity))
+        skipped += int(to_utc(chunk["created_at"]).isna().sum())
+    merged = pd.concat(buckets).groupby(level=0).sum() if buckets else pd.DataFrame(columns=BUCKET_COLUMNS)
+    result = finalize_buckets(merged, args.granularity, args.window, spike_zscore=args.spike_zscore)
+    result["skipped"] = skipped
+    write_aggregation(result, args.output)
+    print(f"Agregación completada: {len(result['series'])} ventanas, {len(result['spikes'])} picos -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,20 @@
 import os
-from azure.identity import AzureCliCredential, DefaultAzureCredential, ChainedTokenCredential
+from functools import lru_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=None)
 def get_azure_credential():
     """
     Get Azure credentials using a chained approach:
     1. Try Azure CLI credentials
     2. Fall back to Default Azure credentials
+
+    The credential is built once per process so its token cache is reused.
     """
+    from azure.identity import AzureCliCredential, DefaultAzureCredential, ChainedTokenCredential
+
     try:
         # Try Azure CLI credential first
         cli_credential = AzureCliCredential()
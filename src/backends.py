@@ -0,0 +1,314 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+
+from metrics import METRICS
+from ratelimit import RateLimiter
+from sentiment import (AGENT_ENDPOINT_NAME, _build_messages, _complete_async, _fallback_result, _invoke_agent,
+                       _is_content_filter, _parse_timed, get_agent_client, get_async_chat_client)
+
+ROUTING = ("latency", "weighted")
+# Reintentos por backend antes de pasar al siguiente: con un pool conviene cambiar de región
+# en lugar de esperar el backoff completo de ratelimit.call_with_retries
+POOL_MAX_RETRIES = 1
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 200
+# Muestras mínimas para fijar el plazo de una petición de cobertura (hedge)
+MIN_HEDGE_SAMPLES = 20
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_EJECT_AFTER = 5
+DEFAULT_EJECT_SECONDS = 30.0
+MAX_EJECT_SECONDS = 600.0
+# Probabilidad de elegir un backend sano al azar para volver a medir su latencia
+EXPLORATION = 0.05
+
+
+class Backend:
+    """Un deployment de Azure OpenAI o el agente ML, con su latencia reciente y su estado de salud."""
+
+    def __init__(self, name: str, kind: str = "openai", endpoint: str = None, api_key: str = None,
+                 deployment: str = None, weight: float = 1.0, rpm: Optional[float] = None,
+                 tpm: Optional[float] = None):
+        self.name = name
+        self.kind = kind
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.deployment = deployment
+        self.weight = weight
+        # Cuota propia del deployment; None = la de --rpm/--tpm
+        self.rpm = rpm
+        self.tpm = tpm
+        self.limiter: Optional[RateLimiter] = None
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.ewma: Optional[float] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    @property
+    def model_key(self) -> str:
+        return f"agent:{AGENT_ENDPOINT_NAME}" if self.kind == "agent" else self.deployment
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def load_backends(path: str) -> Dict[str, Any]:
+    """
+    Lee la configuración del pool: un objeto JSON con `backends` (y opcionalmente `routing`,
+    `hedge`, `eject_after`, `eject_seconds`) o directamente la lista de backends. Cada backend
+    OpenAI indica `endpoint` (o `endpoint_env`), `deployment`, la variable con su clave
+    (`api_key_env`, por defecto AZURE_OPENAI_KEY) y opcionalmente su cuota (`rpm`, `tpm`);
+    `{"type": "agent"}` agrega el agente ML.
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        config = {"backends": config}
+    backends = []
+    for i, entry in enumerate(config.get("backends", [])):
+        kind = entry.get("type", "openai")
+        name = entry.get("name") or f"{kind}-{i}"
+        if kind == "agent":
+            backends.append(Backend(name, "agent", weight=float(entry.get("weight", 1.0))))
+            continue
+        if kind != "openai":
+            raise ValueError(f"Tipo de backend desconocido en {name}: {kind}")
+        endpoint = entry.get("endpoint") or os.getenv(entry.get("endpoint_env", ""), "")
+        api_key = os.getenv(entry.get("api_key_env", "AZURE_OPENAI_KEY"))
+        deployment = entry.get("deployment") or os.getenv("MODEL_DEPLOYMENT")
+        if not endpoint or not api_key or not deployment:
+            raise ValueError(f"El backend {name} requiere endpoint, clave y deployment")
+        backends.append(Backend(name, "openai", endpoint, api_key, deployment, float(entry.get("weight", 1.0)),
+                                entry.get("rpm"), entry.get("tpm")))
+    if not backends:
+        raise ValueError(f"No hay backends configurados en {path}")
+    if len({backend.name for backend in backends}) < len(backends):
+        raise ValueError("Los nombres de los backends deben ser únicos")
+    config["backends"] = backends
+    return config
+
+
+class BackendPool:
+    """
+    Reparte las peticiones entre varios backends.
+
+    - `routing="latency"` elige el backend sano con menor latencia media (EWMA) por petición en
+      vuelo; `"weighted"` sortea según `weight`.
+    - Tras `eject_after` fallos seguidos un backend se expulsa durante `eject_seconds` (el doble
+      en cada expulsión consecutiva); al volver, un solo fallo lo expulsa de nuevo.
+    - Si una petición falla se repite en otro backend.
+    - Con `hedge`, si una petición supera el percentil `hedge_percentile` de latencia de su
+      backend se lanza una segunda en otro backend y se usa la primera que responda.
+    """
+
+    def __init__(self, backends: List[Backend], routing: str = "latency", hedge: bool = False,
+                 hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE, eject_after: int = DEFAULT_EJECT_AFTER,
+                 eject_seconds: float = DEFAULT_EJECT_SECONDS, seed: Optional[int] = None):
+        if routing not in ROUTING:
+            raise ValueError(f"Enrutamiento desconocido: {routing}")
+        self.backends = backends
+        self.routing = routing
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.eject_after = max(1, eject_after)
+        self.eject_seconds = eject_seconds
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def from_config(cls, path: str, routing: Optional[str] = None, hedge: Optional[bool] = None) -> "BackendPool":
+        config = load_backends(path)
+        return cls(config["backends"], routing or config.get("routing", "latency"),
+                   hedge if hedge is not None else bool(config.get("hedge", False)),
+                   float(config.get("hedge_percentile", DEFAULT_HEDGE_PERCENTILE)),
+                   int(config.get("eject_after", DEFAULT_EJECT_AFTER)),
+                   float(config.get("eject_seconds", DEFAULT_EJECT_SECONDS)))
+
+    def configure_rate_limits(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                              state_path: Optional[str] = None):
+        """
+        Un limitador por deployment: la cuota de Azure es de cada deployment, así que un 429 en
+        una región no frena a las demás. `rpm`/`tpm` se usan para los backends sin cuota propia;
+        con `state_path` cada backend comparte su estado entre procesos en `<state_path>.<nombre>`.
+        """
+        for backend in self.backends:
+            if backend.kind != "openai":
+                continue
+            backend_rpm = backend.rpm if backend.rpm is not None else rpm
+            backend_tpm = backend.tpm if backend.tpm is not None else tpm
+            backend.limiter = (RateLimiter(backend_rpm, backend_tpm, state_path and f"{state_path}.{backend.name}")
+                               if (backend_rpm or backend_tpm) else None)
+
+    @property
+    def model_key(self) -> str:
+        """Clave de caché: los deployments con el mismo nombre comparten resultados."""
+        return "+".join(sorted({backend.model_key for backend in self.backends}))
+
+    def choose(self, exclude: Set[str] = frozenset()) -> Optional[Backend]:
+        """Backend para el siguiente intento, o None si ya se probaron todos."""
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b.name not in exclude]
+        healthy = [b for b in candidates if b.healthy(now)]
+        if not healthy:
+            # Todos expulsados: se prueba el que vuelve antes en lugar de fallar sin intentarlo
+            return min(candidates, key=lambda b: b.ejected_until) if candidates else None
+        if self.routing == "weighted":
+            return self._rng.choices(healthy, weights=[b.weight for b in healthy])[0]
+        untried = [b for b in healthy if b.ewma is None]
+        if untried:
+            return untried[0]
+        if len(healthy) > 1 and self._rng.random() < EXPLORATION:
+            return self._rng.choice(healthy)
+        return min(healthy, key=lambda b: b.ewma * (b.in_flight + 1))
+
+    def hedge_delay(self, backend: Backend) -> Optional[float]:
+        if not self.hedge or len(self.backends) < 2 or len(backend.latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return backend.percentile(self.hedge_percentile)
+
+    @staticmethod
+    def _observe(backend: Backend, latency: float):
+        backend.latencies.append(latency)
+        backend.ewma = latency if backend.ewma is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * backend.ewma
+
+    def _succeeded(self, backend: Backend, latency: float):
+        self._observe(backend, latency)
+        backend.consecutive_failures = 0
+        backend.ejections = 0
+        METRICS.record_latency(f"backend:{backend.name}", latency)
+
+    def _failed(self, backend: Backend, error: Exception):
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        METRICS.count("backend_failures")
+        now = time.monotonic()
+        # Las peticiones que ya estaban en vuelo al expulsarlo no alargan la expulsión
+        if backend.consecutive_failures >= self.eject_after and backend.healthy(now):
+            seconds = min(MAX_EJECT_SECONDS, self.eject_seconds * 2 ** backend.ejections)
+            backend.ejected_until = now + seconds
+            backend.ejections += 1
+            # Al volver queda a prueba: el siguiente fallo lo expulsa otra vez
+            backend.consecutive_failures = self.eject_after - 1
+            METRICS.count("backend_ejected")
+            print(f"Backend {backend.name} expulsado durante {seconds:.0f} s tras fallos repetidos ({error})")
+
+    async def _attempt(self, backend: Backend, text: str, clients: Dict[str, Any]) -> Dict[str, Any]:
+        """Un intento en `backend`; propaga el error para que el pool cambie de backend."""
+        from openai import BadRequestError
+
+        backend.in_flight += 1
+        backend.requests += 1
+        start = time.perf_counter()
+        try:
+            if backend.kind == "agent":
+                result = await asyncio.to_thread(_invoke_agent, text, get_agent_client())
+            else:
+                try:
+                    content = await _complete_async(clients[backend.name], _build_messages(text),
+                                                    backend.deployment, POOL_MAX_RETRIES, limiter=backend.limiter)
+                    result = _parse_timed(content)
+                except BadRequestError as e:
+                    if not _is_content_filter(e):
+                        raise  # Petición inválida para este deployment: cuenta como fallo del backend
+                    # El filtro de contenido rechaza el texto, no el backend: no cuenta como fallo
+                    METRICS.count("content_filtered")
+                    result = _fallback_result("filtered_by_policy", "content_filter")
+        except asyncio.CancelledError:
+            # Perdió contra una petición de cobertura: lo esperado hasta ahora es una cota inferior
+            # de su latencia, y sin ella el backend lento seguiría pareciendo rápido
+            self._observe(backend, time.perf_counter() - start)
+            raise
+        except Exception as e:
+            self._failed(backend, e)
+            raise
+        finally:
+            backend.in_flight -= 1
+        self._succeeded(backend, time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, backend: Backend, text: str, clients: Dict[str, Any], tried: Set[str]) -> Dict[str, Any]:
+        primary = asyncio.ensure_future(self._attempt(backend, text, clients))
+        delay = self.hedge_delay(backend)
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        second = None if done else self.choose(tried)
+        if second is None or not second.healthy(time.monotonic()):
+            return await primary
+        tried.add(second.name)
+        METRICS.count("hedged")
+        secondary = asyncio.ensure_future(self._attempt(second, text, clients))
+        pending = {primary, secondary}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            METRICS.count("hedge_wins")
+                        return task.result()
+            return primary.result()  # Ambos fallaron: se propaga el error del primero
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def score_async(self, text: str, clients: Dict[str, Any]) -> Dict[str, Any]:
+        """Puntúa un texto probando backends hasta que uno responda."""
+        start = time.perf_counter()
+        tried: Set[str] = set()
+        try:
+            while True:
+                backend = self.choose(tried)
+                if backend is None:
+                    METRICS.count("errors")
+                    return _fallback_result("error", "error")
+                tried.add(backend.name)
+                try:
+                    return await self._hedged(backend, text, clients, tried)
+                except Exception:
+                    METRICS.count("backend_failovers")
+        finally:
+            METRICS.record_latency("pool_request", time.perf_counter() - start)
+
+    async def score_texts_async(self, texts: List[str], concurrency: int = 8) -> List[Dict[str, Any]]:
+        """Como sentiment.score_texts_async, con un texto por petición repartido entre los backends."""
+        # Los clientes asíncronos quedan ligados al bucle de eventos: se crean por llamada y se cierran al terminar
+        clients = {b.name: get_async_chat_client(b.endpoint, b.api_key) for b in self.backends if b.kind == "openai"}
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _score(text: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.score_async(text, clients)
+
+        try:
+            return await asyncio.gather(*(_score(text) for text in texts))
+        finally:
+            for client in clients.values():
+                await client.close()
+
+    def score_texts(self, texts: List[str], concurrency: int = 8) -> List[Dict[str, Any]]:
+        return asyncio.run(self.score_texts_async(texts, concurrency))
+
+    def summary(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [{
+            "name": b.name,
+            "requests": b.requests,
+            "failures": b.failures,
+            "p50_ms": round(b.percentile(50) * 1000, 1) if b.latencies else None,
+            "p95_ms": round(b.percentile(95) * 1000, 1) if b.latencies else None,
+            "ejected": not b.healthy(now),
+        } for b in self.backends]
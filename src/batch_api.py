@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import METRICS
+from sentiment import active_prompt, batch_api_request, get_chat_client, parse_batch_api_output
+
+BATCH_ENDPOINT = "/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Azure admite hasta 100 000 peticiones y 200 MB por archivo; con el SYSTEM_PROMPT completo cada
+# petición ocupa unos 6 KB, así que el límite efectivo es el tamaño
+MAX_REQUESTS_PER_FILE = 25000
+DEFAULT_POLL_INTERVAL = 60.0
+# La Batch API se factura a la mitad del precio de las llamadas en línea
+BATCH_PRICE_FACTOR = 0.5
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def text_key(text: str) -> bytes:
+    """Resumen compacto de un texto para indexar resultados sin guardar los textos en memoria."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def state_path(output: str) -> str:
+    return output.rstrip("/\\") + ".batch.json"
+
+
+def work_dir(output: str) -> str:
+    return output.rstrip("/\\") + ".batch"
+
+
+class BatchJob:
+    """
+    Trabajo de la Batch API de Azure OpenAI con su estado persistido en `<salida>.batch.json`.
+
+    Cada paso (escribir las peticiones, subir el archivo, crear el batch, descargar los
+    resultados) se registra en el estado en cuanto termina, así que un proceso que se reinicia
+    continúa donde quedó: por ejemplo, vuelve a consultar los batches ya creados en lugar de
+    enviarlos otra vez. Los archivos de peticiones y resultados viven en `<salida>.batch/`.
+    """
+
+    def __init__(self, output: str, model_deployment: str, client=None, source: Optional[str] = None):
+        self.output = output
+        self.model_deployment = model_deployment
+        self.client = client
+        # La versión del prompt queda registrada: las peticiones ya enviadas la llevan incorporada
+        self.state: Dict[str, Any] = {"source": source, "deployment": model_deployment,
+                                      "prompt_version": active_prompt().version, "prepared": False, "parts": []}
+
+    @classmethod
+    def load(cls, output: str, client=None) -> Optional["BatchJob"]:
+        """Devuelve el trabajo guardado para `output`, o None si no existe."""
+        try:
+            with open(state_path(output), encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        job = cls(output, state["deployment"], client, state.get("source"))
+        job.state = state
+        return job
+
+    @property
+    def parts(self) -> List[Dict[str, Any]]:
+        return self.state["parts"]
+
+    @property
+    def prepared(self) -> bool:
+        return self.state["prepared"]
+
+    def save(self):
+        path = state_path(self.output)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def prepare(self, items: Iterable[Tuple[str, str]], max_requests: int = MAX_REQUESTS_PER_FILE) -> int:
+        """
+        Escribe una petición por `(custom_id, texto)` en archivos JSONL de hasta `max_requests`
+        líneas; cada `custom_id` debe ser único en el trabajo. Devuelve el número de peticiones.
+        """
+        directory = work_dir(self.output)
+        os.makedirs(directory, exist_ok=True)
+        self.state["parts"] = []
+        handle, total = None, 0
+        try:
+            for custom_id, text in items:
+                if handle is None or self.parts[-1]["requests"] >= max_requests:
+                    if handle:
+                        handle.close()
+                    path = os.path.join(directory, f"requests-{len(self.parts):05d}.jsonl")
+                    self.parts.append({"input": path, "requests": 0, "file_id": None, "batch_id": None,
+                                       "status": None, "results": None})
+                    handle = open(path, "w", encoding="utf-8")
+                line = batch_api_request(custom_id, text, self.model_deployment)
+                handle.write(json.dumps(line, ensure_ascii=False) + "\n")
+                self.parts[-1]["requests"] += 1
+                total += 1
+        finally:
+            if handle:
+                handle.close()
+        self.state["prepared"] = True
+        self.save()
+        return total
+
+    def submit(self):
+        """Sube los archivos pendientes y crea un batch por archivo."""
+        for part in self.parts:
+            if not part["file_id"]:
+                with open(part["input"], "rb") as f:
+                    part["file_id"] = self.client.files.create(file=f, purpose="batch").id
+                self.save()
+            if not part["batch_id"]:
+                batch = self.client.batches.create(input_file_id=part["file_id"], endpoint=BATCH_ENDPOINT,
+                                                   completion_window=COMPLETION_WINDOW)
+                part.update(batch_id=batch.id, status=batch.status)
+                self.save()
+                METRICS.count("batch_api_submitted")
+                print(f"Batch {batch.id} creado con {part['requests']} peticiones")
+
+    def poll(self, interval: float = DEFAULT_POLL_INTERVAL, timeout: Optional[float] = None) -> bool:
+        """
+        Consulta los batches hasta que todos terminen. Devuelve False si se agota `timeout`; el
+        estado queda guardado para continuar después.
+        """
+        start = time.monotonic()
+        while True:
+            done = 0
+            for part in self.parts:
+                if part["status"] in TERMINAL_STATES:
+                    done += 1
+                    continue
+                batch = self.client.batches.retrieve(part["batch_id"])
+                counts = getattr(batch, "request_counts", None)
+                progress = (f" ({counts.completed + counts.failed}/{counts.total})"
+                            if counts is not None and counts.total else "")
+                if batch.status != part["status"]:
+                    print(f"Batch {part['batch_id']}: {batch.status}{progress}")
+                part.update(status=batch.status, output_file_id=getattr(batch, "output_file_id", None),
+                            error_file_id=getattr(batch, "error_file_id", None))
+                self.save()
+                if batch.status in TERMINAL_STATES:
+                    done += 1
+            if done == len(self.parts):
+                return True
+            if timeout is not None and time.monotonic() - start >= timeout:
+                return False
+            time.sleep(interval)
+
+    def download(self):
+        """Descarga la salida y los errores de cada batch terminado a `<salida>.batch/`."""
+        for index, part in enumerate(self.parts):
+            if part["results"] or part["status"] not in TERMINAL_STATES:
+                continue
+            if part["status"] != "completed":
+                # Un batch vencido o cancelado puede tener resultados parciales; el resto queda como error
+                print(f"Warning: el batch {part['batch_id']} terminó como {part['status']}")
+                METRICS.count("batch_api_incomplete")
+            path = os.path.join(work_dir(self.output), f"results-{index:05d}.jsonl")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                for key in ("output_file_id", "error_file_id"):
+                    if part.get(key):
+                        content = self.client.files.content(part[key]).read()
+                        f.write(content if content.endswith(b"\n") or not content else content + b"\n")
+            os.replace(tmp_path, path)
+            part["results"] = path
+            self.save()
+
+    def results(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Entrega `(custom_id, resultado)` de los archivos descargados."""
+        for part in self.parts:
+            if not part["results"]:
+                continue
+            with open(part["results"], encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        yield entry["custom_id"], parse_batch_api_output(entry)
+
+    def results_by_text(self) -> Dict[bytes, Dict[str, Any]]:
+        """
+        Une cada resultado con su petición por `custom_id` y los indexa por el resumen del texto
+        enviado; así se aplican a todos los `tweet_id` con ese texto, también a los repetidos.
+        """
+        results = dict(self.results())
+        by_text: Dict[bytes, Dict[str, Any]] = {}
+        for part in self.parts:
+            with open(part["input"], encoding="utf-8") as f:
+                for line in f:
+                    request = json.loads(line)
+                    result = results.pop(request["custom_id"], None)
+                    if result is not None:
+                        by_text[text_key(request["body"]["messages"][-1]["content"])] = result
+        return by_text
+
+    def cancel(self):
+        for part in self.parts:
+            if part["batch_id"] and part["status"] not in TERMINAL_STATES:
+                batch = self.client.batches.cancel(part["batch_id"])
+                part["status"] = batch.status
+                self.save()
+
+    def cleanup(self):
+        """Elimina el estado y los archivos locales una vez exportados los resultados."""
+        shutil.rmtree(work_dir(self.output), ignore_errors=True)
+        if os.path.exists(state_path(self.output)):
+            os.remove(state_path(self.output))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estado de los trabajos de la Batch API lanzados con chat_app --batch-api")
+    parser.add_argument("command", choices=["status", "cancel"])
+    parser.add_argument("output", help="Archivo de salida usado en chat_app (el estado está en <salida>.batch.json)")
+    args = parser.parse_args()
+
+    job = BatchJob.load(args.output, get_chat_client())
+    if job is None:
+        parser.error(f"No hay un trabajo de la Batch API para {args.output}")
+    if args.command == "cancel":
+        job.cancel()
+    else:
+        job.poll(timeout=0)
+    for part in job.parts:
+        print(f"{part['batch_id'] or '(sin enviar)'}: {part['status'] or 'pendiente'}, {part['requests']} peticiones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_PATH = ".sentiment_cache.db"
+DEFAULT_MAX_ENTRIES = 1_000_000
+DEFAULT_MAX_AGE_DAYS = 30
+
+# Etiquetas y motivos de fallo que no se guardan: el siguiente intento puede tener éxito. Los
+# rechazos del filtro de contenido sí se guardan, porque se repiten con el mismo texto y deployment
+UNCACHEABLE_LABELS = {"error"}
+UNCACHEABLE_FAILURES = {"error", "invalid_response", "agent_error", "batch_api_missing"}
+
+
+def cache_key(text: str, prompt_version: str, model: str) -> str:
+    """Clave de contenido: hash del texto limpio, la versión del prompt y el deployment."""
+    digest = hashlib.sha256()
+    for part in (prompt_version, model or "", text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Caché persistente en SQLite de puntajes de sentimiento.
+
+    Las entradas más antiguas que `max_age_days` se descartan y, si se supera
+    `max_entries`, se eliminan las de acceso menos reciente.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, prompt_version: str = "", model: str = "",
+                 max_entries: int = DEFAULT_MAX_ENTRIES, max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.prompt_version = prompt_version
+        self.model = model
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        # WAL y espera por bloqueo permiten compartir la caché entre procesos (p. ej. shards en paralelo)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results (last_access)")
+        self.conn.commit()
+
+    def _key(self, text: str) -> str:
+        return cache_key(text, self.prompt_version, self.model)
+
+    def get_many(self, texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Devuelve el resultado guardado para cada texto, o None si no está en caché."""
+        keys = [self._key(text) for text in texts]
+        found = {}
+        min_created = time.time() - self.max_age_days * 86400
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, result FROM results WHERE created_at >= ? AND key IN ({placeholders})",
+                [min_created, *chunk]
+            )
+            found.update({key: json.loads(result) for key, result in rows})
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE results SET last_access = ? WHERE key = ?",
+                                  [(now, key) for key in found])
+            self.conn.commit()
+        results = [found.get(key) for key in keys]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: List[str], results: List[Dict[str, Any]]):
+        """Guarda los resultados válidos de los textos indicados."""
+        now = time.time()
+        rows = [(self._key(text), json.dumps(result, ensure_ascii=False), now, now)
+                for text, result in zip(texts, results)
+                if result is not None and result.get("label") not in UNCACHEABLE_LABELS
+                and result.get("failure") not in UNCACHEABLE_FAILURES]
+        self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def evict(self) -> int:
+        """Aplica los límites de antigüedad y tamaño. Devuelve el número de entradas eliminadas."""
+        before = self.conn.total_changes
+        self.conn.execute("DELETE FROM results WHERE created_at < ?",
+                          (time.time() - self.max_age_days * 86400,))
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def close(self):
+        """Aplica la política de expulsión y cierra la conexión."""
+        self.evict()
+        self.conn.close()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        return f"Caché: {self.hits} aciertos, {self.misses} fallos ({ratio:.1%} de aciertos)"
@@ -1,34 +1,380 @@
+import time
+
+_START = time.perf_counter()
+
 import argparse
-from ingestion import load_csv, load_json, load_txt
-from sentiment import get_chat_client, get_sentiment_score, get_agent_client
-from export import export_to_json, export_to_csv
-from utils import clean_text, extract_hashtags, extract_keywords
-from config import MODEL_DEPLOYMENT
+import asyncio
+from collections import Counter
+from functools import partial
+import numpy as np
+from ingestion import iter_records, DEFAULT_CHUNK_SIZE
+from sentiment import (get_chat_client, get_sentiment_score, get_agent_client,
+                       get_sentiment_scores, get_async_chat_client, score_texts_async,
+                       configure_prompt, AGENT_ENDPOINT_NAME, PROMPT_VERSION, PROMPT_VARIANTS)
+from cache import ResultCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_AGE_DAYS
+from export import ResultBlock, open_exporter
+from utils import KeywordMatcher, preprocess_texts
+from lexicon import score_text as score_text_locally
+from dedup import find_near_duplicates
+from aggregation import SentimentAggregator, GRANULARITIES, UNSCORED_LABEL, write_aggregation
+from term_index import TermIndex
+from streaming import TweetStream, DEFAULT_MAX_LATENCY, DEFAULT_BUFFER_SIZE
+from sharding import parse_shard, shard_of
+from scheduling import ScoringBudget, by_engagement, engagement, prioritized_chunks
+from ratelimit import configure_rate_limiter
+from backends import BackendPool, ROUTING
+from batch_api import BatchJob, BATCH_PRICE_FACTOR, DEFAULT_POLL_INTERVAL, text_key
+from deadletter import DeadLetterStore, dead_letter_path
+from agent_sessions import AgentSessionManager, DEFAULT_IDLE_SECONDS
+from metrics import METRICS, DEFAULT_PROMPT_PRICE, DEFAULT_COMPLETION_PRICE
+from config import AZURE_PROJECT_CONNECTION_STRING, MODEL_DEPLOYMENT
+
+_IMPORTS_DONE = time.perf_counter()
 
 KEYWORDS = ["golazo", "falta", "penal", "vinotinto", "mundial2026"]
+KEYWORD_MATCHER = KeywordMatcher(KEYWORDS)
+
+
+def score_texts(texts, client, model_deployment=None, concurrency=1, batch_size=1):
+    """Puntúa los textos de forma secuencial, concurrente y/o por lotes, conservando el orden de entrada."""
+    if batch_size > 1 and not model_deployment:
+        print("Warning: --batch-size solo aplica al modo OpenAI; el agente procesa un comentario por petición")
+    if concurrency > 1:
+        if model_deployment:
+            client = get_async_chat_client()
+        return asyncio.run(score_texts_async(texts, client, model_deployment,
+                                             concurrency=concurrency, batch_size=batch_size))
+    if batch_size > 1 and model_deployment:
+        return get_sentiment_scores(texts, client, model_deployment, batch_size)
+    return [get_sentiment_score(text, client, model_deployment) for text in texts]
+
+
+def count_model_texts(scorer):
+    """Cuenta en METRICS los comentarios que llegan al modelo, base de los tokens por comentario."""
+    def counted(texts):
+        METRICS.count("model_texts", len(texts))
+        return scorer(texts)
+    return counted
+
+
+def score_with_cache(texts, cache, scorer):
+    """Consulta la caché, puntúa una sola vez cada texto distinto que falte y guarda los resultados nuevos."""
+    scores = cache.get_many(texts) if cache else [None] * len(texts)
+    pending = list(dict.fromkeys(text for text, result in zip(texts, scores) if result is None))
+    if not pending:
+        return scores
+    fresh = scorer(pending)
+    if cache:
+        cache.put_many(pending, fresh)
+    by_text = dict(zip(pending, fresh))
+    return [result if result is not None else by_text[text] for text, result in zip(texts, scores)]
+
+
+def score_cascade(raw_texts, texts, cache, scorer, threshold, stats):
+    """
+    Resuelve con el léxico local los comentarios con confianza >= `threshold` y envía el resto
+    al modelo (pasando por la caché).
+    """
+    local = [score_text_locally(text) for text in raw_texts]
+    pending = [i for i, result in enumerate(local) if result["confidence"] < threshold]
+    remote = score_with_cache([texts[i] for i in pending], cache, scorer)
+    scores = list(local)
+    for i, result in zip(pending, remote):
+        scores[i] = result
+    stats["local"] += len(texts) - len(pending)
+    stats["llm"] += len(pending)
+    return scores
+
+
+def score_chunk(raw_texts, texts, cache, scorer, cascade_threshold=None, stats=None):
+    """Puntúa un bloque con la cascada local si está activada o directamente con la caché y el modelo."""
+    if cascade_threshold is not None:
+        return score_cascade(raw_texts, texts, cache, scorer, cascade_threshold, stats)
+    return score_with_cache(texts, cache, scorer)
+
+
+def process_chunk(df, scorer, cache, cascade_threshold=None, stats=None, dedup_threshold=None, priority=False,
+                  failures=None):
+    """
+    Limpia y puntúa un bloque de comentarios y devuelve sus resultados como un ResultBlock, que
+    referencia el bloque de entrada en lugar de copiar cada fila. Los comentarios que el
+    presupuesto no alcanza a puntuar se exportan con `score` nulo y etiqueta `unscored`. Si se
+    pasa la lista `failures`, se le añade `(tweet_id, texto, resultado)` de cada comentario fallido.
+    """
+    stats = stats if stats is not None else Counter()
+    if priority:
+        # Con presupuesto limitado, los comentarios con más interacción se envían primero
+        df = by_engagement(df)
+    with METRICS.stage("preprocessing"):
+        prep = preprocess_texts(df["text"], KEYWORD_MATCHER)
+        raw_texts = df["text"].tolist()
+        texts = prep["clean_text"].tolist()
+    if dedup_threshold is not None:
+        # Se puntúa un representante por grupo de casi duplicados y su resultado se replica
+        with METRICS.stage("dedup"):
+            reps = find_near_duplicates(raw_texts, dedup_threshold)
+            unique = sorted(set(reps))
+        with METRICS.stage("scoring"):
+            rep_scores = score_chunk([raw_texts[i] for i in unique], [texts[i] for i in unique],
+                                     cache, scorer, cascade_threshold, stats)
+        by_rep = dict(zip(unique, rep_scores))
+        scores = [by_rep[rep] for rep in reps]
+        stats["near_duplicates"] += len(texts) - len(unique)
+    else:
+        with METRICS.stage("scoring"):
+            scores = score_chunk(raw_texts, texts, cache, scorer, cascade_threshold, stats)
+
+    weights = engagement(df)
+    values = np.empty(len(scores), dtype=np.float32)
+    labels = []
+    failed = []
+    for i, (result, weight) in enumerate(zip(scores, weights)):
+        stats["weight_total"] += weight
+        if result is None:
+            METRICS.count("unscored")
+            result = {"score": None, "label": UNSCORED_LABEL}
+        else:
+            stats["weight_scored"] += weight
+            if result.get("failure"):
+                failed.append(i)
+        score = result.get("score", 0)
+        values[i] = np.nan if score is None else score
+        labels.append(result.get("label", "neutral"))
+    if failures is not None and failed:
+        tweet_ids = df["tweet_id"].tolist()
+        failures.extend((str(tweet_ids[i]), raw_texts[i], scores[i]) for i in failed)
+    return ResultBlock(df, values, labels, prep["hashtags"], prep["keywords"])
+
+
+def select_rows(df, shard=None, resumed_ids=None):
+    """Filtra un bloque por shard y omite los tweet_id exportados en la ejecución que se reanuda."""
+    if shard:
+        df = df[shard_of(df["tweet_id"], shard[1]) == shard[0]]
+    if resumed_ids:
+        df = df[~df["tweet_id"].astype(str).isin(resumed_ids)]
+    return df
+
+
+def collect_batch_requests(args, cache, resumed_ids):
+    """
+    Primera pasada del modo Batch API: recorre la entrada con process_chunk y un scorer que, en
+    lugar de llamar al modelo, entrega `(custom_id, texto)` de cada texto que requiere el modelo.
+    Así la caché, la cascada y los casi duplicados deciden qué se envía igual que en línea.
+
+    El `custom_id` es el resumen del texto (text_key), único por petición aunque un `tweet_id` se
+    repita con textos distintos; la segunda pasada une los resultados a los comentarios por texto.
+    """
+    queued = set()
+    for df in iter_records(args.input, args.chunk_size):
+        df = select_rows(df, args.shard, resumed_ids)
+        requests = []
+
+        def collect(texts):
+            cached = cache.get_many(texts) if cache else [None] * len(texts)
+            for text, hit in zip(texts, cached):
+                key = text_key(text)
+                if hit is None and key not in queued:
+                    queued.add(key)
+                    requests.append((key.hex(), text))
+            # Resultado provisional: esta pasada no exporta nada
+            return [{"score": 0, "label": "neutral"}] * len(texts)
+
+        process_chunk(df, collect, None, args.cascade_threshold, Counter(), args.dedup_threshold)
+        yield from requests
+
+
+def run_batch_api(args, chat_client, cache, resumed_ids):
+    """
+    Prepara, envía y espera el trabajo de la Batch API. Devuelve el scorer de la segunda pasada,
+    que entrega los resultados descargados, o None si se interrumpe la espera (el estado queda
+    guardado y la misma orden continúa donde quedó).
+    """
+    job = BatchJob.load(args.output, chat_client)
+    if job and job.state.get("source") != args.input:
+        raise SystemExit(f"Ya existe un trabajo de la Batch API para {args.output} con otra entrada "
+                         f"({job.state.get('source')}); elimina {args.output}.batch.json para empezar de nuevo")
+    if job and job.state.get("prompt_version", PROMPT_VERSION) != PROMPT_VARIANTS[args.prompt].version:
+        raise SystemExit(f"El trabajo de la Batch API para {args.output} usa el prompt "
+                         f"{job.state.get('prompt_version', PROMPT_VERSION)}; ejecuta con el mismo --prompt "
+                         f"o elimina {args.output}.batch.json para empezar de nuevo")
+    if job and job.prepared:
+        print(f"Reanudando el trabajo de la Batch API ({len(job.parts)} archivos)")
+    else:
+        job = BatchJob(args.output, MODEL_DEPLOYMENT, chat_client, source=args.input)
+        with METRICS.stage("batch_prepare"):
+            total = job.prepare(collect_batch_requests(args, cache, resumed_ids))
+        if cache:
+            # Las consultas de la primera pasada no cuentan en las estadísticas de la caché
+            cache.hits = cache.misses = 0
+        print(f"Batch API: {total} peticiones preparadas en {len(job.parts)} archivos")
+    job.submit()
+    try:
+        with METRICS.stage("batch_wait"):
+            job.poll(args.poll_interval)
+    except KeyboardInterrupt:
+        print(f"Espera interrumpida; los batches siguen en curso. Ejecuta la misma orden para continuar "
+              f"o consulta el estado con: python src/batch_api.py status {args.output}")
+        return None, job
+    job.download()
+    by_text = job.results_by_text()
+    # Cada petición es un texto distinto de toda la entrada: la base de los tokens por comentario
+    METRICS.count("model_texts", sum(part["requests"] for part in job.parts))
+
+    def scorer(texts):
+        results = []
+        for text in texts:
+            result = by_text.get(text_key(text))
+            if result is None:
+                METRICS.count("batch_api_missing")
+                result = {"score": 0, "label": "error", "hashtags": [], "keywords": [], "failure": "batch_api_missing"}
+            results.append(result)
+        return results
+
+    return scorer, job
+
+
+def write_metrics(json_path, prometheus_path=None):
+    """Vuelca las métricas acumuladas; se llama tras cada bloque para poder leerlas a mitad de ejecución."""
+    METRICS.write_json(json_path)
+    if prometheus_path:
+        METRICS.write_prometheus(prometheus_path)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Agente de análisis de sentimiento para la Vinotinto")
-    parser.add_argument("--input", required=True, help="Archivo de entrada (CSV, JSON o TXT)")
-    parser.add_argument("--output", required=True, help="Archivo de salida (JSON o CSV)")
+    parser.add_argument("--input", required=True,
+                        help="Archivo de entrada (CSV, JSON, JSONL o TXT), o '-' para leer JSONL continuo por stdin")
+    parser.add_argument("--output", required=True,
+                        help="Archivo de salida (JSON, JSONL o CSV) o directorio .parquet/.arrow para salida columnar")
+    parser.add_argument("--partition-by-day", action="store_true",
+                        help="Con salida Parquet/Arrow, particionar por día del partido (fecha UTC de created_at)")
     parser.add_argument("--force-openai", action="store_true", help="Forzar uso de OpenAI en lugar del agente")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Número máximo de peticiones simultáneas (1 = modo secuencial)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Comentarios por petición en modo OpenAI o por run del agente de AI Foundry "
+                             "(1 = un comentario por petición)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Archivo SQLite de caché de resultados")
+    parser.add_argument("--no-cache", action="store_true", help="No consultar ni guardar la caché de resultados")
+    parser.add_argument("--cache-max-entries", type=int, default=DEFAULT_MAX_ENTRIES,
+                        help="Número máximo de entradas en caché")
+    parser.add_argument("--cache-max-age", type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help="Antigüedad máxima de las entradas en caché (días)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Comentarios leídos y procesados por bloque")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reanudar una ejecución interrumpida omitiendo los tweet_id ya exportados")
+    parser.add_argument("--cascade-threshold", type=float, default=None,
+                        help="Resolver con el léxico local los comentarios con confianza >= umbral (0-1) "
+                             "y enviar solo el resto al modelo")
+    parser.add_argument("--dedup-threshold", type=float, default=None,
+                        help="Similitud (0-1) a partir de la cual los comentarios de un mismo bloque se "
+                             "consideran casi duplicados y comparten el resultado de su representante")
+    parser.add_argument("--dead-letter",
+                        help="Archivo SQLite con los comentarios fallidos (filtro de contenido, errores, respuestas "
+                             "inválidas); por defecto <salida>.deadletter.db. Se reprocesan con: "
+                             "python src/deadletter.py reprocess <salida>")
+    parser.add_argument("--metrics", help="Archivo JSON de métricas, actualizado tras cada bloque "
+                                          "(por defecto <salida>.metrics.json)")
+    parser.add_argument("--prometheus", help="Archivo opcional de métricas en formato de texto de Prometheus")
+    parser.add_argument("--prompt", choices=list(PROMPT_VARIANTS), default="full",
+                        help="Variante del prompt: full (SYSTEM_PROMPT) o compact (prompt reducido con structured "
+                             "outputs que devuelve solo score y label, y tope de respuesta ajustado)")
+    parser.add_argument("--prompt-price", type=float, default=DEFAULT_PROMPT_PRICE,
+                        help="Precio (USD) por 1000 tokens de prompt para estimar el costo")
+    parser.add_argument("--completion-price", type=float, default=DEFAULT_COMPLETION_PRICE,
+                        help="Precio (USD) por 1000 tokens de respuesta para estimar el costo")
+    parser.add_argument("--aggregate", help="Archivo JSON con la agregación por ventanas de tiempo de los resultados")
+    parser.add_argument("--granularity", choices=list(GRANULARITIES), default="minute",
+                        help="Granularidad de las ventanas de agregación")
+    parser.add_argument("--window", type=int, default=1,
+                        help="Tamaño de la ventana deslizante de agregación en buckets (1 = ventanas fijas)")
+    parser.add_argument("--term-index", help="Archivo .npz del índice de hashtags y palabras clave; "
+                                             "se actualiza de forma incremental si ya existe")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="Puntuar con la Batch API de Azure OpenAI (procesamiento diferido, mitad de costo); "
+                             "la misma orden reanuda la espera si el proceso se reinicia")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Segundos entre consultas del estado de los batches")
+    parser.add_argument("--backends",
+                        help="Archivo JSON con un pool de deployments (y/o el agente) entre los que repartir "
+                             "las peticiones; ver src/backends.py")
+    parser.add_argument("--routing", choices=list(ROUTING),
+                        help="Con --backends: menor latencia (por defecto) o reparto por pesos")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Con --backends: repetir en otro backend las peticiones que superen el p95 de latencia")
+    parser.add_argument("--agent-idle-timeout", type=float, default=DEFAULT_IDLE_SECONDS,
+                        help="Agente de AI Foundry: segundos sin uso tras los que se elimina un hilo reutilizable")
+    parser.add_argument("--rpm", type=float, help="Cuota de peticiones por minuto del deployment (limitador local)")
+    parser.add_argument("--tpm", type=float, help="Cuota de tokens por minuto del deployment (limitador local)")
+    parser.add_argument("--rate-limit-state",
+                        help="Archivo de estado del limitador para compartir la cuota entre procesos (p. ej. shards)")
+    parser.add_argument("--priority", action="store_true",
+                        help="Puntuar primero los comentarios con más interacción (retweets y \"me gusta\"): "
+                             "pasadas por tramos del archivo o cola de prioridad en modo continuo")
+    parser.add_argument("--token-budget", type=int,
+                        help="Tokens máximos (prompt + respuesta) a consumir; el resto se exporta como unscored")
+    parser.add_argument("--max-calls", type=int,
+                        help="Llamadas máximas al modelo; el resto se exporta como unscored")
+    parser.add_argument("--shard", type=parse_shard,
+                        help="Procesar solo el shard i/N de la entrada (por hash de tweet_id); ver src/sharding.py")
+    parser.add_argument("--follow", action="store_true",
+                        help="Seguir el archivo de entrada (CSV o JSONL) y procesar los comentarios a medida que llegan")
+    parser.add_argument("--max-latency", type=float, default=DEFAULT_MAX_LATENCY,
+                        help="Modo continuo: latencia objetivo en segundos entre la llegada y la escritura del resultado")
+    parser.add_argument("--stream-buffer", type=int, default=DEFAULT_BUFFER_SIZE,
+                        help="Modo continuo: comentarios pendientes como máximo antes de dejar de leer la entrada")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="Modo continuo: terminar tras estos segundos sin comentarios nuevos")
     args = parser.parse_args()
+    if args.batch_api and (args.follow or args.input == "-"):
+        parser.error("--batch-api no admite el modo continuo")
+    if args.backends and args.batch_api:
+        parser.error("--batch-api no admite --backends")
+    if args.batch_api and (args.priority or args.token_budget is not None or args.max_calls is not None):
+        parser.error("--batch-api no admite --priority, --token-budget ni --max-calls")
 
-    # Ingesta de datos
-    if args.input.endswith(".csv"):
-        df = load_csv(args.input)
-    elif args.input.endswith(".json"):
-        df = load_json(args.input)
-    elif args.input.endswith(".txt"):
-        df = load_txt(args.input)
+    # Ingesta de datos por bloques
+    client_start = time.perf_counter()
+    stream = None
+    if args.follow or args.input == "-":
+        # En modo continuo --chunk-size es el tamaño máximo de cada micro-lote
+        stream = TweetStream(args.input, follow=args.follow, max_batch=args.chunk_size,
+                             max_latency=args.max_latency, buffer_size=args.stream_buffer,
+                             idle_timeout=args.idle_timeout, priority=args.priority)
+        chunks = stream
+    elif args.priority:
+        chunks = prioritized_chunks(args.input, args.chunk_size)
     else:
-        raise ValueError("Formato de archivo no soportado")
+        chunks = iter_records(args.input, args.chunk_size)
+    try:
+        exporter = open_exporter(args.output, resume=args.resume, partition_by_day=args.partition_by_day)
+    except ValueError as e:
+        parser.error(str(e))
+    if exporter.resumed_ids:
+        print(f"Reanudando: {len(exporter.resumed_ids)} comentarios ya exportados")
 
+    pool = None
+    agent_sessions = None
+    if args.backends:
+        # Pool de deployments (y opcionalmente el agente) con enrutamiento, expulsión y hedging
+        pool = BackendPool.from_config(args.backends, args.routing, args.hedge or None)
+        use_agent = False
+        print(f"Pool de backends: {', '.join(b.name for b in pool.backends)} (enrutamiento {pool.routing}"
+              f"{', hedging p' + format(pool.hedge_percentile, 'g') if pool.hedge else ''})")
+        if args.batch_size > 1:
+            print("Warning: --batch-size no aplica con --backends; el pool envía un comentario por petición")
     # Selección automática: si existe PROJECT_CONNECTION usa el agente, si no usa OpenAI directo
-    if not args.force_openai:
+    elif not args.force_openai and not args.batch_api:
         try:
-            agent_client = get_agent_client()
+            if AZURE_PROJECT_CONNECTION_STRING:
+                # Agente de AI Foundry ya creado (id en Sentimental.agent.yaml) con hilos reutilizables
+                agent_sessions = AgentSessionManager.connect(texts_per_run=args.batch_size,
+                                                             idle_seconds=args.agent_idle_timeout)
+                print(f"Agente {agent_sessions.agent_id}: hilos reutilizables, "
+                      f"{agent_sessions.texts_per_run} comentarios por run")
+            else:
+                agent_client = get_agent_client()
             use_agent = True
         except Exception as e:
             print(f"Warning: No se pudo inicializar el agente ({str(e)}), usando OpenAI")
@@ -38,38 +384,173 @@ def main():
         chat_client = get_chat_client()
         use_agent = False
 
-    resultados = []
+    prompt = configure_prompt(args.prompt)
+    METRICS.set_info(prompt_version=prompt.version)
+    if use_agent and args.prompt != "full":
+        print("Warning: --prompt solo aplica al modo OpenAI; el agente usa su propio prompt")
+    if pool:
+        model_key = pool.model_key
+        scorer = partial(pool.score_texts, concurrency=args.concurrency)
+    elif agent_sessions:
+        model_key = agent_sessions.model_key
+        scorer = partial(agent_sessions.score_texts, concurrency=args.concurrency)
+    elif use_agent:
+        model_key = f"agent:{AGENT_ENDPOINT_NAME}"
+        scorer = partial(score_texts, client=agent_client, concurrency=args.concurrency,
+                         batch_size=args.batch_size)
+    else:
+        model_key = MODEL_DEPLOYMENT
+        scorer = partial(score_texts, client=chat_client, model_deployment=MODEL_DEPLOYMENT,
+                         concurrency=args.concurrency, batch_size=args.batch_size)
 
-    for _, row in df.iterrows():
-        text = clean_text(row["text"])
-        hashtags = extract_hashtags(text)
-        keywords = extract_keywords(text, KEYWORDS)
-        if use_agent:
-            result = get_sentiment_score(text, agent_client)
-        else:
-            result = get_sentiment_score(text, chat_client, MODEL_DEPLOYMENT)
-        salida = {
-            "tweet_id": row.get("tweet_id", ""),
-            "username": row.get("username", ""),
-            "text": row["text"],
-            "created_at": row.get("created_at", ""),
-            "score": result.get("score", 0),
-            "label": result.get("label", "neutral"),
-            "hashtags": hashtags,
-            "keywords": keywords,
-            "retweets": row.get("retweets", 0),
-            "likes": row.get("likes", 0)
-        }
-        resultados.append(salida)
-
-    if args.output.endswith(".json"):
-        export_to_json(resultados, args.output)
-    elif args.output.endswith(".csv"):
-        export_to_csv(resultados, args.output)
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache, prompt.version, model_key,
+                            max_entries=args.cache_max_entries, max_age_days=args.cache_max_age)
+    ready = time.perf_counter()
+    print(f"Arranque: importaciones {_IMPORTS_DONE - _START:.2f} s, "
+          f"inicialización {ready - client_start:.2f} s, total {ready - _START:.2f} s")
+
+    if args.batch_api:
+        METRICS.set_prices(args.prompt_price * BATCH_PRICE_FACTOR, args.completion_price * BATCH_PRICE_FACTOR)
     else:
-        raise ValueError("Formato de salida no soportado")
+        METRICS.set_prices(args.prompt_price, args.completion_price)
+    configure_rate_limiter(args.rpm, args.tpm, args.rate_limit_state)
+    if pool:
+        pool.configure_rate_limits(args.rpm, args.tpm, args.rate_limit_state)
+    scorer = count_model_texts(scorer)
+    budget = None
+    if args.token_budget is not None or args.max_calls is not None:
+        budget = ScoringBudget(args.token_budget, args.max_calls)
+        texts_per_call = 1 if pool or (use_agent and not agent_sessions) else args.batch_size
+        scorer = budget.wrap(scorer, texts_per_call=texts_per_call, concurrency=args.concurrency)
+    metrics_path = args.metrics or f"{args.output}.metrics.json"
+
+    batch_job = None
+    if args.batch_api:
+        scorer, batch_job = run_batch_api(args, chat_client, cache, exporter.resumed_ids)
+        if scorer is None:
+            write_metrics(metrics_path, args.prometheus)
+            if cache:
+                cache.close()
+            return
+
+    aggregator = SentimentAggregator(args.granularity, args.window) if args.aggregate else None
+    if aggregator and exporter.resumed_ids:
+        print("Warning: la agregación en línea solo incluye los comentarios de esta ejecución; "
+              f"para el archivo completo ejecuta: python src/aggregation.py {args.output} --output {args.aggregate}")
+
+    term_index = TermIndex.open(args.term_index) if args.term_index else None
+
+    dead_letter = DeadLetterStore(args.dead_letter or dead_letter_path(args.output))
+    if not args.resume:
+        # La cola describe la exportación, que esta ejecución reemplaza
+        dead_letter.clear()
+    failures = []
+
+    stats = Counter()
+    chunks = iter(chunks)
+    try:
+        while True:
+            with METRICS.stage("ingestion"):
+                df = next(chunks, None)
+            if df is None:
+                break
+            df = select_rows(df, args.shard, exporter.resumed_ids)
+            resultados = process_chunk(df, scorer, cache, args.cascade_threshold, stats, args.dedup_threshold,
+                                       args.priority, failures)
+            with METRICS.stage("export"):
+                exporter.write(resultados)
+            # Después de escribir: la cola solo registra comentarios que ya están en la exportación
+            METRICS.count("dead_lettered", dead_letter.record(failures, model_key, prompt.version))
+            failures.clear()
+            if stream:
+                stream.batch_done()
+            METRICS.count("tweets", len(resultados))
+            if aggregator:
+                with METRICS.stage("aggregation"):
+                    aggregator.update_frame(resultados.to_frame())
+            if term_index:
+                with METRICS.stage("term_index"):
+                    term_index.update_frame(resultados.to_frame())
+            write_metrics(metrics_path, args.prometheus)
+    except KeyboardInterrupt:
+        if not stream:
+            # Sin finalizar, el checkpoint conserva los bloques escritos para continuar con --resume
+            write_metrics(metrics_path, args.prometheus)
+            dead_letter.close()
+            if agent_sessions:
+                agent_sessions.close()
+            if cache:
+                cache.close()
+            print(f"Interrumpido; para continuar ejecuta de nuevo con --resume ({args.output})")
+            return
+        # En modo continuo Ctrl+C es la forma normal de terminar
+        stream.close()
+    with METRICS.stage("export"):
+        exporter.finalize()
+    if agent_sessions:
+        # Los hilos libres se eliminan al terminar; los que quedaran sin uso ya se limpiaron por inactividad
+        agent_sessions.close()
+    if batch_job:
+        # Los resultados ya están en la salida (y en la caché); el estado local ya no hace falta
+        batch_job.cleanup()
+    if aggregator:
+        write_aggregation(aggregator.series(), args.aggregate)
+        print(f"Agregación por ventanas guardada en {args.aggregate}")
+    if term_index:
+        term_index.save(args.term_index)
+        print(f"Índice de términos guardado en {args.term_index} ({len(term_index.terms)} términos)")
+    write_metrics(metrics_path, args.prometheus)
 
     print(f"Exportación completada: {args.output}")
+    summary = METRICS.summary()
+    print(f"Métricas: {summary['tokens']['prompt']} tokens de prompt, {summary['tokens']['completion']} de respuesta, "
+          f"costo estimado {summary['estimated_cost_usd']:.4f} USD ({metrics_path})")
+    if "tokens_per_text" in summary:
+        per_text = summary["tokens_per_text"]
+        print(f"Prompt {prompt.version}: {per_text['prompt']:.1f} tokens de prompt y {per_text['completion']:.1f} "
+              f"de respuesta por comentario enviado al modelo ({summary['events']['model_texts']} comentarios)")
+    if summary["events"].get("completion_truncated"):
+        print(f"Warning: {summary['events']['completion_truncated']} respuestas llegaron al tope de tokens "
+              "y se descartaron")
+    if stream:
+        latency = summary.get("latencies", {}).get("end_to_end", {})
+        print(f"Modo continuo: latencia p95 {latency.get('p95_ms', 0):.0f} ms (objetivo {args.max_latency * 1000:.0f} ms), "
+              f"{summary['events'].get('latency_target_missed', 0)} fuera de objetivo, "
+              f"{summary['events'].get('stream_backpressure', 0)} esperas por contrapresión")
+    if args.cascade_threshold is not None:
+        total = stats["local"] + stats["llm"]
+        local_ratio = stats["local"] / total if total else 0.0
+        print(f"Cascada: {stats['local']} resueltos localmente, {stats['llm']} enviados al modelo "
+              f"({local_ratio:.1%} local, umbral {args.cascade_threshold})")
+    if budget or args.priority:
+        coverage = stats["weight_scored"] / stats["weight_total"] if stats["weight_total"] else 0.0
+        print(f"Presupuesto: {summary['events'].get('unscored', 0)} comentarios sin puntuar, "
+              f"cobertura ponderada por interacción {coverage:.1%}")
+    if args.dedup_threshold is not None:
+        print(f"Casi duplicados: {stats['near_duplicates']} comentarios reutilizaron el resultado de su representante")
+    pending = {reason: count["pending"] for reason, count in dead_letter.counts().items() if count["pending"]}
+    dead_letter.close()
+    if pending:
+        reasons = ", ".join(f"{count} {reason}" for reason, count in sorted(pending.items()))
+        print(f"Fallidos: {sum(pending.values())} comentarios en {dead_letter.path} ({reasons}); "
+              f"para reprocesarlos: python src/deadletter.py reprocess {args.output}")
+    if agent_sessions:
+        print(f"Agente: {summary['events'].get('agent_threads_created', 0)} hilos creados y "
+              f"{summary['events'].get('agent_threads_deleted', 0)} eliminados para "
+              f"{summary['calls'].get('agent', {}).get('count', 0)} runs")
+    if pool:
+        for backend in pool.summary():
+            print(f"Backend {backend['name']}: {backend['requests']} peticiones, {backend['failures']} fallos, "
+                  f"p50 {backend['p50_ms'] or 0:.0f} ms, p95 {backend['p95_ms'] or 0:.0f} ms"
+                  f"{' (expulsado)' if backend['ejected'] else ''}")
+        print(f"Hedging: {summary['events'].get('hedged', 0)} peticiones duplicadas, "
+              f"{summary['events'].get('hedge_wins', 0)} ganadas por el segundo backend; "
+              f"{summary['events'].get('backend_failovers', 0)} reintentos en otro backend")
+    if cache:
+        print(cache.stats())
+        cache.close()
 
 
 if __name__ == "__main__":
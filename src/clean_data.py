@@ -1,41 +1,175 @@
+import numpy as np
 import pandas as pd
 import argparse
+import json
 import os
+import sqlite3
+import tempfile
+import time
 
-def clean_tweet_data(input_file, output_file):
+# Rows per chunk in the out-of-core mode
+DEFAULT_CHUNK_SIZE = 100000
+# SQLite page cache for the on-disk set of seen ids (negative = KiB); bounds the memory used
+SEEN_CACHE_KIB = 65536
+
+
+class SeenIds:
+    """
+    On-disk set of tweet_ids backed by a temporary SQLite table, so memory stays bounded by the
+    page cache no matter how many distinct ids the capture has.
+    """
+
+    def __init__(self, temp_dir=None):
+        handle, self.path = tempfile.mkstemp(suffix=".seen.db", dir=temp_dir)
+        os.close(handle)
+        self.conn = sqlite3.connect(self.path)
+        # Scratch data: no journal and no fsync
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(f"PRAGMA cache_size=-{SEEN_CACHE_KIB}")
+        self.conn.execute("CREATE TABLE seen (id TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE chunk (id TEXT)")
+
+    def add_new(self, ids):
+        """
+        Returns a mask that is True for the first occurrence of each id not seen in earlier calls
+        (keep='first' semantics) and records those ids.
+        """
+        first = {}
+        for position, tweet_id in enumerate(ids):
+            first.setdefault(tweet_id, position)
+        # The chunk's distinct ids go to a scratch table and are joined against the set in SQLite
+        self.conn.execute("DELETE FROM chunk")
+        self.conn.executemany("INSERT INTO chunk VALUES (?)", ((tweet_id,) for tweet_id in first))
+        for (tweet_id,) in self.conn.execute("SELECT id FROM chunk JOIN seen USING (id)"):
+            del first[tweet_id]
+        self.conn.execute("INSERT OR IGNORE INTO seen SELECT id FROM chunk")
+        self.conn.commit()
+        mask = np.zeros(len(ids), dtype=bool)
+        mask[list(first.values())] = True
+        return mask
+
+    def close(self):
+        self.conn.close()
+        os.remove(self.path)
+
+
+def _dedupe_csv(input_file, output_file, seen, chunk_size):
+    rows = kept = 0
+    # Every column as text: values are written back exactly as read (no int -> float for ids with gaps)
+    chunks = pd.read_csv(input_file, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    with open(output_file, "w", encoding="utf-8", newline="") as out:
+        for i, chunk in enumerate(chunks):
+            if "tweet_id" not in chunk.columns:
+                raise ValueError("Missing required column: tweet_id")
+            mask = seen.add_new(chunk["tweet_id"].tolist())
+            chunk[mask].to_csv(out, index=False, header=(i == 0))
+            rows += len(chunk)
+            kept += int(mask.sum())
+    return rows, kept, 0
+
+
+def _dedupe_jsonl(input_file, output_file, seen, chunk_size):
+    rows = kept = invalid = 0
+    with open(input_file, encoding="utf-8") as f, open(output_file, "w", encoding="utf-8") as out:
+        while True:
+            lines = [line for line in (f.readline() for _ in range(chunk_size)) if line]
+            if not lines:
+                break
+            records, ids = [], []
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    tweet_id = json.loads(line).get("tweet_id")
+                except (ValueError, AttributeError):
+                    invalid += 1
+                    continue
+                # Original lines are written unchanged; a missing id counts as one more id, like pandas' NaN
+                records.append(line if line.endswith("\n") else line + "\n")
+                ids.append("" if tweet_id is None else str(tweet_id))
+            mask = seen.add_new(ids)
+            out.writelines(line for line, keep in zip(records, mask) if keep)
+            rows += len(records)
+            kept += int(mask.sum())
+    return rows, kept, invalid
+
+
+def dedupe_out_of_core(input_file, output_file, chunk_size=DEFAULT_CHUNK_SIZE, temp_dir=None):
+    """
+    Streams a CSV or JSONL capture to `output_file` in chunks, dropping rows whose tweet_id
+    already appeared (keep='first'). Memory is bounded by the chunk size and the SQLite page
+    cache of the on-disk id set. Returns (rows read, rows kept, invalid lines).
+    """
+    if input_file.endswith((".jsonl", ".ndjson")):
+        dedupe = _dedupe_jsonl
+    elif input_file.endswith(".csv"):
+        dedupe = _dedupe_csv
+    else:
+        raise ValueError("Out-of-core mode supports CSV and JSONL (.jsonl/.ndjson) input")
+    if os.path.splitext(output_file)[1] != os.path.splitext(input_file)[1]:
+        raise ValueError("The output file must have the same format (extension) as the input file")
+    seen = SeenIds(temp_dir)
+    try:
+        return dedupe(input_file, output_file, seen, chunk_size)
+    finally:
+        seen.close()
+
+
+def clean_tweet_data(input_file, output_file, chunk_size=None, temp_dir=None):
     """
     Reads a CSV file, removes duplicate rows based on tweet_id,
     and saves the cleaned data to a new file.
+
+    With `chunk_size` (always for JSONL input) the file is streamed with bounded memory
+    instead of being loaded whole; see dedupe_out_of_core.
     """
     try:
         if not os.path.exists(input_file):
             print(f"Error: File not found at {input_file}")
             return
 
-        print(f"Reading data from {input_file}...")
-        df = pd.read_csv(input_file)
+        start = time.perf_counter()
+        if chunk_size or input_file.endswith((".jsonl", ".ndjson")):
+            print(f"Streaming data from {input_file} in chunks of {chunk_size or DEFAULT_CHUNK_SIZE} rows...")
+            initial_rows, cleaned_rows, invalid = dedupe_out_of_core(
+                input_file, output_file, chunk_size or DEFAULT_CHUNK_SIZE, temp_dir)
+            print(f"Initial number of tweets: {initial_rows}")
+            if invalid:
+                print(f"Invalid JSON lines skipped: {invalid}")
+        else:
+            print(f"Reading data from {input_file}...")
+            df = pd.read_csv(input_file)
+
+            initial_rows = len(df)
+            print(f"Initial number of tweets: {initial_rows}")
+
+            # Drop duplicates based on the 'tweet_id' column
+            df.drop_duplicates(subset=['tweet_id'], inplace=True, keep='first')
 
-        initial_rows = len(df)
-        print(f"Initial number of tweets: {initial_rows}")
+            cleaned_rows = len(df)
 
-        # Drop duplicates based on the 'tweet_id' column
-        df.drop_duplicates(subset=['tweet_id'], inplace=True, keep='first')
+            # Save the cleaned data to the output file
+            df.to_csv(output_file, index=False)
 
-        cleaned_rows = len(df)
+        elapsed = time.perf_counter() - start
         print(f"Number of tweets after cleaning: {cleaned_rows}")
         print(f"Number of duplicate tweets removed: {initial_rows - cleaned_rows}")
-
-        # Save the cleaned data to the output file
-        df.to_csv(output_file, index=False)
         print(f"Cleaned data saved to {output_file}")
+        print(f"Throughput: {initial_rows / elapsed if elapsed else 0:,.0f} rows/sec ({elapsed:.2f} s)")
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Clean tweet data by removing duplicates.')
-    parser.add_argument('input_file', help='The path to the input CSV file.')
-    parser.add_argument('output_file', help='The path to the output CSV file.')
+    parser.add_argument('input_file', help='The path to the input CSV or JSONL file.')
+    parser.add_argument('output_file', help='The path to the output file (same format as the input).')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Stream the input in chunks of this many rows with bounded memory '
+                             f'(always on for JSONL; default chunk {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--temp-dir', default=None,
+                        help='Directory for the temporary on-disk id set (default: system temp dir)')
     args = parser.parse_args()
-    
-    clean_tweet_data(args.input_file, args.output_file) 
\ No newline at end of file
+
+    clean_tweet_data(args.input_file, args.output_file, args.chunk_size, args.temp_dir)
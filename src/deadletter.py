@@ -0,0 +1,289 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cache import ResultCache, DEFAULT_CACHE_PATH
+from metrics import METRICS, DEFAULT_PROMPT_PRICE, DEFAULT_COMPLETION_PRICE
+
+# Motivos con los que sentiment._fallback_result marca un comentario fallido
+FAILURE_REASONS = ("content_filter", "error", "invalid_response", "agent_error", "batch_api_missing")
+LOCAL_MODEL = "local:lexicon"
+
+# Expresiones habituales de la hinchada que el filtro de contenido confunde con violencia o
+# autolesiones; se sustituyen por equivalentes que conservan la polaridad
+SANITIZE_PATTERNS = [
+    (re.compile(r"\bme quiero (?:matar|morir)\b"), "qué desesperación"),
+    (re.compile(r"\b(?:hay que |lo voy a |los voy a )?(?:matar|m[aá]ten)(?:lo|la|los|las)?\b"), "hay que sacarlo"),
+    (re.compile(r"\b(?:muerte|muerto|muertos)\b"), "derrota"),
+]
+MENTION_PATTERN = re.compile(r"@\w+")
+
+
+def dead_letter_path(output: str) -> str:
+    return output.rstrip("/\\") + ".deadletter.db"
+
+
+def sanitize_text(text: str) -> str:
+    """Quita menciones y suaviza las expresiones violentas para reenviar un texto rechazado por el filtro."""
+    text = MENTION_PATTERN.sub("", text.lower())
+    for pattern, replacement in SANITIZE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return " ".join(text.split())
+
+
+class DeadLetterStore:
+    """
+    Cola persistente en SQLite (`<salida>.deadletter.db`) de los comentarios que no obtuvieron un
+    puntaje válido: rechazos del filtro de contenido, errores de la API, respuestas ilegibles y
+    fallos del agente.
+
+    Guarda por `tweet_id` el texto original, el motivo, el deployment y la versión del prompt del
+    último intento y el número de intentos. El archivo solo se crea al registrar el primer fallo;
+    `reprocess` marca como resueltos los comentarios corregidos en la exportación.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = None
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                "tweet_id TEXT PRIMARY KEY, text TEXT NOT NULL, reason TEXT NOT NULL, label TEXT NOT NULL, "
+                "model TEXT, prompt_version TEXT, attempts INTEGER NOT NULL, "
+                "first_failed_at REAL NOT NULL, last_failed_at REAL NOT NULL, resolved_at REAL)"
+            )
+            self.conn.commit()
+        return self.conn
+
+    def record(self, failures: Iterable[Tuple[str, str, Dict[str, Any]]], model: str = "",
+               prompt_version: str = "") -> int:
+        """
+        Registra `(tweet_id, texto, resultado)` de cada comentario fallido. Un comentario que ya
+        estaba en la cola suma un intento y vuelve a quedar pendiente.
+        """
+        now = time.time()
+        rows = [(tweet_id, text, result.get("failure", "error"), result.get("label", "error"),
+                 model, prompt_version, now, now) for tweet_id, text, result in failures]
+        if not rows:
+            return 0
+        conn = self._connect()
+        conn.executemany(
+            "INSERT INTO failures VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, NULL) "
+            "ON CONFLICT (tweet_id) DO UPDATE SET reason = excluded.reason, label = excluded.label, "
+            "model = excluded.model, prompt_version = excluded.prompt_version, attempts = attempts + 1, "
+            "last_failed_at = excluded.last_failed_at, resolved_at = NULL",
+            rows
+        )
+        conn.commit()
+        return len(rows)
+
+    def pending(self, reasons: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Comentarios pendientes, los más antiguos primero, opcionalmente filtrados por motivo."""
+        if not self.exists:
+            return []
+        query = "SELECT tweet_id, text, reason, attempts FROM failures WHERE resolved_at IS NULL"
+        params: List[Any] = []
+        if reasons:
+            query += f" AND reason IN ({','.join('?' * len(reasons))})"
+            params += reasons
+        query += " ORDER BY first_failed_at, tweet_id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connect().execute(query, params)
+        return [{"tweet_id": tweet_id, "text": text, "reason": reason, "attempts": attempts}
+                for tweet_id, text, reason, attempts in rows]
+
+    def resolve(self, tweet_ids: Iterable[str]):
+        """Marca como resueltos los comentarios ya corregidos en la exportación."""
+        tweet_ids = list(tweet_ids)
+        if not tweet_ids:
+            return
+        conn = self._connect()
+        now = time.time()
+        for start in range(0, len(tweet_ids), 500):
+            chunk = tweet_ids[start:start + 500]
+            conn.execute(f"UPDATE failures SET resolved_at = ? WHERE tweet_id IN ({','.join('?' * len(chunk))})",
+                         [now, *chunk])
+        conn.commit()
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Comentarios pendientes y resueltos por motivo."""
+        if not self.exists:
+            return {}
+        counts: Dict[str, Dict[str, int]] = {}
+        rows = self._connect().execute(
+            "SELECT reason, resolved_at IS NULL, COUNT(*) FROM failures GROUP BY reason, resolved_at IS NULL")
+        for reason, pending, count in rows:
+            counts.setdefault(reason, {"pending": 0, "resolved": 0})["pending" if pending else "resolved"] += count
+        return counts
+
+    def merge(self, sources: Iterable[str]) -> int:
+        """
+        Copia en esta cola los fallos de otras, por ejemplo las de cada shard. Si un comentario
+        está en varias, se conserva la fila de su último intento. Devuelve cuántas filas se leyeron.
+        """
+        conn = self._connect()
+        columns = ("tweet_id, text, reason, label, model, prompt_version, attempts, first_failed_at, "
+                   "last_failed_at, resolved_at")
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns.split(", ")[1:])
+        merged = 0
+        for source in sources:
+            conn.execute("ATTACH DATABASE ? AS source", (source,))
+            try:
+                merged += conn.execute("SELECT COUNT(*) FROM source.failures").fetchone()[0]
+                # "WHERE true" evita la ambigüedad de ON CONFLICT tras un SELECT
+                conn.execute(
+                    f"INSERT INTO failures ({columns}) SELECT {columns} FROM source.failures WHERE true "
+                    f"ON CONFLICT (tweet_id) DO UPDATE SET {updates} "
+                    "WHERE excluded.last_failed_at > failures.last_failed_at"
+                )
+                conn.commit()
+            finally:
+                conn.execute("DETACH DATABASE source")
+        return merged
+
+    def clear(self):
+        """Vacía la cola; una ejecución nueva reemplaza la exportación a la que se refiere."""
+        if self.exists:
+            conn = self._connect()
+            conn.execute("DELETE FROM failures")
+            conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def reprocess(store: DeadLetterStore, output: str, items: List[Dict[str, Any]], deployment: Optional[str] = None,
+              sanitize: bool = False, local: bool = False, concurrency: int = 1, batch_size: int = 1,
+              prompt_version: str = "", cache=None) -> Tuple[int, int, int]:
+    """
+    Vuelve a puntuar los comentarios de la cola y corrige la exportación en su lugar.
+
+    Con `local` se resuelven con el léxico (nunca fallan); si no, con el modelo, opcionalmente
+    con el texto saneado. Con `cache` (la ResultCache de chat_app para el deployment y la versión
+    del prompt), los resultados corregidos reemplazan los guardados para el texto original, así
+    que la próxima ejecución reutiliza la corrección en lugar del rechazo del filtro.
+    Devuelve `(corregidos, filas actualizadas, siguen fallando)`.
+    """
+    from chat_app import score_texts, score_with_cache
+    from export import patch_results
+    from lexicon import score_text as score_text_locally
+    from sentiment import get_chat_client
+    from utils import clean_text
+
+    texts = [sanitize_text(item["text"]) if sanitize else item["text"] for item in items]
+    if local:
+        results = [score_text_locally(text) for text in texts]
+    else:
+        client = get_chat_client() if concurrency <= 1 else None
+        METRICS.count("model_texts", len(texts))
+        # Sin caché: cada texto distinto se envía una sola vez
+        results = score_with_cache([clean_text(text) for text in texts], None,
+                                   partial(score_texts, client=client, model_deployment=deployment,
+                                           concurrency=concurrency, batch_size=batch_size))
+    patches, failed, fixed = {}, [], {}
+    for item, result in zip(items, results):
+        if result.get("failure"):
+            failed.append((item["tweet_id"], item["text"], result))
+        else:
+            patches[item["tweet_id"]] = (float(result.get("score", 0)), result.get("label", "neutral"))
+            # La clave de la caché es el texto limpio original, aunque se haya enviado saneado
+            fixed[clean_text(item["text"])] = result
+    # Primero la exportación: si se interrumpe, los comentarios siguen pendientes en la cola
+    patched = patch_results(output, patches) if patches else 0
+    if cache and fixed:
+        cache.put_many(list(fixed), list(fixed.values()))
+    store.resolve(patches)
+    store.record(failed, LOCAL_MODEL if local else deployment, "" if local else prompt_version)
+    return len(patches), patched, len(failed)
+
+
+def main():
+    from sentiment import PROMPT_VARIANTS
+
+    parser = argparse.ArgumentParser(description="Cola de comentarios fallidos de chat_app: estado y reprocesamiento")
+    parser.add_argument("command", choices=["status", "reprocess"])
+    parser.add_argument("output", help="Archivo o directorio de salida usado en chat_app")
+    parser.add_argument("--dead-letter", help="Archivo SQLite de la cola (por defecto <salida>.deadletter.db)")
+    parser.add_argument("--reasons", nargs="*", choices=FAILURE_REASONS,
+                        help="Reprocesar solo los fallos con estos motivos")
+    parser.add_argument("--limit", type=int, help="Comentarios como máximo a reprocesar")
+    parser.add_argument("--deployment", help="Deployment de Azure OpenAI para reintentar (por defecto MODEL_DEPLOYMENT)")
+    parser.add_argument("--sanitize", action="store_true",
+                        help="Enviar el texto sin menciones y con las expresiones violentas suavizadas")
+    parser.add_argument("--local", action="store_true", help="Resolver con el léxico local sin llamar al modelo")
+    parser.add_argument("--prompt", choices=list(PROMPT_VARIANTS), default="full")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                        help="Caché de resultados de chat_app donde guardar las correcciones")
+    parser.add_argument("--no-cache", action="store_true", help="No guardar las correcciones en la caché")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--prompt-price", type=float, default=DEFAULT_PROMPT_PRICE)
+    parser.add_argument("--completion-price", type=float, default=DEFAULT_COMPLETION_PRICE)
+    args = parser.parse_args()
+
+    store = DeadLetterStore(args.dead_letter or dead_letter_path(args.output))
+    if not store.exists:
+        parser.error(f"No hay cola de fallidos para {args.output} ({store.path})")
+    if args.command == "status":
+        for reason, count in sorted(store.counts().items()):
+            print(f"{reason}: {count['pending']} pendientes, {count['resolved']} resueltos")
+        store.close()
+        return
+
+    from config import MODEL_DEPLOYMENT
+    from export import checkpoint_path
+    from sentiment import configure_prompt
+
+    if os.path.exists(checkpoint_path(args.output)):
+        parser.error(f"La exportación {args.output} no ha terminado; complétala con --resume antes de reprocesar")
+    deployment = args.deployment or MODEL_DEPLOYMENT
+    if not args.local and not deployment:
+        parser.error("Indica --deployment, define MODEL_DEPLOYMENT o usa --local")
+    items = store.pending(args.reasons, args.limit)
+    if not items:
+        print("No hay comentarios pendientes en la cola de fallidos")
+        store.close()
+        return
+    prompt = configure_prompt(args.prompt)
+    METRICS.set_prices(args.prompt_price, args.completion_price)
+    # Misma clave que chat_app: versión del prompt y deployment
+    cache = ResultCache(args.cache, prompt.version, deployment) if deployment and not args.no_cache else None
+    try:
+        fixed, patched, failed = reprocess(store, args.output, items, deployment, args.sanitize, args.local,
+                                           args.concurrency, args.batch_size, prompt.version, cache)
+    finally:
+        store.close()
+        if cache:
+            cache.close()
+
+    print(f"Reprocesados {len(items)} comentarios con {'el léxico local' if args.local else deployment}: "
+          f"{fixed} corregidos ({patched} filas actualizadas en {args.output}), {failed} siguen fallando")
+    if patched < fixed:
+        print(f"Warning: {fixed - patched} comentarios corregidos no aparecen en {args.output}")
+    if not args.local:
+        summary = METRICS.summary()
+        print(f"Métricas: {summary['tokens']['prompt']} tokens de prompt, {summary['tokens']['completion']} de "
+              f"respuesta, costo estimado {summary['estimated_cost_usd']:.4f} USD")
+    if fixed:
+        print(f"La agregación y el índice de términos de la ejecución original no incluyen las correcciones; "
+              f"para recalcularlos: python src/aggregation.py {args.output} --output <agregación.json>")
+
+
+if __name__ == "__main__":
+    main()
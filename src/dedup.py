@@ -0,0 +1,113 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+from utils import URL_PATTERN
+
+MENTION_PATTERN = re.compile(r"@\w+")
+RETWEET_PREFIX_PATTERN = re.compile(r"^\s*rt\b[:\s]*")
+# Letras alargadas: tres o más repeticiones quedan en dos; "rr", "ll" o "cc" son parte de la palabra
+REPEAT_PATTERN = re.compile(r"(.)\1{2,}")
+# Puntuación ASCII y espacios; los emojis se conservan porque aportan polaridad
+PUNCTUATION_PATTERN = re.compile(r"[\s!-/:-@\[-`{-~¡¿]+")
+
+SYMBOL_PATTERN = re.compile(r"[^\w\s]")
+
+DEFAULT_THRESHOLD = 0.8
+# Comparaciones exactas por miembro dentro de un mismo bucket de LSH; acota el coste cuando
+# muchos textos comparten una banda sin llegar a ser duplicados
+MAX_COMPARISONS = 32
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240627)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def normalize_for_dedup(text: str) -> str:
+    """Normaliza un comentario ignorando enlaces, menciones, prefijo RT, letras alargadas y puntuación."""
+    text = (text or "").lower()
+    text = URL_PATTERN.sub(" ", text)
+    text = MENTION_PATTERN.sub(" ", text)
+    text = RETWEET_PREFIX_PATTERN.sub("", text)
+    text = REPEAT_PATTERN.sub(r"\1\1", text)
+    return PUNCTUATION_PATTERN.sub(" ", text).strip()
+
+
+def _shingles(text: str) -> Set[str]:
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _signature(shingles: Set[str]) -> np.ndarray:
+    """Firma MinHash de un conjunto de shingles."""
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    return ((np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME).min(axis=0)
+
+
+def _bands_for(threshold: float) -> Tuple[int, int]:
+    """Elige bandas y filas de LSH cuyo umbral (1/b)^(1/r) sea el más cercano al pedido."""
+    options = [(b, NUM_PERM // b) for b in range(1, NUM_PERM + 1) if NUM_PERM % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def find_near_duplicates(texts: List[str], threshold: float = DEFAULT_THRESHOLD) -> List[int]:
+    """
+    Agrupa comentarios casi idénticos.
+
+    Devuelve, para cada posición, la posición del representante de su grupo (la primera
+    aparición). Los candidatos se obtienen con MinHash + LSH y se confirman con la similitud de
+    Jaccard exacta entre shingles de caracteres, que debe ser >= `threshold`. Dos comentarios
+    con emojis distintos nunca se agrupan, porque pueden tener polaridad opuesta.
+    """
+    keys = [normalize_for_dedup(text) for text in texts]
+
+    # Los textos idénticos tras normalizar comparten representante sin pasar por MinHash
+    first_by_key: Dict[str, int] = {}
+    reps = [first_by_key.setdefault(key, i) for i, key in enumerate(keys)]
+    unique = list(first_by_key.values())
+    if threshold >= 1.0 or len(unique) < 2:
+        return reps
+
+    shingles = {i: _shingles(keys[i]) for i in unique}
+    symbols = {i: frozenset(SYMBOL_PATTERN.findall(keys[i])) for i in unique}
+    bands, rows = _bands_for(threshold)
+    buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+    for i in unique:
+        signature = _signature(shingles[i])
+        for band in range(bands):
+            buckets[(band, signature[band * rows:(band + 1) * rows].tobytes())].append(i)
+
+    parent = {i: i for i in unique}
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for members in buckets.values():
+        seen: List[int] = []
+        for j in members:
+            for i in seen[-MAX_COMPARISONS:]:
+                root_i, root_j = find(i), find(j)
+                if root_i == root_j:
+                    break
+                if symbols[i] == symbols[j] and _jaccard(shingles[i], shingles[j]) >= threshold:
+                    # El representante es siempre la aparición más temprana
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+                    break
+            else:
+                seen.append(j)
+
+    return [find(rep) for rep in reps]
@@ -1,14 +1,565 @@
+import json
+import os
+import re
+import sys
+import numpy as np
 import pandas as pd
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Sequence, Set, Tuple, Union
 
+from utils import to_utc
 
-def export_to_json(data: List[Dict], file_path: str):
+COLUMNAR_FORMATS = {".parquet": "parquet", ".arrow": "arrow"}
+# Filas acumuladas antes de escribir un row group, y filas por archivo antes de rotar a uno nuevo.
+# Un archivo columnar solo es legible una vez cerrado, así que ROWS_PER_FILE acota lo que se
+# reprocesa al reanudar tras una interrupción.
+ROW_GROUP_ROWS = 20000
+ROWS_PER_FILE = 100000
+PART_PATTERN = re.compile(r"^part-(\d{5})\.(parquet|arrow)$")
+# Partición de los comentarios sin fecha válida
+NULL_PARTITION = "unknown"
+# Filas serializadas por escritura en CSV/JSONL: acota el texto intermedio con bloques grandes
+WRITE_SLICE_ROWS = 20000
+# float32 conserva ~7 cifras significativas; al exportar se redondea para no mostrar artefactos
+# (0.8 -> 0.800000011920929)
+SCORE_DECIMALS = 6
+# Campos de la entrada que se exportan con cada resultado, en el orden de salida
+INPUT_FIELDS = ("tweet_id", "username", "text", "created_at")
+ENGAGEMENT_FIELDS = ("retweets", "likes")
+
+
+class ResultBlock:
+    """
+    Resultados de un bloque de comentarios guardados por columnas.
+
+    En lugar de un dict por comentario, referencia el bloque de entrada (`rows`) para el texto, el
+    usuario, la fecha y la interacción, y guarda solo lo que produce el análisis: puntaje en
+    float32 (NaN si no se puntuó), etiqueta como categoría y hashtags/palabras clave con las
+    cadenas internadas. Los exportadores, la agregación y el índice de términos lo leen con
+    `to_frame`; `records` entrega la vista de dicts de siempre.
+    """
+
+    __slots__ = ("rows", "score", "label", "hashtags", "keywords")
+
+    def __init__(self, rows: pd.DataFrame, score: np.ndarray, label: Sequence[str],
+                 hashtags: Sequence[List[str]], keywords: Sequence[List[str]]):
+        self.rows = rows
+        self.score = np.asarray(score, dtype=np.float32)
+        self.label = pd.Categorical(label)
+        self.hashtags = _interned(hashtags)
+        self.keywords = _interned(keywords)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame con las columnas de salida; el texto y los demás campos de entrada no se copian."""
+        rows = self.rows
+        columns = {field: rows[field] if field in rows else "" for field in INPUT_FIELDS}
+        columns["score"] = self.score.astype(np.float64).round(SCORE_DECIMALS)
+        columns["label"] = self.label
+        columns["hashtags"] = self.hashtags
+        columns["keywords"] = self.keywords
+        for field in ENGAGEMENT_FIELDS:
+            columns[field] = rows[field] if field in rows else 0
+        return pd.DataFrame(columns, index=rows.index)
+
+    def records(self) -> List[Dict[str, Any]]:
+        return self.to_frame().to_dict(orient="records")
+
+
+def _interned(term_lists: Sequence[List[str]]) -> List[List[str]]:
+    """Interna en su lugar los términos de cada lista: un hashtag repetido en miles de comentarios se guarda una vez."""
+    term_lists = list(term_lists)
+    for terms in term_lists:
+        terms[:] = [sys.intern(term) for term in terms]
+    return term_lists
+
+
+def _tweet_ids(df: pd.DataFrame) -> List[str]:
+    return [str(tweet_id) for tweet_id in df["tweet_id"].tolist()] if "tweet_id" in df else [""] * len(df)
+
+
+Results = Union[ResultBlock, pd.DataFrame, List[Dict]]
+
+
+def results_frame(data: Results) -> pd.DataFrame:
+    """Los exportadores aceptan un ResultBlock, un DataFrame de resultados o una lista de dicts."""
+    if isinstance(data, ResultBlock):
+        return data.to_frame()
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.DataFrame(data)
+
+
+def checkpoint_path(file_path: str) -> str:
+    """Checkpoint de una exportación en curso; desaparece al finalizarla."""
+    return file_path.rstrip("/\\") + ".checkpoint"
+
+
+def export_to_json(data: Results, file_path: str):
     """Exporta los resultados a un archivo JSON."""
-    df = pd.DataFrame(data)
+    df = results_frame(data)
     df.to_json(file_path, orient="records", force_ascii=False, indent=2)
 
 
-def export_to_csv(data: List[Dict], file_path: str):
+def export_to_csv(data: Results, file_path: str):
     """Exporta los resultados a un archivo CSV."""
-    df = pd.DataFrame(data)
-    df.to_csv(file_path, index=False, encoding="utf-8") 
\ No newline at end of file
+    df = results_frame(data)
+    df.to_csv(file_path, index=False, encoding="utf-8")
+
+
+def _import_pyarrow():
+    """pyarrow solo se necesita para Parquet/Arrow; se importa al usarlo."""
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("La exportación a Parquet/Arrow requiere pyarrow: pip install pyarrow") from e
+    return pa
+
+
+def results_schema():
+    """Esquema tipado de los resultados para Parquet y Arrow."""
+    pa = _import_pyarrow()
+    return pa.schema([
+        ("tweet_id", pa.int64()),
+        ("username", pa.string()),
+        ("text", pa.string()),
+        ("created_at", pa.timestamp("ms", tz="UTC")),
+        ("score", pa.float64()),
+        ("label", pa.string()),
+        ("hashtags", pa.list_(pa.string())),
+        ("keywords", pa.list_(pa.string())),
+        ("retweets", pa.int64()),
+        ("likes", pa.int64()),
+    ])
+
+
+def results_table(data: Results, schema=None):
+    """
+    Convierte resultados en una tabla de Arrow con el esquema de `results_schema`. Las columnas
+    adicionales se infieren; con `schema` se fuerza el de bloques anteriores.
+    """
+    pa = _import_pyarrow()
+    df = results_frame(data)
+    try:
+        tweet_ids = pd.to_numeric(df["tweet_id"], errors="raise").astype("int64")
+    except (ValueError, TypeError) as e:
+        raise ValueError("Parquet/Arrow requieren tweet_id numérico") from e
+    columns = {
+        "tweet_id": pa.array(tweet_ids, type=pa.int64()),
+        "created_at": pa.array(to_utc(df["created_at"]).dt.tz_localize("UTC"),
+                               from_pandas=True).cast(pa.timestamp("ms", tz="UTC"), safe=False),
+    }
+    for field in ("retweets", "likes"):
+        values = pd.to_numeric(df[field], errors="coerce") if field in df else pd.Series(0, index=df.index)
+        columns[field] = pa.array(values.fillna(0).astype("int64"), type=pa.int64())
+    fields = list(schema or results_schema())
+    if schema is None:
+        known = {field.name for field in fields}
+        fields += [pa.field(name, pa.array(df[name], from_pandas=True).type)
+                   for name in df.columns if name not in known]
+    arrays = []
+    for field in fields:
+        if field.name in columns:
+            arrays.append(columns[field.name])
+        elif field.name in df:
+            values = df[field.name]
+            if pa.types.is_string(field.type):
+                values = values.where(values.isna(), values.astype(str))
+            arrays.append(pa.array(values.tolist(), type=field.type, from_pandas=True))
+        else:
+            arrays.append(pa.nulls(len(df), type=field.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def export_to_parquet(data: Results, file_path: str):
+    """Exporta los resultados a un archivo Parquet con columnas tipadas."""
+    import pyarrow.parquet as pq
+    pq.write_table(results_table(data), file_path, compression="zstd")
+
+
+def export_to_arrow(data: Results, file_path: str):
+    """Exporta los resultados a un archivo Arrow IPC con columnas tipadas."""
+    pa = _import_pyarrow()
+    table = results_table(data)
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.OSFile(file_path, "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+
+
+class IncrementalExporter:
+    """
+    Exporta los resultados por bloques a medida que se producen.
+
+    CSV y JSONL se escriben en modo append; para JSON se escribe un JSONL parcial que se
+    convierte en un arreglo al llamar a `finalize`. Tras cada bloque se registra en
+    `<salida>.checkpoint` el tamaño confirmado del archivo y los `tweet_id` exportados, de modo
+    que con `resume=True` se descarta cualquier escritura incompleta y se omiten los ya procesados
+    (`resumed_ids`). Reanudar una exportación ya terminada (sin checkpoint) es un error.
+    """
+
+    def __init__(self, file_path: str, resume: bool = False):
+        if file_path.endswith(".csv"):
+            self.format = "csv"
+            self.data_path = file_path
+        elif file_path.endswith((".jsonl", ".ndjson")):
+            self.format = "jsonl"
+            self.data_path = file_path
+        elif file_path.endswith(".json"):
+            self.format = "json"
+            self.data_path = file_path + ".partial.jsonl"
+        else:
+            raise ValueError("Formato de salida no soportado")
+        self.file_path = file_path
+        self.checkpoint_path = checkpoint_path(file_path)
+        # `tweet_id` exportados en una ejecución anterior, según el checkpoint
+        self.resumed_ids: Set[str] = set()
+
+        offset = 0
+        if resume and os.path.exists(self.checkpoint_path):
+            offset = self._load_checkpoint()
+        elif resume and os.path.exists(file_path):
+            raise ValueError(f"La exportación {file_path} ya está completa (no hay checkpoint que reanudar); "
+                             f"elimínala o ejecuta sin --resume para procesarla de nuevo")
+        else:
+            open(self.checkpoint_path, "w").close()
+        # Descarta lo escrito después del último checkpoint confirmado
+        open(self.data_path, "a").close()
+        os.truncate(self.data_path, offset)
+        self._file = open(self.data_path, "a", encoding="utf-8", newline="")
+
+    def _load_checkpoint(self) -> int:
+        """Lee el checkpoint y devuelve el último tamaño confirmado del archivo de datos."""
+        offset = 0
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Línea incompleta por una interrupción: se ignora
+                offset = entry["offset"]
+                self.resumed_ids.update(entry["ids"])
+        return offset
+
+    def write(self, data: Results):
+        """Añade un bloque de resultados y confirma el checkpoint."""
+        if not len(data):
+            return
+        df = results_frame(data)
+        for start in range(0, len(df), WRITE_SLICE_ROWS):
+            part = df.iloc[start:start + WRITE_SLICE_ROWS]
+            if self.format == "csv":
+                part.to_csv(self._file, index=False, header=self._file.tell() == 0)
+            else:
+                lines = part.to_json(orient="records", lines=True, force_ascii=False)
+                self._file.write(lines if lines.endswith("\n") else lines + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"offset": self._file.tell(), "ids": _tweet_ids(df)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def finalize(self):
+        """Cierra la exportación; en formato JSON genera el arreglo final a partir del JSONL parcial."""
+        self._file.close()
+        if self.format == "json":
+            with open(self.data_path, encoding="utf-8") as src, \
+                    open(self.file_path, "w", encoding="utf-8") as dst:
+                dst.write("[")
+                first = True
+                for line in src:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    dst.write("\n" if first else ",\n")
+                    dst.write(line)
+                    first = False
+                dst.write("\n]")
+            os.remove(self.data_path)
+        os.remove(self.checkpoint_path)
+
+
+class _PartWriter:
+    """Archivo columnar abierto de una partición; acumula filas hasta completar un row group."""
+
+    def __init__(self, path: str, format: str, schema):
+        pa = _import_pyarrow()
+        self.path = path
+        self.rows = 0
+        self.buffer: List[pd.DataFrame] = []
+        self.buffered = 0
+        self.schema = schema
+        if format == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, schema, compression="zstd")
+            self._sink = None
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, schema,
+                                           options=pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    def flush(self):
+        if self.buffer:
+            self._writer.write_table(results_table(pd.concat(self.buffer, ignore_index=True), self.schema))
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+class ColumnarExporter:
+    """
+    Exporta los resultados por bloques a Parquet o Arrow IPC.
+
+    La salida es un directorio (`results.parquet/`) con archivos `part-NNNNN` que se leen como un
+    solo dataset, opcionalmente particionado por día del partido (`match_day=AAAA-MM-DD/`, fecha
+    UTC de `created_at`). Las filas se escriben en row groups de `row_group_rows` y cada archivo
+    se cierra al llegar a `rows_per_file`. El checkpoint registra el archivo de cada `tweet_id`;
+    al reanudar se descartan los archivos que no llegaron a cerrarse y sus comentarios se
+    vuelven a procesar. Como en IncrementalExporter, reanudar una exportación ya terminada es un error.
+    """
+
+    def __init__(self, file_path: str, resume: bool = False, partition_by_day: bool = False,
+                 row_group_rows: int = ROW_GROUP_ROWS, rows_per_file: int = ROWS_PER_FILE):
+        self.format = COLUMNAR_FORMATS[os.path.splitext(file_path)[1]]
+        self.file_path = file_path
+        self.checkpoint_path = checkpoint_path(file_path)
+        self.partition_by_day = partition_by_day
+        self.row_group_rows = row_group_rows
+        self.rows_per_file = rows_per_file
+        self.resumed_ids: Set[str] = set()
+        self._writers: Dict[Optional[str], _PartWriter] = {}
+        self._schema = None
+
+        os.makedirs(file_path, exist_ok=True)
+        parts = self._existing_parts()
+        if resume and os.path.exists(self.checkpoint_path):
+            valid = self._load_checkpoint()
+            stale = [part for part in parts if part not in valid]
+        elif resume and parts:
+            raise ValueError(f"La exportación {file_path} ya está completa (no hay checkpoint que reanudar); "
+                             f"elimínala o ejecuta sin --resume para procesarla de nuevo")
+        else:
+            stale = parts
+            open(self.checkpoint_path, "w").close()
+        for part in stale:
+            os.remove(os.path.join(file_path, part))
+        self._next_part = 1 + max((int(PART_PATTERN.match(os.path.basename(part)).group(1))
+                                   for part in parts if part not in stale), default=-1)
+
+    def _existing_parts(self) -> List[str]:
+        """Rutas relativas de los archivos `part-NNNNN` del directorio de salida."""
+        parts = []
+        for root, _, files in os.walk(self.file_path):
+            for name in files:
+                if PART_PATTERN.match(name):
+                    parts.append(os.path.relpath(os.path.join(root, name), self.file_path))
+        return parts
+
+    def _is_complete(self, part: str) -> bool:
+        pa = _import_pyarrow()
+        path = os.path.join(self.file_path, part)
+        try:
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                pq.read_metadata(path)
+            else:
+                with pa.memory_map(path) as source:
+                    pa.ipc.open_file(source)
+        except (OSError, pa.ArrowInvalid):
+            return False
+        return True
+
+    def _load_checkpoint(self) -> Set[str]:
+        """Lee el checkpoint y devuelve los archivos completos; solo sus `tweet_id` cuentan como procesados."""
+        ids_by_part: Dict[str, List[str]] = {}
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Línea incompleta por una interrupción: se ignora
+                for part, ids in entry["parts"].items():
+                    ids_by_part.setdefault(part, []).extend(ids)
+        valid = {part for part in ids_by_part if self._is_complete(part)}
+        # Se reescribe el checkpoint solo con los archivos válidos
+        with open(self.checkpoint_path, "w", encoding="utf-8") as f:
+            for part in sorted(valid):
+                self.resumed_ids.update(ids_by_part[part])
+                f.write(json.dumps({"parts": {part: ids_by_part[part]}}) + "\n")
+        return valid
+
+    def _partitions(self, df: pd.DataFrame) -> List[str]:
+        days = to_utc(df["created_at"].to_numpy()).dt.strftime("%Y-%m-%d")
+        return [f"match_day={day}" if isinstance(day, str) else f"match_day={NULL_PARTITION}" for day in days]
+
+    def _writer_for(self, partition: Optional[str], sample: pd.DataFrame) -> _PartWriter:
+        writer = self._writers.get(partition)
+        if writer is None:
+            if self._schema is None:
+                self._schema = results_table(sample).schema
+            directory = os.path.join(self.file_path, partition) if partition else self.file_path
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{self._next_part:05d}.{self.format}")
+            self._next_part += 1
+            writer = self._writers[partition] = _PartWriter(path, self.format, self._schema)
+        return writer
+
+    def write(self, data: Results):
+        """Añade un bloque de resultados y registra en el checkpoint en qué archivo quedó cada uno."""
+        if not len(data):
+            return
+        df = results_frame(data)
+        if self.partition_by_day:
+            by_partition = dict(list(df.groupby(self._partitions(df), sort=False)))
+        else:
+            by_partition = {None: df}
+        parts: Dict[str, List[str]] = {}
+        full = []
+        for partition, rows in by_partition.items():
+            writer = self._writer_for(partition, rows)
+            writer.buffer.append(rows)
+            writer.buffered += len(rows)
+            writer.rows += len(rows)
+            part = os.path.relpath(writer.path, self.file_path)
+            parts[part] = _tweet_ids(rows)
+            if writer.buffered >= self.row_group_rows:
+                writer.flush()
+            if writer.rows >= self.rows_per_file:
+                full.append(partition)
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"parts": parts}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        # Se rota después de confirmar el checkpoint para que ningún archivo cerrado tenga filas sin registrar
+        for partition in full:
+            self._writers.pop(partition).close()
+
+    def finalize(self):
+        """Cierra los archivos abiertos y elimina el checkpoint."""
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        os.remove(self.checkpoint_path)
+
+
+def open_exporter(file_path: str, resume: bool = False, partition_by_day: bool = False):
+    """Elige el exportador incremental según la extensión de la salida."""
+    if os.path.splitext(file_path.rstrip("/\\"))[1] in COLUMNAR_FORMATS:
+        return ColumnarExporter(file_path.rstrip("/\\"), resume=resume, partition_by_day=partition_by_day)
+    if partition_by_day:
+        raise ValueError("La partición por día solo está disponible para Parquet o Arrow")
+    return IncrementalExporter(file_path, resume=resume)
+
+
+def _patch_lines(src, dst, patches: Dict[str, Tuple[float, str]]) -> int:
+    """Copia un JSONL aplicando los parches; las líneas sin cambios se copian tal cual."""
+    patched = 0
+    for line in src:
+        record = json.loads(line) if line.strip() else None
+        update = patches.get(str(record.get("tweet_id"))) if record else None
+        if update is None:
+            dst.write(line)
+            continue
+        record["score"], record["label"] = round(update[0], SCORE_DECIMALS), update[1]
+        dst.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        patched += 1
+    return patched
+
+
+def _patch_csv(path: str, tmp_path: str, patches: Dict[str, Tuple[float, str]]) -> int:
+    """Reescribe un CSV por bloques leyendo todo como texto para no alterar las columnas sin cambios."""
+    patched = 0
+    reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=WRITE_SLICE_ROWS)
+    with open(tmp_path, "w", encoding="utf-8", newline="") as dst:
+        for i, df in enumerate(reader):
+            mask = df["tweet_id"].isin(patches.keys())
+            if mask.any():
+                updates = [patches[tweet_id] for tweet_id in df.loc[mask, "tweet_id"]]
+                df.loc[mask, "score"] = [str(round(score, SCORE_DECIMALS)) for score, _ in updates]
+                df.loc[mask, "label"] = [label for _, label in updates]
+                patched += int(mask.sum())
+            df.to_csv(dst, index=False, header=i == 0)
+    return patched
+
+
+def _patch_table(path: str, format: str, patches: Dict[str, Tuple[float, str]]) -> int:
+    """Reescribe un archivo `part-NNNNN` si contiene alguno de los `tweet_id` corregidos."""
+    pa = _import_pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    ids = [str(tweet_id) for tweet_id in table.column("tweet_id").to_pylist()]
+    positions = [i for i, tweet_id in enumerate(ids) if tweet_id in patches]
+    if not positions:
+        return 0
+    scores = table.column("score").to_pylist()
+    labels = table.column("label").to_pylist()
+    for i in positions:
+        score, labels[i] = patches[ids[i]]
+        scores[i] = round(score, SCORE_DECIMALS)
+    for name, values in (("score", scores), ("label", labels)):
+        index = table.schema.get_field_index(name)
+        table = table.set_column(index, table.schema.field(index), pa.array(values, type=table.schema.field(index).type))
+    tmp_path = f"{path}.tmp"
+    if format == "parquet":
+        pq.write_table(table, tmp_path, compression="zstd", row_group_size=ROW_GROUP_ROWS)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=ROW_GROUP_ROWS)
+    os.replace(tmp_path, path)
+    return len(positions)
+
+
+def patch_results(file_path: str, patches: Dict[str, Tuple[float, str]]) -> int:
+    """
+    Corrige en su lugar `score` y `label` de los `tweet_id` indicados en una exportación terminada.
+
+    Cada archivo se reescribe en uno temporal que reemplaza al original, así que una interrupción
+    no deja la salida a medias. En Parquet/Arrow solo se reescriben los archivos `part-NNNNN` que
+    contienen alguno de los comentarios. Devuelve el número de filas corregidas.
+    """
+    file_path = file_path.rstrip("/\\")
+    if os.path.exists(checkpoint_path(file_path)):
+        raise ValueError(f"La exportación {file_path} no ha terminado; complétala con --resume antes de corregirla")
+    format = COLUMNAR_FORMATS.get(os.path.splitext(file_path)[1])
+    if format:
+        patched = 0
+        for root, _, files in os.walk(file_path):
+            for name in sorted(files):
+                if PART_PATTERN.match(name):
+                    patched += _patch_table(os.path.join(root, name), format, patches)
+        return patched
+    tmp_path = f"{file_path}.tmp"
+    if file_path.endswith(".csv"):
+        patched = _patch_csv(file_path, tmp_path, patches)
+    elif file_path.endswith((".jsonl", ".ndjson")):
+        with open(file_path, encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+            patched = _patch_lines(src, dst, patches)
+    elif file_path.endswith(".json"):
+        # Arreglo JSON: se carga completo, igual que al leerlo con aggregation.load_results
+        with open(file_path, encoding="utf-8") as f:
+            records = json.load(f)
+        patched = 0
+        for record in records:
+            update = patches.get(str(record.get("tweet_id")))
+            if update is not None:
+                record["score"], record["label"] = round(update[0], SCORE_DECIMALS), update[1]
+                patched += 1
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            f.write(",".join("\n" + json.dumps(record, ensure_ascii=False, separators=(",", ":")) for record in records))
+            f.write("\n]")
+    else:
+        raise ValueError("Formato de salida no soportado")
+    os.replace(tmp_path, file_path)
+    return patched
@@ -1,8 +1,10 @@
 import pandas as pd
-from typing import List
+from itertools import islice
+from typing import Iterator, List
 
 REQUIRED_FIELDS = ["tweet_id", "username", "text", "created_at"]
 OPTIONAL_FIELDS = ["retweets", "likes"]
+DEFAULT_CHUNK_SIZE = 1000
 
 
 def load_csv(file_path: str) -> pd.DataFrame:
@@ -19,18 +21,82 @@ def load_json(file_path: str) -> pd.DataFrame:
     return df
 
 
+def load_jsonl(file_path: str) -> pd.DataFrame:
+    """Carga datos desde un archivo JSON por líneas (JSONL) y valida los campos requeridos."""
+    df = pd.read_json(file_path, lines=True)
+    validate_fields(df)
+    return df
+
+
 def load_txt(file_path: str) -> pd.DataFrame:
     """Carga datos desde un archivo de texto plano (un comentario por línea)."""
-    with open(file_path, encoding="utf-8") as f:
-        lines = f.readlines()
+    chunks = list(iter_txt(file_path, chunksize=DEFAULT_CHUNK_SIZE))
+    return pd.concat(chunks, ignore_index=True) if chunks else _txt_frame([], 0)
+
+
+def _txt_frame(lines: List[str], offset: int) -> pd.DataFrame:
+    """Construye un bloque de comentarios de texto plano con campos mínimos generados."""
     df = pd.DataFrame({"text": [line.strip() for line in lines]})
-    # Generar campos mínimos
+    df.index += offset
     df["tweet_id"] = df.index.astype(str)
     df["username"] = "anon"
     df["created_at"] = None
     return df
 
 
+def iter_csv(file_path: str, chunksize: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Lee un CSV por bloques de `chunksize` filas, validando los campos requeridos."""
+    with pd.read_csv(file_path, chunksize=chunksize) as reader:
+        for chunk in reader:
+            validate_fields(chunk)
+            yield chunk
+
+
+def iter_jsonl(file_path: str, chunksize: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Lee un archivo JSONL por bloques de `chunksize` registros, validando los campos requeridos."""
+    with pd.read_json(file_path, lines=True, chunksize=chunksize) as reader:
+        for chunk in reader:
+            validate_fields(chunk)
+            yield chunk
+
+
+def iter_json(file_path: str, chunksize: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Entrega un arreglo JSON por bloques.
+
+    Un arreglo JSON no se puede leer de forma incremental con pandas, por lo que el archivo se
+    carga completo; para capturas grandes conviene usar JSONL.
+    """
+    df = load_json(file_path)
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def iter_txt(file_path: str, chunksize: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Lee un archivo de texto plano por bloques sin cargarlo completo en memoria."""
+    offset = 0
+    with open(file_path, encoding="utf-8") as f:
+        while True:
+            lines = list(islice(f, chunksize))
+            if not lines:
+                break
+            yield _txt_frame(lines, offset)
+            offset += len(lines)
+
+
+def iter_records(file_path: str, chunksize: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Selecciona el lector por bloques según la extensión del archivo."""
+    if file_path.endswith(".csv"):
+        return iter_csv(file_path, chunksize)
+    if file_path.endswith((".jsonl", ".ndjson")):
+        return iter_jsonl(file_path, chunksize)
+    if file_path.endswith(".json"):
+        return iter_json(file_path, chunksize)
+    if file_path.endswith(".txt"):
+        return iter_txt(file_path, chunksize)
+    raise ValueError("Formato de archivo no soportado")
+
+
 def validate_fields(df: pd.DataFrame):
     """Valida que el DataFrame tenga los campos requeridos."""
     for field in REQUIRED_FIELDS:
@@ -0,0 +1,140 @@
+import re
+from typing import Any, Dict, List
+
+from utils import URL_PATTERN
+
+# Pesos de polaridad en [-1, 1] para español venezolano y jerga futbolera
+LEXICON = {
+    # Positivos
+    "gol": 0.6, "golazo": 1.0, "gana": 0.6, "ganamos": 0.9, "ganar": 0.5, "ganando": 0.7,
+    "victoria": 0.9, "triunfo": 0.9, "clasificamos": 1.0, "historico": 0.8, "histórico": 0.8,
+    "vamos": 0.6, "dale": 0.5, "arriba": 0.5, "grande": 0.6, "grandes": 0.6, "crack": 0.9, "cracks": 0.9,
+    "bestia": 0.6, "idolo": 0.9, "ídolo": 0.9, "heroe": 0.9, "héroe": 0.9, "orgullo": 1.0, "orgulloso": 0.9,
+    "brutal": 0.7, "burda": 0.3, "chevere": 0.8, "chévere": 0.8, "fino": 0.6, "genial": 0.8, "increible": 0.6,
+    "increíble": 0.6, "hermoso": 0.8, "hermosa": 0.8, "bello": 0.7, "felicidad": 0.9, "feliz": 0.8,
+    "alegria": 0.8, "alegría": 0.8, "emocion": 0.6, "emoción": 0.6, "bravo": 0.7, "excelente": 0.9,
+    "buenisimo": 0.8, "buenísimo": 0.8, "bueno": 0.4, "buena": 0.4, "bien": 0.4, "atajada": 0.6,
+    "atajadon": 0.8, "atajadón": 0.8, "salvada": 0.5, "clase": 0.6, "categoria": 0.6, "categoría": 0.6,
+    "calma": 0.2, "presidente": 0.3, "amo": 0.8, "amor": 0.7, "gracias": 0.6, "campeones": 1.0,
+    # Negativos
+    "perdemos": -0.9, "perdimos": -0.9, "perder": -0.6, "perdiendo": -0.7, "derrota": -0.9, "eliminados": -1.0,
+    "mal": -0.6, "malo": -0.7, "mala": -0.7, "malisimo": -0.9, "malísimo": -0.9, "pesimo": -0.9, "pésimo": -0.9,
+    "horrible": -0.9, "terrible": -0.8, "desastre": -0.9, "verguenza": -0.9, "vergüenza": -0.9,
+    "ladron": -0.8, "ladrón": -0.8, "ladrones": -0.8, "robo": -0.8, "robaron": -0.9, "trampa": -0.7,
+    "injusto": -0.7, "fraude": -0.9, "basura": -0.9, "paquete": -0.6, "malandro": -0.6, "arrecho": -0.6,
+    "arrechera": -0.7, "ladilla": -0.6, "ladillado": -0.6, "rabia": -0.7, "triste": -0.7, "tristeza": -0.8,
+    "dolor": -0.6, "sufrir": -0.6, "sufrimiento": -0.7, "odio": -0.9, "fallo": -0.5, "falló": -0.5,
+    "fallaron": -0.6, "error": -0.5, "horror": -0.8, "lento": -0.4, "inutil": -0.8, "inútil": -0.8,
+    "fuera": -0.4, "renuncia": -0.6, "decepcion": -0.8, "decepción": -0.8, "nefasto": -0.9,
+}
+
+PHRASES = {
+    "me quiero matar": -0.9, "que verguenza": -0.9, "qué vergüenza": -0.9, "que vergüenza": -0.9,
+    "de mi vida": 0.7, "se gana": 0.7, "vamos vinotinto": 0.9, "gol de venezuela": 1.0,
+    "gol de la vinotinto": 1.0, "nos robaron": -1.0, "que mal": -0.8, "qué mal": -0.8, "ni modo": -0.3,
+    "no puede ser": -0.5, "a la calle": -0.7,
+}
+
+EMOJIS = {
+    "😍": 0.8, "🥰": 0.8, "❤": 0.7, "💛": 0.6, "💙": 0.6, "❤️": 0.7, "🍷": 0.5, "🔥": 0.6, "💪": 0.6,
+    "🙌": 0.7, "👏": 0.6, "🎉": 0.8, "🥳": 0.8, "😁": 0.7, "😀": 0.6, "😃": 0.6, "😄": 0.7, "😂": 0.3,
+    "🤣": 0.3, "⚽": 0.2, "🏆": 0.8, "🇻🇪": 0.3, "✅": 0.4, "🙏": 0.4,
+    "😭": -0.5, "😢": -0.7, "😡": -0.9, "🤬": -1.0, "😤": -0.6, "💔": -0.8, "😞": -0.7, "😔": -0.6,
+    "🤡": -0.7, "👎": -0.7, "🤦": -0.6, "😩": -0.6, "😫": -0.6, "🙄": -0.4, "😒": -0.5,
+}
+
+NEGATORS = {"no", "nunca", "ni", "tampoco", "sin", "jamas", "jamás", "nada"}
+NEGATION_SCOPE = 3
+# Marcadores frecuentes de sarcasmo: reducen la confianza para enviar el comentario al LLM
+SARCASM_MARKERS = ("jaja", "jeje", "claro que si", "claro que sí", "que bonito", "qué bonito", "gracias por nada",
+                   "lo que faltaba", "genial...", "bravo...", "🙃", "🤡")
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+ELONGATION_PATTERN = re.compile(r"(\w)\1{2,}")
+DOUBLE_PATTERN = re.compile(r"(\w)\1+")
+EMOJI_PATTERN = re.compile("|".join(sorted(map(re.escape, EMOJIS), key=len, reverse=True)))
+PHRASE_PATTERN = re.compile(r"(?<!\w)(?:" + "|".join(sorted(map(re.escape, PHRASES), key=len, reverse=True))
+                            + r")(?!\w)")
+
+# Intensidad extra por letras alargadas ("GOLAZOOOO")
+ELONGATION_BOOST = 1.3
+SCORE_SCALE = 1.5
+
+
+def _lookup(token: str):
+    """
+    Busca un token en el léxico tolerando letras alargadas. Devuelve (peso, alargado).
+
+    Las repeticiones se reducen primero a dos letras, para no romper las palabras que las llevan
+    ("horrrrible" -> "horrible"), y después a una ("gooool" -> "gol").
+    """
+    if token in LEXICON:
+        return LEXICON[token], False
+    doubled = ELONGATION_PATTERN.sub(r"\1\1", token)
+    if doubled in LEXICON:
+        return LEXICON[doubled], True
+    collapsed = ELONGATION_PATTERN.sub(r"\1", token)
+    if collapsed in LEXICON:
+        return LEXICON[collapsed], True
+    single = DOUBLE_PATTERN.sub(r"\1", collapsed)
+    if single in LEXICON:
+        return LEXICON[single], collapsed != token
+    return None, False
+
+
+def label_for_score(score: float) -> str:
+    """Clasifica un puntaje con los umbrales del prompt del sistema."""
+    if score > 0.2:
+        return "positivo"
+    if score < -0.2:
+        return "negativo"
+    return "neutral"
+
+
+def score_text(text: str) -> Dict[str, Any]:
+    """
+    Puntúa un comentario con el léxico local.
+
+    Devuelve `score`, `label` y `confidence` en [0, 1]: la confianza crece con el número de
+    indicios y baja cuando la polaridad es mixta o hay marcadores de sarcasmo.
+    """
+    raw = URL_PATTERN.sub("", text or "")
+    lowered = raw.lower()
+    weights: List[float] = []
+
+    for phrase in PHRASE_PATTERN.findall(lowered):
+        weights.append(PHRASES[phrase])
+    remaining = PHRASE_PATTERN.sub(" ", lowered)
+
+    weights.extend(EMOJIS[emoji] for emoji in EMOJI_PATTERN.findall(raw))
+
+    negated = 0
+    for token in TOKEN_PATTERN.findall(remaining):
+        if token in NEGATORS:
+            negated = NEGATION_SCOPE
+            continue
+        weight, elongated = _lookup(token)
+        if weight is not None:
+            if elongated:
+                weight *= ELONGATION_BOOST
+            if negated:
+                weight = -weight * 0.8
+            weights.append(weight)
+        negated = max(0, negated - 1)
+
+    if not weights:
+        return {"score": 0.0, "label": "neutral", "confidence": 0.0, "hashtags": [], "keywords": []}
+
+    total = sum(weights)
+    magnitude = sum(abs(w) for w in weights)
+    score = max(-1.0, min(1.0, total / SCORE_SCALE))
+    confidence = (abs(total) / magnitude) * min(1.0, magnitude / SCORE_SCALE)
+    if any(marker in lowered for marker in SARCASM_MARKERS):
+        confidence *= 0.5
+    return {
+        "score": round(score, 2),
+        "label": label_for_score(score),
+        "confidence": round(confidence, 2),
+        "hashtags": [],
+        "keywords": [],
+    }
@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Límites superiores (segundos) del histograma de latencia por llamada
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf")]
+# Precios por 1000 tokens (USD); ajustables con MetricsRegistry.set_prices
+DEFAULT_PROMPT_PRICE = 0.03
+DEFAULT_COMPLETION_PRICE = 0.06
+RESERVOIR_SIZE = 10000
+
+
+class MetricsRegistry:
+    """
+    Métricas de una ejecución: tiempo por etapa, latencia por llamada, tokens, eventos y costo.
+
+    Es segura entre hilos y tareas asíncronas. `write_json` y `write_prometheus` reemplazan el
+    archivo de forma atómica, por lo que se pueden leer a mitad de la ejecución.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages: Dict[str, float] = {}
+            self.events: Dict[str, int] = {}
+            self.tokens = {"prompt": 0, "completion": 0}
+            self.calls: Dict[str, Dict[str, Any]] = {}
+            self.latencies: Dict[str, Dict[str, Any]] = {}
+            self.prompt_price = DEFAULT_PROMPT_PRICE
+            self.completion_price = DEFAULT_COMPLETION_PRICE
+            self.info: Dict[str, str] = {}
+            self._rng = random.Random(0)
+
+    def set_prices(self, prompt_price: float, completion_price: float):
+        """Precios por 1000 tokens usados para estimar el costo."""
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+
+    def set_info(self, **values: str):
+        """Datos descriptivos de la ejecución (p. ej. la versión del prompt) que acompañan a las métricas."""
+        with self._lock:
+            self.info.update(values)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Acumula el tiempo de pared del bloque en la etapa `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def count(self, event: str, amount: int = 1):
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + amount
+
+    def _observe(self, histograms: Dict[str, Dict[str, Any]], name: str, latency: float):
+        data = histograms.setdefault(name, {
+            "count": 0, "sum": 0.0, "buckets": [0] * len(LATENCY_BUCKETS), "samples": [],
+        })
+        data["count"] += 1
+        data["sum"] += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                data["buckets"][i] += 1
+                break
+        # Muestreo de reservorio para estimar percentiles con memoria acotada
+        if len(data["samples"]) < RESERVOIR_SIZE:
+            data["samples"].append(latency)
+        else:
+            slot = self._rng.randrange(data["count"])
+            if slot < RESERVOIR_SIZE:
+                data["samples"][slot] = latency
+
+    def record_call(self, backend: str, latency: float, usage: Any = None):
+        """Registra una llamada al modelo con su latencia y, si existe, `response.usage`."""
+        with self._lock:
+            self._observe(self.calls, backend, latency)
+            if usage is not None:
+                self.tokens["prompt"] += getattr(usage, "prompt_tokens", 0) or 0
+                self.tokens["completion"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def record_tokens(self, prompt: int, completion: int):
+        """Suma tokens consumidos fuera de una llamada cronometrada (p. ej. los resultados de la Batch API)."""
+        with self._lock:
+            self.tokens["prompt"] += prompt or 0
+            self.tokens["completion"] += completion or 0
+
+    def record_latency(self, name: str, latency: float):
+        """Registra una latencia que no corresponde a una llamada al modelo (p. ej. de extremo a extremo)."""
+        with self._lock:
+            self._observe(self.latencies, name, latency)
+
+    def estimated_cost(self) -> float:
+        return (self.tokens["prompt"] * self.prompt_price + self.tokens["completion"] * self.completion_price) / 1000
+
+    @staticmethod
+    def _percentile(samples: List[float], pct: float) -> Optional[float]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+    def _histogram_summary(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "count": data["count"],
+            "mean_ms": round(data["sum"] / data["count"] * 1000, 2) if data["count"] else None,
+            **{f"p{p}_ms": round(self._percentile(data["samples"], p) * 1000, 2)
+               for p in (50, 95, 99) if data["samples"]},
+            "histogram": {("+Inf" if bound == float("inf") else str(bound)): n
+                          for bound, n in zip(LATENCY_BUCKETS, data["buckets"])},
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = {backend: self._histogram_summary(data) for backend, data in self.calls.items()}
+            latencies = {name: self._histogram_summary(data) for name, data in self.latencies.items()}
+            # Comentarios enviados al modelo (los cuenta chat_app); base del costo por comentario
+            texts = self.events.get("model_texts")
+            return {
+                **({"info": dict(self.info)} if self.info else {}),
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+                "elapsed_seconds": round(time.time() - self.started_at, 3),
+                "stages_seconds": {name: round(value, 4) for name, value in self.stages.items()},
+                "calls": calls,
+                **({"latencies": latencies} if latencies else {}),
+                "tokens": dict(self.tokens),
+                **({"tokens_per_text": {kind: round(n / texts, 2) for kind, n in self.tokens.items()}}
+                   if texts else {}),
+                "events": dict(self.events),
+                "estimated_cost_usd": round(self.estimated_cost(), 6),
+            }
+
+    @staticmethod
+    def _write_atomic(path: str, content: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def write_json(self, path: str):
+        self._write_atomic(path, json.dumps(self.summary(), indent=2, ensure_ascii=False))
+
+    @staticmethod
+    def _prometheus_histogram(metric: str, label: str, histograms: Dict[str, Dict[str, Any]]) -> List[str]:
+        lines = [f"# TYPE {metric} histogram"]
+        for name, data in histograms.items():
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, data["buckets"]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(f'{metric}_bucket{{{label}="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{label}="{name}"}} {data["sum"]}')
+            lines.append(f'{metric}_count{{{label}="{name}"}} {data["count"]}')
+        return lines
+
+    def write_prometheus(self, path: str, prefix: str = "vinotinto"):
+        """Escribe las métricas en el formato de texto de Prometheus (para el textfile collector)."""
+        lines = [f"# TYPE {prefix}_stage_seconds_total counter"]
+        with self._lock:
+            if self.info:
+                labels = ",".join(f'{key}="{value}"' for key, value in self.info.items())
+                lines = [f"# TYPE {prefix}_run_info gauge", f"{prefix}_run_info{{{labels}}} 1"] + lines
+            lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {value}' for name, value in self.stages.items()]
+            lines += self._prometheus_histogram(f"{prefix}_llm_call_latency_seconds", "backend", self.calls)
+            if self.latencies:
+                lines += self._prometheus_histogram(f"{prefix}_latency_seconds", "kind", self.latencies)
+            lines.append(f"# TYPE {prefix}_tokens_total counter")
+            lines += [f'{prefix}_tokens_total{{kind="{kind}"}} {n}' for kind, n in self.tokens.items()]
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            lines += [f'{prefix}_events_total{{event="{event}"}} {n}' for event, n in self.events.items()]
+            lines.append(f"# TYPE {prefix}_estimated_cost_usd gauge")
+            lines.append(f"{prefix}_estimated_cost_usd {self.estimated_cost()}")
+        self._write_atomic(path, "\n".join(lines) + "\n")
+
+
+# Registro compartido por todo el proceso
+METRICS = MetricsRegistry()
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import METRICS
+
+try:
+    import fcntl
+except ImportError:  # Windows: el estado solo se comparte entre hilos y tareas del mismo proceso
+    fcntl = None
+
+# Azure aplica la cuota por minuto en ventanas de 10 segundos, así que la ráfaga máxima es 1/6 de la cuota
+BURST_FRACTION = 1 / 6
+MAX_RETRIES = 8
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Caracteres por token para estimar el prompt antes de enviarlo
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """
+    Tokens que Azure descuenta de la cuota TPM al recibir la petición: el prompt estimado más
+    `max_tokens` (el servicio reserva el máximo de respuesta, no lo que finalmente se genera).
+    """
+    return sum(len(m.get("content", "")) for m in messages) // CHARS_PER_TOKEN + max_tokens
+
+
+class RateLimiter:
+    """
+    Limitador de cubeta de tokens para las cuotas RPM y TPM de un deployment.
+
+    Cada petición reserva 1 request y sus tokens estimados; si la cubeta queda en negativo, la
+    espera es el tiempo de recarga de esa deuda, de modo que las peticiones se atienden en orden
+    de llegada sin sondeo. Las cabeceras `x-ratelimit-remaining-*` recortan los niveles locales y un
+    429 con `Retry-After` bloquea a todos los clientes hasta que venza.
+
+    Con `state_path` el estado vive en un archivo protegido con `flock` y se comparte entre
+    procesos (por ejemplo, los shards de src/sharding.py); en ese caso `rpm` y `tpm` son la
+    cuota total del deployment, no la de cada proceso.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, state_path: Optional[str] = None):
+        self.rates = {"requests": (rpm or 0) / 60, "tokens": (tpm or 0) / 60}
+        self.capacity = {"requests": (rpm or 0) * BURST_FRACTION, "tokens": (tpm or 0) * BURST_FRACTION}
+        self.state_path = state_path if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._state: Optional[Dict[str, float]] = None
+
+    def _initial_state(self) -> Dict[str, float]:
+        return {"requests": self.capacity["requests"], "tokens": self.capacity["tokens"],
+                "updated": time.time(), "blocked_until": 0.0}
+
+    @contextmanager
+    def _shared_state(self):
+        with self._lock:
+            if not self.state_path:
+                if self._state is None:
+                    self._state = self._initial_state()
+                yield self._state
+                return
+            fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.read(fd, 4096)
+                try:
+                    state = json.loads(raw) if raw else self._initial_state()
+                except ValueError:
+                    state = self._initial_state()
+                yield state
+                payload = json.dumps(state).encode("utf-8")
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, payload)
+            finally:
+                os.close(fd)  # Libera el flock
+
+    def _refill(self, state: Dict[str, float], now: float):
+        elapsed = max(0.0, now - state["updated"])
+        for kind, rate in self.rates.items():
+            if rate:
+                state[kind] = min(self.capacity[kind], state[kind] + elapsed * rate)
+        state["updated"] = now
+
+    def reserve(self, tokens: int) -> float:
+        """Descuenta una petición de `tokens` y devuelve cuántos segundos hay que esperar antes de enviarla."""
+        with self._shared_state() as state:
+            now = time.time()
+            self._refill(state, now)
+            wait = max(0.0, state["blocked_until"] - now)
+            for kind, amount in (("requests", 1), ("tokens", tokens)):
+                rate = self.rates[kind]
+                if rate:
+                    state[kind] -= amount
+                    if state[kind] < 0:
+                        wait = max(wait, -state[kind] / rate)
+            return wait
+
+    def acquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            METRICS.count("rate_limit_waits")
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            METRICS.count("rate_limit_waits")
+            await asyncio.sleep(wait)
+
+    def observe(self, headers: Any, estimated: int, used: Optional[int] = None):
+        """Ajusta el estado con las cabeceras de una respuesta y los tokens realmente consumidos."""
+        remaining = {kind: _header_float(headers, f"x-ratelimit-remaining-{kind}") for kind in self.rates}
+        with self._shared_state() as state:
+            self._refill(state, time.time())
+            for kind, value in remaining.items():
+                if value is not None and self.rates[kind]:
+                    state[kind] = min(state[kind], value)
+            if used is not None and self.rates["tokens"]:
+                # La reserva de max_tokens se libera en cuanto la petición termina
+                state["tokens"] = min(self.capacity["tokens"], state["tokens"] + estimated - used)
+
+    def penalize(self, retry_after: float):
+        """Tras un 429, bloquea a todos los clientes durante `retry_after` segundos."""
+        with self._shared_state() as state:
+            now = time.time()
+            self._refill(state, now)
+            state["blocked_until"] = max(state["blocked_until"], now + retry_after)
+            for kind in self.rates:
+                state[kind] = min(state[kind], 0.0)
+
+
+# Limitador compartido por el proceso; None = sin límite local (los reintentos siguen activos)
+LIMITER: Optional[RateLimiter] = None
+
+
+def configure_rate_limiter(rpm: Optional[float] = None, tpm: Optional[float] = None,
+                           state_path: Optional[str] = None) -> Optional[RateLimiter]:
+    global LIMITER
+    LIMITER = RateLimiter(rpm, tpm, state_path) if (rpm or tpm) else None
+    return LIMITER
+
+
+def _header_float(headers: Any, name: str) -> Optional[float]:
+    value = headers.get(name) if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryable_errors():
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+    return RateLimitError, APIConnectionError, InternalServerError
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Espera antes del siguiente intento: `Retry-After` del servicio o backoff exponencial con jitter completo."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    retry_after_ms = _header_float(headers, "retry-after-ms")
+    retry_after = retry_after_ms / 1000 if retry_after_ms is not None else _header_float(headers, "retry-after")
+    if retry_after is not None:
+        # Un poco de jitter evita que todos los clientes bloqueados reintenten en el mismo instante
+        return retry_after * (1 + random.uniform(0, 0.1))
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _on_error(error: Exception, attempt: int, max_retries: int, limiter: Optional[RateLimiter] = None) -> float:
+    """Registra el fallo y devuelve la espera antes de reintentar, o relanza si no quedan intentos."""
+    if attempt >= max_retries:
+        METRICS.count("retries_exhausted")
+        raise error
+    delay = retry_delay(error, attempt)
+    METRICS.count("retries")
+    if getattr(error, "status_code", None) == 429:
+        METRICS.count("rate_limited")
+        if limiter:
+            limiter.penalize(delay)
+    return delay
+
+
+def _on_success(raw: Any, response: Any, estimated: int, limiter: Optional[RateLimiter] = None):
+    if limiter:
+        usage = getattr(response, "usage", None)
+        limiter.observe(getattr(raw, "headers", None), estimated, getattr(usage, "total_tokens", None))
+
+
+def call_with_retries(call: Callable[[], Any], estimated: int, max_retries: int = MAX_RETRIES,
+                      limiter: Optional[RateLimiter] = None):
+    """
+    Ejecuta `call` (que devuelve `(respuesta_cruda, respuesta)`) respetando el limitador y
+    reintentando 429, errores de conexión y 5xx. Los demás errores se propagan sin reintentar.
+
+    `limiter` es el del deployment que recibe la petición (por ejemplo, un backend del pool);
+    por defecto, el limitador del proceso.
+    """
+    limiter = limiter or LIMITER
+    retryable = _retryable_errors()
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.acquire(estimated)
+        try:
+            raw, response = call()
+        except retryable as e:
+            time.sleep(_on_error(e, attempt, max_retries, limiter))
+            continue
+        _on_success(raw, response, estimated, limiter)
+        return response
+
+
+async def call_with_retries_async(call: Callable[[], Any], estimated: int, max_retries: int = MAX_RETRIES,
+                                  limiter: Optional[RateLimiter] = None):
+    """Versión asíncrona de call_with_retries; `call` devuelve una corrutina."""
+    limiter = limiter or LIMITER
+    retryable = _retryable_errors()
+    for attempt in range(max_retries + 1):
+        if limiter:
+            await limiter.acquire_async(estimated)
+        try:
+            raw, response = await call()
+        except retryable as e:
+            await asyncio.sleep(_on_error(e, attempt, max_retries, limiter))
+            continue
+        _on_success(raw, response, estimated, limiter)
+        return response
@@ -0,0 +1,129 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from aggregation import engagement_weight
+from ingestion import iter_records
+from metrics import METRICS
+
+# Fracciones acumuladas de comentarios (por interacción descendente) que forman cada pasada
+PRIORITY_TIERS = (0.01, 0.1, 0.5, 1.0)
+# Peticiones en vuelo por tramo del presupuesto: acota cuánto puede excederse el límite
+SLICE_CALLS = 4
+
+
+def engagement(df: pd.DataFrame) -> np.ndarray:
+    """Peso de interacción de cada fila, el mismo que usan las medias ponderadas de la agregación."""
+    retweets = pd.to_numeric(df["retweets"], errors="coerce").to_numpy() if "retweets" in df else 0
+    likes = pd.to_numeric(df["likes"], errors="coerce").to_numpy() if "likes" in df else 0
+    return engagement_weight(retweets, likes) * np.ones(len(df))
+
+
+def by_engagement(df: pd.DataFrame) -> pd.DataFrame:
+    """Ordena un bloque por interacción descendente, conservando el orden del archivo en los empates."""
+    return df.iloc[np.argsort(-engagement(df), kind="stable")]
+
+
+def tier_thresholds(file_path: str, chunk_size: int, tiers=PRIORITY_TIERS) -> List[float]:
+    """
+    Primera pasada: lee solo la interacción de cada fila y devuelve el peso mínimo de cada
+    tramo. La memoria es de un float por comentario.
+    """
+    weights = np.concatenate([engagement(chunk) for chunk in iter_records(file_path, chunk_size)] or [np.zeros(0)])
+    if not len(weights):
+        return []
+    ordered = np.sort(weights)[::-1]
+    return [float(ordered[min(len(ordered), max(1, int(np.ceil(fraction * len(ordered))))) - 1])
+            for fraction in tiers]
+
+
+def prioritized_chunks(file_path: str, chunk_size: int, tiers=PRIORITY_TIERS) -> Iterator[pd.DataFrame]:
+    """
+    Entrega los comentarios de `file_path` en pasadas de interacción descendente: primero el 1 %
+    con más interacción, luego hasta el 10 %, etc. Cada pasada vuelve a leer el archivo y toma las
+    filas cuyo peso cae en su tramo; dentro de cada bloque las filas se ordenan por interacción.
+    """
+    thresholds = tier_thresholds(file_path, chunk_size, tiers)
+    upper = np.inf
+    for lower in thresholds:
+        if lower >= upper:
+            continue
+        pending: List[pd.DataFrame] = []
+        size = 0
+        for chunk in iter_records(file_path, chunk_size):
+            weights = engagement(chunk)
+            selected = chunk[(weights >= lower) & (weights < upper)]
+            if selected.empty:
+                continue
+            pending.append(selected)
+            size += len(selected)
+            if size >= chunk_size:
+                yield by_engagement(pd.concat(pending))
+                pending, size = [], 0
+        if pending:
+            yield by_engagement(pd.concat(pending))
+        upper = lower
+
+
+class ScoringBudget:
+    """
+    Límite de tokens y/o llamadas al modelo para una ejecución, medido con METRICS.
+
+    Los tokens por comentario se estiman con lo consumido hasta el momento, así que el exceso
+    máximo sobre el límite es un tramo de peticiones en vuelo.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, max_calls: Optional[int] = None):
+        self.token_budget = token_budget
+        self.max_calls = max_calls
+        self.texts_sent = 0
+        self.calls_at_start = self._calls()
+        self.tokens_at_start = self._tokens()
+
+    @staticmethod
+    def _calls() -> int:
+        return sum(data["count"] for data in METRICS.calls.values())
+
+    @staticmethod
+    def _tokens() -> int:
+        return METRICS.tokens["prompt"] + METRICS.tokens["completion"]
+
+    def allowance(self, texts_per_call: int, slice_size: int) -> int:
+        """Cuántos comentarios pueden enviarse en el siguiente tramo (0 si el presupuesto se agotó)."""
+        allowed = slice_size
+        calls = self._calls() - self.calls_at_start
+        if self.max_calls is not None:
+            allowed = min(allowed, max(0, self.max_calls - calls) * texts_per_call)
+        if self.token_budget is not None:
+            tokens = self._tokens() - self.tokens_at_start
+            remaining = self.token_budget - tokens
+            if remaining <= 0:
+                return 0
+            if self.texts_sent and tokens:
+                allowed = min(allowed, max(1, int(remaining / (tokens / self.texts_sent))))
+        return allowed
+
+    def wrap(self, scorer: Callable[[List[str]], List[Dict[str, Any]]], texts_per_call: int = 1,
+             concurrency: int = 1) -> Callable[[List[str]], List[Optional[Dict[str, Any]]]]:
+        """
+        Envuelve un scorer para que envíe los textos por tramos mientras quede presupuesto. Los
+        textos que no alcanzan a enviarse quedan como None.
+        """
+        slice_size = max(1, texts_per_call) * max(1, concurrency) * SLICE_CALLS
+
+        def score(texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+            results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+            start = 0
+            while start < len(texts):
+                allowed = self.allowance(max(1, texts_per_call), slice_size)
+                if allowed <= 0:
+                    METRICS.count("budget_skipped", len(texts) - start)
+                    break
+                part = texts[start:start + allowed]
+                results[start:start + len(part)] = scorer(part)
+                self.texts_sent += len(part)
+                start += len(part)
+            return results
+
+        return score
@@ -1,60 +1,61 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from config import AZURE_PROJECT_CONNECTION_STRING, MODEL_DEPLOYMENT
-from auth_helper import get_azure_credential
-
-# Add references
-from azure.identity import DefaultAzureCredential
-from azure.ai.projects import AIProjectClient
-from azure.ai.inference.models import SystemMessage, UserMessage, AssistantMessage
-from openai import AzureOpenAI, BadRequestError
-from azure.ai.ml import MLClient
+from functools import lru_cache
+from metrics import METRICS
+from ratelimit import MAX_RETRIES, call_with_retries, call_with_retries_async, estimate_tokens
 import os
 from dotenv import load_dotenv
+import asyncio
 import json
 import logging
+import re
+import tempfile
+import time
+
+# Los SDK de Azure y OpenAI se importan dentro de cada función: una ejecución con --force-openai
+# no paga la importación de azure.ai.ml y viceversa.
 
 API_VERSION = "2024-12-01-preview"
+AGENT_ENDPOINT_NAME = "vinotinto-sentiment-agent"
+# Caché en disco del endpoint resuelto para evitar la consulta al plano de control en cada arranque
+ENDPOINT_CACHE_PATH = ".agent_endpoint_cache.json"
+ENDPOINT_CACHE_TTL = 600
+# Límite de tokens de respuesta; Azure lo descuenta completo de la cuota TPM al recibir la petición
+MAX_COMPLETION_TOKENS = 4096
+
+# Cambiar al modificar SYSTEM_PROMPT o las instrucciones de Sentimental.agent.yaml: invalida los
+# resultados guardados en caché
+PROMPT_VERSION = "v1"
+# Ídem para COMPACT_PROMPT, COMPACT_CRITERIA y los esquemas de respuesta del modo compacto
+COMPACT_PROMPT_VERSION = "compact-v2"
+# Tope de tokens de respuesta del modo compacto: {"score": -0.35, "label": "negativo"} ocupa ~15
+# tokens, y cada elemento de un lote (con su "id") ~20. Un tope ajustado reserva menos cuota TPM
+# y corta una respuesta desbocada en lugar de pagarla.
+COMPACT_MAX_TOKENS = 40
+COMPACT_TOKENS_PER_ITEM = 32
+SENTIMENT_LABELS = ["positivo", "neutral", "negativo"]
+
+# Definición del agente Sentimental en Azure AI Foundry: sus `instructions` son la fuente de los prompts
+AGENT_DEFINITION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sentimental.agent.yaml")
+
+
+def load_agent_definition(path: str = AGENT_DEFINITION_PATH) -> Dict[str, Any]:
+    import yaml
+
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
 
-# Prompt inicial personalizado
-SYSTEM_PROMPT = """
-Finalidad
-Tu finalidad es realizar un análisis de sentimiento de comentarios sobre los partidos de la Vinotinto en español (con acento venezolano), asignando a cada comentario un puntaje entre –1 (muy negativo) y +1 (muy positivo), clasificándolos como "positivo", "neutral" o "negativo", y además extraer todos los hashtags y palabras clave relevantes.
-
-Objetivos
-* Ingestar datos desde CSV, texto plano o JSON, estableciendo un pipeline de ingesta confiable y escalable que garantice la integridad y calidad de los datos.
-* Extraer y almacenar hashtags y palabras clave relevantes (por ejemplo, #Vinotinto, #Mundial2026) para identificar temas recurrentes y tendencias emergentes en las conversaciones sobre la Vinotinto.
-* Calcular un puntaje de sentimiento entre –1 (muy negativo) y +1 (muy positivo) mediante técnicas de NLP para determinar el tono emocional de cada comentario, y clasificarlo como "positivo", "neutral" o "negativo".
-* Detectar posibles expresiones de sarcasmo para mejorar la precisión del análisis de sentimientos y corregir interpretaciones erróneas.
-* Considerar métricas de interacción (retweets y "me gusta") para ponderar el impacto de cada comentario en la valoración global del sentimiento.
-* Ignorar enlaces e imágenes presentes en los textos para enfocar el análisis exclusivamente en el contenido textual relevante.
-* Identificar y analizar patrones de sentimiento a lo largo del tiempo, detectando cambios en la percepción de la Vinotinto y posibles picos de opinión pública.
-* Extraer y analizar patrones lexicográficos y de hashtag para descubrir correlaciones entre términos y niveles de sentimiento.
-* Permitir la exportación de los resultados en formato JSON estructurado para facilitar su integración con otros sistemas y dashboards de seguimiento.
-
-Indicaciones generales
-* Asume que todos los comentarios se refieren a partidos de la Vinotinto y se expresan en español con acento venezolano.
-* intuye el estado del partido: comentarios posteriores a un gol de la Vinotinto o cuando vamos ganando tienden a ser positivos, y comentarios cuando la selección va perdiendo o recibe gol tienden a ser negativos
-* Detecta expresiones de sarcasmo y críticas en faltas o jugadas polémicas para ajustar correctamente la polaridad del sentimiento.
-* Considera la cantidad de retweets y "me gusta" para ponderar la influencia de cada comentario en la valoración global del sentimiento, asignando mayor peso a los retweets según métricas de impacto en Twitter.
-* Asume que los datos pueden llegar en CSV, texto plano o JSON, e integra un paso de extracción de datos (tweet_id, username, text, created_at, retweets, likes) previo al análisis de sentimiento.
-* Extrae y analiza patrones de comportamiento y tendencias a partir de hashtags y palabras clave relevantes (por ejemplo, #Vinotinto, #Mundial2026).
-
-Instrucciones paso a paso
-*Acepta el archivo o texto en formato CSV, JSON o texto plano, asegurando que cada registro contenga al menos los campos `tweet_id`, `username`, `text`, `created_at` y, opcionalmente, `retweets` y `likes`.
-*Elimina o ignora enlaces (`http://…`, `https://…`) e imágenes, y normaliza el texto (minúsculas, eliminación de caracteres especiales y tokenización).
-*Extrae del campo `text` los hashtags (p. ej. `#Vinotinto`) y palabras clave relevantes ("golazo", "falta", "penal"), almacenándolos en listas separadas.
-*Recupera las métricas de interacción (`retweets`, `likes`) y asócialas a cada comentario para posterior ponderación.
-*Interpreta el campo `created_at` para intuir el momento del partido (antes o después de un gol) y el estado actual (ganando/perdiendo) de la Vinotinto.
-* Calcula un puntaje continuo de sentimiento entre –1 y +1 con un modelo entrenado en español venezolano, aplicando ajustes positivos tras goles de la Vinotinto y negativos tras goles en contra.
-*Detecta expresiones de sarcasmo y críticas en faltas o jugadas polémicas para corregir la polaridad del sentimiento cuando el modelo inicial pueda fallar.
-*Pondera el puntaje según métricas de interacción: mayor peso a comentarios con más retweets y "me gusta".
-*Clasifica cada comentario en "positivo" (score >0.2), "neutral" (–0.2 ≤ score ≤ 0.2) o "negativo" (score < –0.2).
-*Agrega los resultados por partido o por día para identificar picos de sentimiento y tendencias, relacionándolos con hashtags y palabras clave.
-*Construye la salida en JSON con los campos:
-
- `{ "tweet_id": "...", "username": "...", "text": "...", "created_at": "...", "score": 0.XX, "label": "positivo|neutral|negativo", "hashtags": ["#..."], "keywords": ["..."], "retweets": N, "likes": M }`
-*Ofrece la opción de exportar todos los resultados en un archivo JSON o CSV para su integración en dashboards.
-*Revisa muestras aleatorias de comentarios ya clasificados para validar y ajustar umbrales de sentimiento y reglas de detección de sarcasmo.
+
+def _normalize_instructions(instructions: str) -> str:
+    """Reemplaza las comillas tipográficas y los espacios de no separación que deja el editor de Foundry."""
+    text = instructions.translate({0x201C: '"', 0x201D: '"', 0x00A0: " ", 0x202F: " "})
+    return re.sub(r"(?<=\S) {2,}(?=\S)", " ", text)
+
+
+AGENT_INSTRUCTIONS = _normalize_instructions(load_agent_definition()["instructions"])
+
+# Prompt inicial personalizado: las instrucciones del agente más el formato de respuesta
+SYSTEM_PROMPT = "\n" + AGENT_INSTRUCTIONS + """
 
 IMPORTANTE: Devuelve SIEMPRE la respuesta SOLO en formato JSON válido, sin explicaciones ni texto adicional, con la siguiente estructura exacta:
 {
@@ -67,32 +68,223 @@ IMPORTANTE: Devuelve SIEMPRE la respuesta SOLO en formato JSON válido, sin expl
 }
 """
 
+# Instrucciones adicionales para el modo por lotes (varios comentarios por petición)
+BATCH_PROMPT = """
+MODO LOTE: el mensaje del usuario es un arreglo JSON de objetos {"id": int, "text": "..."}.
+Analiza cada comentario por separado con los criterios anteriores y devuelve SOLO un arreglo JSON válido,
+con un objeto por comentario y el mismo "id" recibido, con la siguiente estructura exacta:
+[
+  {"id": int, "score": float, "label": "positivo|neutral|negativo"}
+]
+"""
+
+# Criterios de puntaje que conserva la variante compacta: cada uno es el comienzo de una línea de
+# las instrucciones del agente, que se copia tal cual
+COMPACT_CRITERIA = (
+    "Calcula un puntaje continuo de sentimiento",
+    "intuye el estado del partido",
+    "Detecta expresiones de sarcasmo",
+    "Ignorar enlaces e imágenes",
+    "Clasifica cada comentario",
+)
+
+
+def _instruction_lines(instructions: str, prefixes) -> List[str]:
+    """Primera línea de `instructions` que empieza por cada prefijo (sin la viñeta)."""
+    lines = [line.lstrip("* ").strip() for line in instructions.splitlines()]
+    selected = []
+    for prefix in prefixes:
+        match = next((line for line in lines if line.startswith(prefix)), None)
+        if match is None:
+            raise ValueError(f"Las instrucciones de {AGENT_DEFINITION_PATH} no tienen la línea '{prefix}...'")
+        selected.append(match)
+    return selected
+
+
+# Variante compacta de SYSTEM_PROMPT: conserva solo los criterios de puntaje del agente. Hashtags,
+# palabras clave e interacción se calculan localmente, así que no se piden al modelo; el formato de
+# la respuesta lo fija el esquema JSON (structured outputs).
+COMPACT_PROMPT = "\n".join(
+    ["Analiza el sentimiento de un comentario sobre un partido de la Vinotinto, en español venezolano."]
+    + [f"- {line}" for line in _instruction_lines(AGENT_INSTRUCTIONS, COMPACT_CRITERIA)]
+    + ["Responde solo con el JSON pedido."]
+)
+
+COMPACT_BATCH_PROMPT = """
+Lote: el usuario envía un arreglo JSON de {"id", "text"}. Evalúa cada comentario por separado y devuelve un resultado por comentario con su mismo "id"."""
+
+_SENTIMENT_PROPERTIES = {
+    "score": {"type": "number"},
+    "label": {"type": "string", "enum": SENTIMENT_LABELS},
+}
+SENTIMENT_SCHEMA = {
+    "type": "object",
+    "properties": _SENTIMENT_PROPERTIES,
+    "required": ["score", "label"],
+    "additionalProperties": False,
+}
+# Structured outputs exige un objeto en la raíz: el lote va dentro de "results"
+BATCH_SENTIMENT_SCHEMA = {
+    "type": "object",
+    "properties": {"results": {"type": "array", "items": {
+        "type": "object",
+        "properties": {"id": {"type": "integer"}, **_SENTIMENT_PROPERTIES},
+        "required": ["id", "score", "label"],
+        "additionalProperties": False,
+    }}},
+    "required": ["results"],
+    "additionalProperties": False,
+}
+
+
+class PromptVariant:
+    """
+    Prompt del sistema y parámetros de la petición que lo acompañan. `version` forma parte de la
+    clave de caché, así que cada variante guarda sus propios resultados.
+    """
+
+    def __init__(self, name: str, version: str, system_prompt: str, batch_prompt: str,
+                 structured: bool = False, max_tokens: int = MAX_COMPLETION_TOKENS, tokens_per_item: int = 0):
+        self.name = name
+        self.version = version
+        self.system_prompt = system_prompt
+        self.batch_prompt = batch_prompt
+        self.structured = structured
+        self.max_tokens = max_tokens
+        self.tokens_per_item = tokens_per_item
+
+    def request_options(self, size: int = 0) -> Dict[str, Any]:
+        """
+        `max_tokens` y, en modo estructurado, `response_format` de una petición; `size` > 0 para
+        un lote de `size` comentarios.
+        """
+        options: Dict[str, Any] = {
+            "max_tokens": min(MAX_COMPLETION_TOKENS, self.max_tokens + size * self.tokens_per_item)
+            if size and self.tokens_per_item else self.max_tokens,
+        }
+        if self.structured:
+            options["response_format"] = {"type": "json_schema", "json_schema": {
+                "name": "sentiment_batch" if size else "sentiment",
+                "strict": True,
+                "schema": BATCH_SENTIMENT_SCHEMA if size else SENTIMENT_SCHEMA,
+            }}
+        return options
+
+
+PROMPT_VARIANTS = {
+    "full": PromptVariant("full", PROMPT_VERSION, SYSTEM_PROMPT, BATCH_PROMPT),
+    "compact": PromptVariant("compact", COMPACT_PROMPT_VERSION, COMPACT_PROMPT, COMPACT_BATCH_PROMPT,
+                             structured=True, max_tokens=COMPACT_MAX_TOKENS, tokens_per_item=COMPACT_TOKENS_PER_ITEM),
+}
+_PROMPT = PROMPT_VARIANTS["full"]
+
+
+def configure_prompt(name: str = "full") -> PromptVariant:
+    """
+    Elige la variante de prompt de todo el proceso (como configure_rate_limiter). `compact` usa
+    COMPACT_PROMPT con structured outputs, que requiere un deployment que los soporte
+    (gpt-4o 2024-08-06 o posterior).
+    """
+    global _PROMPT
+    if name not in PROMPT_VARIANTS:
+        raise ValueError(f"Variante de prompt desconocida: {name}")
+    _PROMPT = PROMPT_VARIANTS[name]
+    return _PROMPT
+
+
+def active_prompt() -> PromptVariant:
+    return _PROMPT
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def get_chat_client() -> Any:
+@lru_cache(maxsize=None)
+def get_chat_client(azure_endpoint: str = None, azure_api_key: str = None) -> Any:
     """
     Inicializa el cliente de chat de Azure OpenAI usando variables de entorno y el SDK recomendado.
+
+    El cliente se reutiliza durante todo el proceso. `azure_endpoint` y `azure_api_key` reemplazan
+    a las variables de entorno (p. ej. para cada backend de un pool, ver backends.py).
     """
+    from openai import AzureOpenAI
+
     load_dotenv()
-    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-    azure_api_key = os.getenv("AZURE_OPENAI_KEY")
+    azure_endpoint = azure_endpoint or os.getenv("AZURE_OPENAI_ENDPOINT")
+    azure_api_key = azure_api_key or os.getenv("AZURE_OPENAI_KEY")
     if not azure_endpoint or not azure_api_key:
         raise ValueError("Faltan variables de entorno: AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY")
+    # Los reintentos los gestiona ratelimit.call_with_retries junto con el limitador compartido
     client = AzureOpenAI(
         api_version=API_VERSION,
         azure_endpoint=azure_endpoint,
-        api_key=azure_api_key
+        api_key=azure_api_key,
+        max_retries=0
     )
     return client
 
 
+class AgentEndpoint:
+    """Endpoint del agente ya resuelto, invocado a través de MLClient."""
+
+    def __init__(self, ml_client, name: str, scoring_uri: str = None):
+        self.ml_client = ml_client
+        self.name = name
+        self.scoring_uri = scoring_uri
+
+    def invoke(self, input_data: Dict[str, Any]) -> Any:
+        # MLClient solo acepta la petición como archivo
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+            json.dump(input_data, f, ensure_ascii=False)
+        try:
+            return self.ml_client.online_endpoints.invoke(endpoint_name=self.name, request_file=f.name)
+        finally:
+            os.remove(f.name)
+
+
+def _endpoint_cache_key() -> str:
+    return "/".join([os.getenv("AZURE_ML_SUBSCRIPTION") or "", os.getenv("AZURE_ML_RESOURCE_GROUP") or "",
+                     os.getenv("AZURE_ML_WORKSPACE") or "", AGENT_ENDPOINT_NAME])
+
+
+def _load_cached_endpoint() -> Dict[str, Any]:
+    """Devuelve el endpoint guardado en disco si sigue vigente."""
+    try:
+        with open(ENDPOINT_CACHE_PATH, encoding="utf-8") as f:
+            entry = json.load(f).get(_endpoint_cache_key())
+    except (OSError, ValueError):
+        return None
+    if entry and time.time() - entry.get("resolved_at", 0) < ENDPOINT_CACHE_TTL:
+        return entry
+    return None
+
+
+def _save_cached_endpoint(name: str, scoring_uri: str):
+    try:
+        with open(ENDPOINT_CACHE_PATH, encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    entries[_endpoint_cache_key()] = {"name": name, "scoring_uri": scoring_uri, "resolved_at": time.time()}
+    try:
+        with open(ENDPOINT_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+    except OSError as e:
+        logger.warning(f"No se pudo guardar la caché del endpoint: {e}")
+
+
+@lru_cache(maxsize=None)
 def get_agent_client() -> Any:
     """
     Inicializa el cliente del agente Sentimental usando Azure ML SDK.
+
+    El endpoint resuelto se memoriza en el proceso y en disco durante ENDPOINT_CACHE_TTL segundos,
+    de modo que los arranques seguidos no repiten la consulta (ni el aprovisionamiento) del endpoint.
     """
+    from azure.ai.ml import MLClient
+    from auth_helper import get_azure_credential
+
     load_dotenv()
     logger.info("Inicializando cliente de Azure ML...")
     
@@ -104,11 +296,16 @@ def get_agent_client() -> Any:
             resource_group_name=os.getenv("AZURE_ML_RESOURCE_GROUP"),
             workspace_name=os.getenv("AZURE_ML_WORKSPACE")
         )
+
+        cached = _load_cached_endpoint()
+        if cached:
+            logger.info("Usando endpoint resuelto previamente")
+            return AgentEndpoint(client, cached["name"], cached.get("scoring_uri"))
         
         # Get or create the agent endpoint
         try:
             logger.info("Intentando obtener endpoint existente...")
-            agent = client.online_endpoints.get("vinotinto-sentiment-agent")
+            agent = client.online_endpoints.get(AGENT_ENDPOINT_NAME)
             logger.info("Endpoint encontrado")
         except Exception:
             logger.info("Creando nuevo endpoint...")
@@ -116,7 +313,7 @@ def get_agent_client() -> Any:
             from azure.ai.ml.entities import ManagedOnlineEndpoint, ManagedOnlineDeployment
             
             endpoint = ManagedOnlineEndpoint(
-                name="vinotinto-sentiment-agent",
+                name=AGENT_ENDPOINT_NAME,
                 description="Vinotinto Sentiment Analysis Agent"
             )
             agent = client.online_endpoints.begin_create_or_update(endpoint).result()
@@ -131,67 +328,441 @@ def get_agent_client() -> Any:
                 instance_count=1
             )
             client.online_deployments.begin_create_or_update(deployment).result()
-        
-        return agent
+
+        scoring_uri = getattr(agent, "scoring_uri", None)
+        _save_cached_endpoint(agent.name, scoring_uri)
+        return AgentEndpoint(client, agent.name, scoring_uri)
             
     except Exception as e:
         logger.error(f"Error initializing Azure ML client: {str(e)}")
         raise
 
 
-def get_sentiment_score(text: str, client, model_deployment: str = None) -> Dict[str, Any]:
+def _fallback_result(label: str = "neutral", failure: Optional[str] = None) -> Dict[str, Any]:
     """
-    Envía el texto al modelo generativo o al agente Sentimental y obtiene el puntaje de sentimiento
+    Resultado por defecto cuando no se puede obtener un puntaje válido.
+
+    `failure` indica el motivo (content_filter, error, invalid_response, agent_error); chat_app
+    registra esos comentarios en la cola de fallidos (ver deadletter.py).
     """
-    if model_deployment:  # Usar modelo OpenAI directo si se proporciona el deployment
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": text}
-        ]
+    result = {"score": 0, "label": label, "hashtags": [], "keywords": []}
+    if failure:
+        result["failure"] = failure
+    return result
+
+
+def _build_messages(text: str) -> List[Dict[str, str]]:
+    """Construye los mensajes de chat para un comentario."""
+    return [
+        {"role": "system", "content": _PROMPT.system_prompt},
+        {"role": "user", "content": text}
+    ]
+
+
+def _parse_result(result_str: str) -> Dict[str, Any]:
+    """Intenta extraer JSON de la respuesta aunque venga rodeado de texto."""
+    try:
+        # Con structured outputs la respuesta es exactamente el JSON del esquema
+        result = json.loads(result_str or "")
+        if isinstance(result, dict):
+            return result
+    except ValueError:
+        pass
+    match = re.search(r'{.*}', result_str or "", re.DOTALL)
+    if match:
         try:
-            response = client.chat.completions.create(
+            return json.loads(match.group(0))
+        except Exception:
+            pass
+    return _fallback_result(failure="invalid_response")
+
+
+def _build_batch_messages(texts: List[str]) -> List[Dict[str, str]]:
+    """Construye los mensajes de chat para un lote de comentarios identificados por posición."""
+    payload = [{"id": i, "text": text} for i, text in enumerate(texts)]
+    return [
+        {"role": "system", "content": _PROMPT.system_prompt + _PROMPT.batch_prompt},
+        {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+    ]
+
+
+def _parse_batch_result(result_str: str, size: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Extrae el arreglo JSON de una respuesta por lotes.
+
+    Devuelve solo los elementos válidos indexados por id; los ausentes o mal formados se omiten
+    para que el llamador los reintente.
+    """
+    try:
+        # Structured outputs: {"results": [...]}; si no, se busca el arreglo dentro del texto
+        items = json.loads(result_str or "")
+        if isinstance(items, dict):
+            items = items.get("results")
+    except ValueError:
+        match = re.search(r'\[.*\]', result_str or "", re.DOTALL)
+        if not match:
+            return {}
+        try:
+            items = json.loads(match.group(0))
+        except Exception:
+            return {}
+    parsed = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        idx, score = item.get("id"), item.get("score")
+        if not isinstance(idx, int) or not 0 <= idx < size or idx in parsed:
+            continue
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not isinstance(item.get("label"), str):
+            continue
+        parsed[idx] = {"score": score, "label": item["label"], "hashtags": [], "keywords": []}
+    return parsed
+
+
+def _split_pending(indices: List[int], parsed: Dict[int, Dict[str, Any]]) -> List[List[int]]:
+    """Agrupa los elementos pendientes de un lote para reintentarlos en peticiones más pequeñas."""
+    missing = [i for pos, i in enumerate(indices) if pos not in parsed]
+    if not missing:
+        return []
+    if len(missing) < len(indices):
+        return [missing]
+    half = len(missing) // 2
+    return [missing[:half], missing[half:]]
+
+
+def _build_agent_input(text: str) -> Dict[str, Any]:
+    """Formatea la entrada para el endpoint del agente."""
+    return {
+        "input_data": {
+            "text": text,
+            "parameters": {
+                "temperature": 0.1,
+                "max_tokens": 4096
+            }
+        }
+    }
+
+
+def _content(response) -> str:
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        # La respuesta llegó al tope de tokens: el JSON queda incompleto y el resultado se descarta
+        METRICS.count("completion_truncated")
+    return choice.message.content
+
+
+def _complete(client, messages: List[Dict[str, str]], model_deployment: str,
+              max_retries: int = MAX_RETRIES, size: int = 0) -> str:
+    """
+    Llama a chat completions registrando latencia y tokens en METRICS.
+
+    Pasa por el limitador de cuota y reintenta 429, errores de conexión y 5xx (ver ratelimit.py);
+    se usa la respuesta cruda para leer las cabeceras `x-ratelimit-remaining-*`. El tope de
+    respuesta y el formato dependen de la variante de prompt activa (`size` > 0 para un lote).
+    """
+    options = _PROMPT.request_options(size)
+
+    def _call():
+        start = time.perf_counter()
+        response = None
+        try:
+            raw = client.chat.completions.with_raw_response.create(
+                messages=messages,
+                temperature=0.1,
+                top_p=1.0,
+                model=model_deployment,
+                **options
+            )
+            response = raw.parse()
+        finally:
+            METRICS.record_call("openai", time.perf_counter() - start, getattr(response, "usage", None))
+        return raw, response
+
+    response = call_with_retries(_call, estimate_tokens(messages, options["max_tokens"]), max_retries)
+    return _content(response)
+
+
+async def _complete_async(client, messages: List[Dict[str, str]], model_deployment: str,
+                          max_retries: int = MAX_RETRIES, size: int = 0, limiter=None) -> str:
+    """Versión asíncrona de _complete; `limiter` sustituye al limitador del proceso (un backend del pool)."""
+    options = _PROMPT.request_options(size)
+
+    async def _call():
+        start = time.perf_counter()
+        response = None
+        try:
+            raw = await client.chat.completions.with_raw_response.create(
                 messages=messages,
-                max_tokens=4096,
                 temperature=0.1,
                 top_p=1.0,
-                model=model_deployment
+                model=model_deployment,
+                **options
             )
-            result_str = response.choices[0].message.content
-            # Intentar extraer JSON aunque venga rodeado de texto
-            import re
-            match = re.search(r'{.*}', result_str, re.DOTALL)
-            if match:
-                try:
-                    result = json.loads(match.group(0))
-                except Exception:
-                    result = {"score": 0, "label": "neutral", "hashtags": [], "keywords": []}
-            else:
-                result = {"score": 0, "label": "neutral", "hashtags": [], "keywords": []}
+            response = raw.parse()
+        finally:
+            METRICS.record_call("openai", time.perf_counter() - start, getattr(response, "usage", None))
+        return raw, response
+
+    response = await call_with_retries_async(_call, estimate_tokens(messages, options["max_tokens"]), max_retries,
+                                             limiter)
+    return _content(response)
+
+
+def _invoke_agent(text: str, client) -> Dict[str, Any]:
+    """Invoca el agente ML y normaliza su respuesta; los errores se propagan."""
+    start = time.perf_counter()
+    result = client.invoke(_build_agent_input(text))
+    METRICS.record_call("agent", time.perf_counter() - start)
+    if isinstance(result, str):
+        return json.loads(result)
+    if isinstance(result, dict):
+        return result.get("output", {"score": 0, "label": "neutral"})
+    return result
+
+
+def _parse_timed(result_str: str) -> Dict[str, Any]:
+    with METRICS.stage("json_extraction"):
+        return _parse_result(result_str)
+
+
+def _parse_batch_timed(result_str: str, size: int) -> Dict[int, Dict[str, Any]]:
+    with METRICS.stage("json_extraction"):
+        return _parse_batch_result(result_str, size)
+
+
+def _is_content_filter(error: Exception) -> bool:
+    """Un 400 de Azure solo es un rechazo del filtro de contenido si su código lo indica."""
+    return getattr(error, "code", None) == "content_filter"
+
+
+def _structured_hint() -> str:
+    # Un deployment sin structured outputs rechaza todas las peticiones del modo compacto con un 400
+    return " La variante compact requiere structured outputs en el deployment." if _PROMPT.structured else ""
+
+
+def _bad_request_result(text: str, error: Exception) -> Dict[str, Any]:
+    """
+    Resultado de un 400 para un comentario: el rechazo del filtro se guarda en la caché; una
+    petición inválida (parámetros o deployment incompatibles) es un error y se reintenta.
+    """
+    if _is_content_filter(error):
+        logger.warning(f"Error de filtro de contenido de Azure para el texto: '{text[:100]}...'. Detalles: {error}")
+        METRICS.count("content_filtered")
+        return _fallback_result("filtered_by_policy", "content_filter")
+    logger.error(f"Azure rechazó la petición para el texto: '{text[:100]}...'.{_structured_hint()} Detalles: {error}")
+    METRICS.count("errors")
+    return _fallback_result("error", "error")
+
+
+def get_sentiment_score(text: str, client, model_deployment: str = None) -> Dict[str, Any]:
+    """
+    Envía el texto al modelo generativo o al agente Sentimental y obtiene el puntaje de sentimiento
+    """
+    if model_deployment:  # Usar modelo OpenAI directo si se proporciona el deployment
+        from openai import BadRequestError
+
+        try:
+            result = _parse_timed(_complete(client, _build_messages(text), model_deployment))
         except BadRequestError as e:
-            logger.warning(f"Error de filtro de contenido de Azure para el texto: '{text[:100]}...'. Detalles: {e}")
-            result = {"score": 0, "label": "filtered_by_policy", "hashtags": [], "keywords": []}
+            result = _bad_request_result(text, e)
         except Exception as e:
             logger.error(f"Error inesperado al procesar el texto: '{text[:100]}...'. Detalles: {e}")
-            result = {"score": 0, "label": "error", "hashtags": [], "keywords": []}
+            METRICS.count("errors")
+            result = _fallback_result("error", "error")
     else:  # Usar agente ML
         try:
-            # Format the input for the endpoint
-            input_data = {
-                "input_data": {
-                    "text": text,
-                    "parameters": {
-                        "temperature": 0.1,
-                        "max_tokens": 4096
-                    }
-                }
-            }
-            result = client.invoke(input_data)
-            # Parse the result
-            if isinstance(result, str):
-                result = json.loads(result)
-            elif isinstance(result, dict):
-                result = result.get("output", {"score": 0, "label": "neutral"})
+            result = _invoke_agent(text, client)
         except Exception as e:
             logger.error(f"Error invoking agent: {str(e)}")
-            result = {"score": 0, "label": "neutral", "hashtags": [], "keywords": []}
-    return result
\ No newline at end of file
+            METRICS.count("errors")
+            result = _fallback_result(failure="agent_error")
+    return result
+
+
+def _log_batch_bad_request(size: int, error: Exception):
+    if _is_content_filter(error):
+        logger.warning(f"Lote de {size} comentarios rechazado por el filtro de contenido. Detalles: {error}")
+        METRICS.count("batch_content_filtered")
+    else:
+        logger.error(f"Azure rechazó la petición de un lote de {size} comentarios.{_structured_hint()} Detalles: {error}")
+        METRICS.count("batch_errors")
+
+
+def _score_batch(texts: List[str], indices: List[int], client, model_deployment: str,
+                 results: List[Dict[str, Any]]):
+    """Puntúa `indices` en una sola petición y reintenta por separado lo que falte."""
+    from openai import BadRequestError
+
+    if len(indices) == 1:
+        results[indices[0]] = get_sentiment_score(texts[indices[0]], client, model_deployment)
+        return
+    try:
+        content = _complete(client, _build_batch_messages([texts[i] for i in indices]), model_deployment,
+                            size=len(indices))
+        parsed = _parse_batch_timed(content, len(indices))
+    except BadRequestError as e:
+        # Un solo comentario filtrado invalida el lote completo: se divide para aislarlo
+        _log_batch_bad_request(len(indices), e)
+        parsed = {}
+    except Exception as e:
+        logger.error(f"Error inesperado al procesar un lote de {len(indices)} comentarios. Detalles: {e}")
+        METRICS.count("batch_errors")
+        parsed = {}
+    for pos, i in enumerate(indices):
+        if pos in parsed:
+            results[i] = parsed[pos]
+    for pending in _split_pending(indices, parsed):
+        METRICS.count("batch_retries")
+        _score_batch(texts, pending, client, model_deployment, results)
+
+
+def get_sentiment_scores(texts: List[str], client, model_deployment: str,
+                         batch_size: int = 20) -> List[Dict[str, Any]]:
+    """
+    Puntúa varios comentarios por petición para amortizar el prompt del sistema.
+
+    Los elementos ausentes o mal formados en la respuesta se reintentan en lotes más
+    pequeños hasta llegar a get_sentiment_score. El orden de salida coincide con `texts`.
+    """
+    results: List[Dict[str, Any]] = [None] * len(texts)
+    batch_size = max(1, batch_size)
+    for start in range(0, len(texts), batch_size):
+        indices = list(range(start, min(start + batch_size, len(texts))))
+        _score_batch(texts, indices, client, model_deployment, results)
+    return results
+
+
+def batch_api_request(custom_id: str, text: str, model_deployment: str) -> Dict[str, Any]:
+    """Línea del archivo de entrada de la Batch API para un comentario (misma petición que _complete)."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/chat/completions",
+        "body": {
+            "model": model_deployment,
+            "messages": _build_messages(text),
+            "temperature": 0.1,
+            "top_p": 1.0,
+            **_PROMPT.request_options(),
+        },
+    }
+
+
+def parse_batch_api_output(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte una línea del archivo de salida (o de errores) de la Batch API en un resultado.
+
+    Registra en METRICS los tokens consumidos y los rechazos del filtro de contenido.
+    """
+    response = entry.get("response") or {}
+    body = response.get("body") or {}
+    if response.get("status_code") == 200 and body.get("choices"):
+        usage = body.get("usage") or {}
+        METRICS.record_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        return _parse_timed(body["choices"][0].get("message", {}).get("content"))
+    error = body.get("error") or entry.get("error") or {}
+    if error.get("code") == "content_filter":
+        METRICS.count("content_filtered")
+        return _fallback_result("filtered_by_policy", "content_filter")
+    logger.error(f"Error en la Batch API para {entry.get('custom_id')}: {error.get('message', error)}")
+    METRICS.count("errors")
+    return _fallback_result("error", "error")
+
+
+def get_async_chat_client(azure_endpoint: str = None, azure_api_key: str = None) -> Any:
+    """
+    Inicializa el cliente asíncrono de Azure OpenAI con las mismas variables de entorno que get_chat_client.
+
+    No se memoriza: su pool de conexiones queda ligado al bucle de eventos que lo usa.
+    """
+    from openai import AsyncAzureOpenAI
+
+    load_dotenv()
+    azure_endpoint = azure_endpoint or os.getenv("AZURE_OPENAI_ENDPOINT")
+    azure_api_key = azure_api_key or os.getenv("AZURE_OPENAI_KEY")
+    if not azure_endpoint or not azure_api_key:
+        raise ValueError("Faltan variables de entorno: AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY")
+    client = AsyncAzureOpenAI(
+        api_version=API_VERSION,
+        azure_endpoint=azure_endpoint,
+        api_key=azure_api_key,
+        max_retries=0
+    )
+    return client
+
+
+async def get_sentiment_score_async(text: str, client, model_deployment: str = None) -> Dict[str, Any]:
+    """
+    Versión asíncrona de get_sentiment_score.
+
+    Con deployment usa un cliente AsyncAzureOpenAI; sin él, el agente ML (cuyo SDK es
+    síncrono) se invoca en un hilo para no bloquear el bucle de eventos.
+    """
+    if not model_deployment:
+        return await asyncio.to_thread(get_sentiment_score, text, client)
+    from openai import BadRequestError
+
+    try:
+        return _parse_timed(await _complete_async(client, _build_messages(text), model_deployment))
+    except BadRequestError as e:
+        return _bad_request_result(text, e)
+    except Exception as e:
+        logger.error(f"Error inesperado al procesar el texto: '{text[:100]}...'. Detalles: {e}")
+        METRICS.count("errors")
+        return _fallback_result("error", "error")
+
+
+async def _score_batch_async(texts: List[str], indices: List[int], client, model_deployment: str,
+                             results: List[Dict[str, Any]]):
+    """Versión asíncrona de _score_batch."""
+    from openai import BadRequestError
+
+    if len(indices) == 1:
+        results[indices[0]] = await get_sentiment_score_async(texts[indices[0]], client, model_deployment)
+        return
+    try:
+        content = await _complete_async(client, _build_batch_messages([texts[i] for i in indices]), model_deployment,
+                                        size=len(indices))
+        parsed = _parse_batch_timed(content, len(indices))
+    except BadRequestError as e:
+        _log_batch_bad_request(len(indices), e)
+        parsed = {}
+    except Exception as e:
+        logger.error(f"Error inesperado al procesar un lote de {len(indices)} comentarios. Detalles: {e}")
+        METRICS.count("batch_errors")
+        parsed = {}
+    for pos, i in enumerate(indices):
+        if pos in parsed:
+            results[i] = parsed[pos]
+    for pending in _split_pending(indices, parsed):
+        METRICS.count("batch_retries")
+        await _score_batch_async(texts, pending, client, model_deployment, results)
+
+
+async def score_texts_async(texts: List[str], client, model_deployment: str = None,
+                            concurrency: int = 8, batch_size: int = 1) -> List[Dict[str, Any]]:
+    """
+    Puntúa una lista de textos con a lo sumo `concurrency` peticiones en vuelo.
+
+    Con `batch_size` > 1 (solo modo OpenAI) cada petición agrupa varios textos.
+    Los resultados se devuelven en el mismo orden que `texts`.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _score(text: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await get_sentiment_score_async(text, client, model_deployment)
+
+    if batch_size <= 1 or not model_deployment:
+        return await asyncio.gather(*(_score(text) for text in texts))
+
+    results: List[Dict[str, Any]] = [None] * len(texts)
+
+    async def _score_chunk(indices: List[int]):
+        async with semaphore:
+            await _score_batch_async(texts, indices, client, model_deployment, results)
+
+    chunks = [list(range(start, min(start + batch_size, len(texts))))
+              for start in range(0, len(texts), batch_size)]
+    await asyncio.gather(*(_score_chunk(indices) for indices in chunks))
+    return results
@@ -0,0 +1,321 @@
+import argparse
+import heapq
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from aggregation import load_results
+from clean_data import SeenIds
+from deadletter import DeadLetterStore, dead_letter_path
+from export import open_exporter
+from utils import to_utc
+
+CHAT_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_app.py")
+PROGRESS_INTERVAL = 10.0
+MERGE_CHUNK_SIZE = 100000
+# Filas de cada corrida ordenada que se leen a la vez durante la mezcla
+MERGE_BLOCK_ROWS = 2000
+# Opciones de chat_app que el runner fija por shard, o que escribirían el mismo archivo desde
+# todos los shards (la agregación y el índice de términos se calculan sobre la salida combinada)
+RESERVED_OPTIONS = {"--output", "--shard", "--resume", "--metrics", "--prometheus", "--aggregate", "--term-index"}
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Interpreta `i/N` (0 <= i < N)."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard inválido: {spec} (se espera i/N)")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard fuera de rango: {spec}")
+    return index, count
+
+
+def shard_of(tweet_ids, count: int) -> np.ndarray:
+    """Shard de cada `tweet_id` según crc32 de su texto; estable entre procesos y máquinas."""
+    return np.fromiter((zlib.crc32(str(tweet_id).encode("utf-8")) % count for tweet_id in tweet_ids),
+                       dtype=np.int64, count=len(tweet_ids))
+
+
+def shard_output_path(output: str, index: int, count: int) -> str:
+    """`results.jsonl` -> `results.shard-1-of-4.jsonl` (también para directorios .parquet/.arrow)."""
+    base, ext = os.path.splitext(output.rstrip("/\\"))
+    return f"{base}.shard-{index}-of-{count}{ext}"
+
+
+def manifest_path(output: str) -> str:
+    return output.rstrip("/\\") + ".shards.json"
+
+
+def load_manifest(output: str) -> Optional[Dict[str, Any]]:
+    path = manifest_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(output: str, manifest: Dict[str, Any]):
+    path = manifest_path(output)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _shard_progress(shard_output: str) -> int:
+    """Comentarios exportados según el archivo de métricas que chat_app actualiza tras cada bloque."""
+    try:
+        with open(f"{shard_output}.metrics.json", encoding="utf-8") as f:
+            return json.load(f)["events"].get("tweets", 0)
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def run_shards(output: str, count: int, chat_args: List[str], workers: int,
+               only: Optional[List[int]] = None, force: bool = False,
+               progress_interval: float = PROGRESS_INTERVAL) -> bool:
+    """
+    Ejecuta `chat_app` una vez por shard en procesos independientes, con hasta `workers` a la vez.
+
+    El estado de cada shard queda en `<salida>.shards.json`. Los shards terminados se omiten en
+    ejecuciones posteriores (salvo `force`, que los vuelve a procesar desde cero), así que volver
+    a ejecutar el mismo comando solo relanza los que fallaron, y cada uno continúa desde su
+    checkpoint con --resume.
+    """
+    reserved = RESERVED_OPTIONS.intersection(arg.split("=")[0] for arg in chat_args)
+    if reserved:
+        raise ValueError(f"Opciones reservadas por el runner: {', '.join(sorted(reserved))}")
+    manifest = load_manifest(output)
+    if manifest is None or manifest["shards"] != count:
+        manifest = {"shards": count, "status": {}}
+    manifest["args"] = chat_args
+    status = manifest["status"]
+
+    pending = []
+    fresh = set()
+    for index in (only if only is not None else range(count)):
+        entry = status.setdefault(str(index), {"state": "pending"})
+        entry["output"] = shard_output_path(output, index, count)
+        entry["log"] = f"{entry['output']}.log"
+        if entry["state"] != "done":
+            pending.append(index)
+        elif force:
+            # Una exportación terminada no se reanuda: se reemplaza
+            pending.append(index)
+            fresh.add(index)
+    save_manifest(output, manifest)
+
+    running: Dict[int, Tuple[subprocess.Popen, Any, float]] = {}
+    last_report = time.monotonic()
+    while pending or running:
+        while pending and len(running) < workers:
+            index = pending.pop(0)
+            entry = status[str(index)]
+            log = open(entry["log"], "a", encoding="utf-8")
+            command = [sys.executable, CHAT_APP, *chat_args, "--shard", f"{index}/{count}",
+                       "--output", entry["output"]]
+            if index not in fresh:
+                command.append("--resume")
+            running[index] = (subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log, time.monotonic())
+            entry.update(state="running", returncode=None)
+            save_manifest(output, manifest)
+            print(f"Shard {index}/{count}: iniciado -> {entry['output']}")
+
+        time.sleep(0.2)
+        for index, (process, log, started) in list(running.items()):
+            returncode = process.poll()
+            if returncode is None:
+                continue
+            log.close()
+            del running[index]
+            entry = status[str(index)]
+            entry.update(state="done" if returncode == 0 else "failed", returncode=returncode,
+                         seconds=round(time.monotonic() - started, 1), tweets=_shard_progress(entry["output"]))
+            save_manifest(output, manifest)
+            if returncode == 0:
+                print(f"Shard {index}/{count}: completado, {entry['tweets']} comentarios en {entry['seconds']} s")
+            else:
+                print(f"Shard {index}/{count}: falló (código {returncode}), ver {entry['log']}")
+
+        if running and time.monotonic() - last_report >= progress_interval:
+            last_report = time.monotonic()
+            progress = ", ".join(f"{index}: {_shard_progress(status[str(index)]['output'])}" for index in sorted(running))
+            print(f"Progreso (comentarios por shard) {progress}")
+
+    failed = sorted(int(index) for index, entry in status.items() if entry["state"] != "done")
+    if failed:
+        print(f"Shards sin completar: {failed}. Vuelve a ejecutar el mismo comando para reintentarlos "
+              f"(o --only {' '.join(map(str, failed))})")
+    return not failed
+
+
+def _sort_keys(df: pd.DataFrame) -> List[Tuple]:
+    """
+    Clave de orden de cada fila: `created_at` UTC, `tweet_id` numérico y `tweet_id` como texto,
+    con los valores faltantes al final. Es la misma en cualquier bloque, así que ordena también
+    la mezcla de bloques ya ordenados.
+    """
+    times = to_utc(df["created_at"]).to_numpy()
+    numeric = pd.to_numeric(df["tweet_id"], errors="coerce").to_numpy(dtype=float)
+    no_time, no_id = np.isnat(times), np.isnan(numeric)
+    return list(zip(no_time.tolist(), np.where(no_time, 0, times.view(np.int64)).tolist(),
+                    no_id.tolist(), np.where(no_id, 0.0, numeric).tolist(), df["tweet_id"].astype(str).tolist()))
+
+
+def _write_run(df: pd.DataFrame, path: str, block_rows: int = MERGE_BLOCK_ROWS):
+    """Ordena un bloque y lo guarda en `path` como secuencia de `(claves, filas)` de hasta `block_rows`."""
+    # match_day es la columna de partición de Parquet/Arrow, no es parte del resultado
+    df = df.drop(columns="match_day", errors="ignore")
+    for column in ("hashtags", "keywords"):
+        if column in df:  # Las listas leídas de Parquet/Arrow llegan como arreglos de numpy
+            df[column] = [value.tolist() if isinstance(value, np.ndarray) else value for value in df[column]]
+    keys = _sort_keys(df)
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    records = df.to_dict(orient="records")
+    with open(path, "wb") as f:
+        for start in range(0, len(order), block_rows):
+            positions = order[start:start + block_rows]
+            pickle.dump(([keys[i] for i in positions], [records[i] for i in positions]), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(path: str) -> Iterator[Tuple[Tuple, Dict[str, Any]]]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                keys, records = pickle.load(f)
+            except EOFError:
+                return
+            yield from zip(keys, records)
+
+
+def merge_shards(inputs: List[str], output: str, chunk_size: int = MERGE_CHUNK_SIZE,
+                 temp_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Combina las salidas de los shards en una sola exportación ordenada por `created_at` y
+    `tweet_id`, sin duplicados (se conserva la primera aparición según el orden de `inputs`).
+    El resultado es el mismo sin importar cuántos shards se usaron. Las colas de fallidos de los
+    shards (`<shard>.deadletter.db`) se combinan en la de la salida, para reprocesarla con
+    deadletter.py.
+
+    Funciona fuera de memoria: cada bloque de `chunk_size` filas se filtra contra el conjunto de
+    ids vistos en disco de clean_data.py, se ordena y se guarda como una corrida temporal en
+    `temp_dir`; luego las corridas se mezclan en orden y se escriben por bloques. La memoria
+    queda acotada por un bloque de lectura más `MERGE_BLOCK_ROWS` filas por corrida.
+    """
+    seen = SeenIds(temp_dir)
+    run_dir = tempfile.mkdtemp(suffix=".merge", dir=temp_dir)
+    runs: List[str] = []
+    total = written = 0
+    try:
+        for path in inputs:
+            for chunk in load_results(path, chunksize=chunk_size):
+                total += len(chunk)
+                chunk = chunk[seen.add_new(chunk["tweet_id"].astype(str).tolist())]
+                if len(chunk):
+                    runs.append(os.path.join(run_dir, f"run-{len(runs):05d}.pkl"))
+                    _write_run(chunk, runs[-1])
+        if not total:
+            raise ValueError("No hay resultados que combinar")
+
+        exporter = open_exporter(output)
+        block = []
+        for _, record in heapq.merge(*(_read_run(run) for run in runs), key=itemgetter(0)):
+            block.append(record)
+            if len(block) >= chunk_size:
+                exporter.write(block)
+                written += len(block)
+                block = []
+        exporter.write(block)
+        written += len(block)
+        exporter.finalize()
+    finally:
+        seen.close()
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return {"read": total, "written": written, "duplicates": total - written,
+            "failures": merge_dead_letters(inputs, output)}
+
+
+def merge_dead_letters(inputs: List[str], output: str) -> int:
+    """Reemplaza la cola de fallidos de `output` por la unión de las de `inputs`. Devuelve cuántos fallos se copiaron."""
+    sources = [path for path in map(dead_letter_path, inputs) if os.path.exists(path)]
+    store = DeadLetterStore(dead_letter_path(output))
+    try:
+        store.clear()
+        return store.merge(sources) if sources else 0
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ejecución de chat_app en shards por tweet_id y combinación de resultados")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Ejecuta los shards en paralelo en esta máquina",
+                         usage="%(prog)s --shards N --output SALIDA [--workers W] -- ARGUMENTOS_DE_CHAT_APP")
+    run.add_argument("--shards", type=int, required=True, help="Número de shards")
+    run.add_argument("--output", required=True, help="Salida base; cada shard escribe <base>.shard-i-of-N.<ext>")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos simultáneos")
+    run.add_argument("--only", type=int, nargs="*", help="Ejecutar solo estos shards")
+    run.add_argument("--force", action="store_true", help="Volver a ejecutar también los shards completados")
+    run.add_argument("--merge", action="store_true", help="Combinar las salidas en --output al terminar todos")
+    run.add_argument("chat_args", nargs=argparse.REMAINDER, help="Argumentos para chat_app (tras --)")
+    merge = sub.add_parser("merge", help="Combina las salidas de los shards")
+    merge.add_argument("--output", required=True, help="Salida combinada (JSON, JSONL, CSV, Parquet o Arrow)")
+    merge.add_argument("--shards", type=int, help="Número de shards (si no se indican archivos con --inputs)")
+    merge.add_argument("--inputs", nargs="*", help="Salidas de shards a combinar, por ejemplo de otras máquinas")
+    merge.add_argument("--allow-incomplete", action="store_true",
+                       help="Combinar aunque el manifiesto indique shards sin completar")
+    merge.add_argument("--chunk-size", type=int, default=MERGE_CHUNK_SIZE,
+                       help="Filas por bloque al leer, ordenar y escribir; acota la memoria")
+    merge.add_argument("--temp-dir", help="Directorio de los archivos temporales de la combinación "
+                                          "(por defecto, el temporal del sistema)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        chat_args = args.chat_args[1:] if args.chat_args[:1] == ["--"] else args.chat_args
+        try:
+            ok = run_shards(args.output, args.shards, chat_args, max(1, args.workers), args.only, args.force)
+        except ValueError as e:
+            run.error(str(e))
+        if not ok:
+            sys.exit(1)
+        if args.merge:
+            stats = merge_shards([shard_output_path(args.output, i, args.shards) for i in range(args.shards)],
+                                 args.output)
+            print(f"Combinación completada: {stats['written']} comentarios, {stats['duplicates']} duplicados, "
+                  f"{stats['failures']} fallidos en la cola -> {args.output}")
+        return
+
+    if args.inputs:
+        inputs = args.inputs
+    elif args.shards:
+        manifest = load_manifest(args.output)
+        if manifest and not args.allow_incomplete:
+            incomplete = sorted(int(i) for i, entry in manifest["status"].items() if entry["state"] != "done")
+            if incomplete:
+                sys.exit(f"Shards sin completar según {manifest_path(args.output)}: {incomplete}")
+        inputs = [shard_output_path(args.output, i, args.shards) for i in range(args.shards)]
+    else:
+        parser.error("merge requiere --shards o --inputs")
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if missing:
+        sys.exit(f"No existen las salidas: {missing}")
+    stats = merge_shards(inputs, args.output, args.chunk_size, args.temp_dir)
+    print(f"Combinación completada: {stats['read']} leídos, {stats['written']} escritos, "
+          f"{stats['duplicates']} duplicados, {stats['failures']} fallidos en la cola -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
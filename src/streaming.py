@@ -0,0 +1,247 @@
+import csv
+import io
+import itertools
+import json
+import math
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from aggregation import engagement_weight
+from ingestion import OPTIONAL_FIELDS, REQUIRED_FIELDS
+from metrics import METRICS
+
+DEFAULT_MAX_LATENCY = 2.0
+DEFAULT_BUFFER_SIZE = 1000
+POLL_INTERVAL = 0.2
+# Espera mínima por bloque aunque el procesamiento estimado consuma todo el presupuesto de latencia
+MIN_WAIT = 0.05
+# Suavizado de la media móvil exponencial del tiempo de procesamiento por bloque
+EWMA_ALPHA = 0.3
+
+_END = object()
+
+
+def follow_lines(file_path: str, stop: threading.Event, poll_interval: float = POLL_INTERVAL) -> Iterator[str]:
+    """
+    Entrega las líneas completas de un archivo y sigue esperando las que se agreguen (como `tail -f`).
+
+    Una línea sin salto final se retiene hasta que se complete. Si el archivo se trunca o se
+    reemplaza, se vuelve a leer desde el inicio.
+    """
+    f = open(file_path, encoding="utf-8", newline="")
+    pending = ""
+    try:
+        while not stop.is_set():
+            line = f.readline()
+            if line:
+                pending += line
+                if pending.endswith("\n"):
+                    yield pending
+                    pending = ""
+                continue
+            try:
+                truncated = f.tell() > _file_size(file_path)
+            except FileNotFoundError:
+                truncated = False
+            if truncated:
+                f.close()
+                f = open(file_path, encoding="utf-8", newline="")
+                pending = ""
+                continue
+            stop.wait(poll_interval)
+    finally:
+        f.close()
+
+
+def _file_size(file_path: str) -> int:
+    with open(file_path, "rb") as f:
+        return f.seek(0, 2)
+
+
+def stdin_lines(stop: threading.Event) -> Iterator[str]:
+    """Entrega las líneas de la entrada estándar hasta EOF."""
+    for line in sys.stdin:
+        if stop.is_set():
+            break
+        yield line
+
+
+def parse_jsonl(lines: Iterator[str]) -> Iterator[Dict[str, Any]]:
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def parse_csv(lines: Iterator[str]) -> Iterator[Dict[str, Any]]:
+    """Interpreta líneas CSV con encabezado; los campos entre comillas pueden abarcar varias líneas."""
+    header = None
+    buffer = ""
+    for line in lines:
+        buffer += line
+        if buffer.count('"') % 2:  # Campo entre comillas aún abierto
+            continue
+        row = next(csv.reader(io.StringIO(buffer)), None)
+        buffer = ""
+        if not row:
+            continue
+        if header is None:
+            header = row
+            continue
+        yield dict(zip(header, row))
+
+
+class TweetStream:
+    """
+    Entrada continua de comentarios en micro-lotes con latencia acotada.
+
+    Un hilo lector interpreta la entrada y la deja en una cola de tamaño `buffer_size`; cuando
+    el procesamiento se atrasa la cola se llena y el lector se bloquea (contrapresión), así que
+    la memoria no crece sin límite. Un bloque se cierra al llegar a `max_batch` comentarios o
+    cuando el más antiguo ya no podría cumplir `max_latency` considerando el tiempo medio de
+    procesamiento observado. Tras escribir cada bloque hay que llamar a `batch_done`.
+
+    Con `priority` la cola entrega primero los comentarios con más interacción (retweets y
+    "me gusta"); si el procesamiento se atrasa, los de menor interacción son los que esperan.
+    """
+
+    def __init__(self, source: str, follow: bool = False, max_batch: int = 100,
+                 max_latency: float = DEFAULT_MAX_LATENCY, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 idle_timeout: Optional[float] = None, priority: bool = False):
+        if source == "-":
+            self.format = "jsonl"
+        elif source.endswith((".jsonl", ".ndjson")):
+            self.format = "jsonl"
+        elif source.endswith(".csv"):
+            self.format = "csv"
+        else:
+            raise ValueError("El modo continuo solo admite CSV o JSONL (o '-' para JSONL por stdin)")
+        self.source = source
+        self.follow = follow
+        self.max_batch = max(1, max_batch)
+        self.max_latency = max_latency
+        self.idle_timeout = idle_timeout
+        self.invalid = 0
+        self.processing_estimate = 0.0
+        self.priority = priority
+        # Elementos (prioridad, secuencia, llegada, registro); la secuencia desempata en orden de llegada
+        queue_class = queue.PriorityQueue if priority else queue.Queue
+        self._queue: "queue.Queue" = queue_class(maxsize=max(buffer_size, self.max_batch))
+        self._sequence = itertools.count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._batch_arrivals: List[float] = []
+        self._batch_started = 0.0
+        self._error: Optional[BaseException] = None
+
+    def _lines(self) -> Iterator[str]:
+        if self.source == "-":
+            return stdin_lines(self._stop)
+        if self.follow:
+            return follow_lines(self.source, self._stop)
+        return open(self.source, encoding="utf-8", newline="")
+
+    def _read(self):
+        try:
+            lines = self._lines()
+            records = parse_jsonl(lines) if self.format == "jsonl" else parse_csv(lines)
+            for record in records:
+                if any(record.get(field) in (None, "") for field in REQUIRED_FIELDS if field != "created_at"):
+                    self.invalid += 1
+                    METRICS.count("stream_invalid")
+                    continue
+                item = (self._priority(record), next(self._sequence), time.monotonic(), record)
+                try:
+                    self._queue.put_nowait(item)
+                except queue.Full:
+                    METRICS.count("stream_backpressure")
+                    while not self._stop.is_set():
+                        try:
+                            self._queue.put(item, timeout=POLL_INTERVAL)
+                            break
+                        except queue.Full:
+                            continue
+                if self._stop.is_set():
+                    break
+        except BaseException as e:  # Se relanza en el hilo principal
+            self._error = e
+        finally:
+            if not self._stop.is_set():
+                # Prioridad infinita: el fin se entrega después de todo lo pendiente
+                self._queue.put((math.inf, next(self._sequence), 0.0, _END))
+
+    def _priority(self, record: Dict[str, Any]) -> float:
+        if not self.priority:
+            return 0.0
+        try:
+            weight = engagement_weight(float(record.get("retweets") or 0), float(record.get("likes") or 0))
+        except (TypeError, ValueError):
+            return 0.0
+        return -float(weight)
+
+    def _frame(self, records: List[Dict[str, Any]]) -> pd.DataFrame:
+        df = pd.DataFrame(records)
+        for field in REQUIRED_FIELDS:
+            if field not in df:
+                df[field] = None
+        df["tweet_id"] = df["tweet_id"].astype(str)
+        for field in OPTIONAL_FIELDS:
+            if field in df:
+                df[field] = pd.to_numeric(df[field], errors="coerce").fillna(0).astype(int)
+        return df
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        self._thread.start()
+        finished = False
+        while not finished:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                print(f"Sin comentarios nuevos en {self.idle_timeout} s; finalizando")
+                break
+            if item[3] is _END:
+                break
+            arrivals, records = [item[2]], [item[3]]
+            # Presupuesto de espera: la latencia objetivo menos lo que tarda en procesarse un bloque
+            deadline = arrivals[0] + max(MIN_WAIT, self.max_latency - self.processing_estimate)
+            while len(records) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item[3] is _END:
+                    finished = True
+                    break
+                arrivals.append(item[2])
+                records.append(item[3])
+            self._batch_arrivals = arrivals
+            self._batch_started = time.monotonic()
+            METRICS.count("stream_batches")
+            yield self._frame(records)
+        self.close()
+        if self._error is not None:
+            raise self._error
+
+    def batch_done(self):
+        """Registra la latencia de extremo a extremo del último bloque entregado."""
+        now = time.monotonic()
+        elapsed = now - self._batch_started
+        self.processing_estimate = (elapsed if not self.processing_estimate
+                                    else EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.processing_estimate)
+        for arrival in self._batch_arrivals:
+            latency = now - arrival
+            METRICS.record_latency("end_to_end", latency)
+            if latency > self.max_latency:
+                METRICS.count("latency_target_missed")
+        self._batch_arrivals = []
+
+    def close(self):
+        self._stop.set()
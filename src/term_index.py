@@ -0,0 +1,317 @@
+import argparse
+import ast
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from aggregation import engagement_weight, load_results
+from utils import to_utc
+
+BUCKET_SECONDS = {"hour": 3600, "day": 86400}
+STAT_COLUMNS = ["count", "score_sum", "weighted_sum", "weight_sum"]
+DEFAULT_MAX_PAIRS = 1_000_000
+# Bloques pendientes antes de consolidar; evita reagrupar todo el índice en cada actualización
+COMPACT_EVERY = 32
+
+
+class TermIndex:
+    """
+    Índice de hashtags y palabras clave con co-ocurrencias y sentimiento por término.
+
+    Por cada bloque de resultados se construye la matriz dispersa término × comentario en formato
+    COO y de ella se derivan estadísticas por (término, bucket de tiempo) y conteos de pares
+    (XᵀX). Solo se guardan esos agregados, no la matriz, así que la memoria depende del
+    vocabulario y no del número de comentarios. Los pares se limitan a `max_pairs`: al superarlo se
+    descartan los menos frecuentes y `pair_error` acota el conteo máximo perdido.
+
+    Los `tweet_id` ya indexados se guardan como hashes de 64 bits ordenados (8 bytes por
+    comentario): al actualizar con la misma exportación o con una que se solapa, las filas ya
+    vistas se omiten.
+    """
+
+    def __init__(self, bucket: str = "hour", max_pairs: int = DEFAULT_MAX_PAIRS):
+        if bucket not in BUCKET_SECONDS:
+            raise ValueError(f"Bucket no soportado: {bucket}")
+        self.bucket = bucket
+        self.max_pairs = max_pairs
+        self.vocab: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.stats = pd.DataFrame(columns=STAT_COLUMNS, index=pd.MultiIndex.from_arrays([[], []],
+                                                                                      names=["term", "bucket"]))
+        self.pairs = pd.Series(dtype="int64", index=pd.MultiIndex.from_arrays([[], []], names=["a", "b"]))
+        self.pair_error = 0
+        self.tweets = 0
+        self.seen = np.zeros(0, dtype=np.uint64)
+        self._pending_stats: List[pd.DataFrame] = []
+        self._pending_pairs: List[pd.Series] = []
+        self._pending_seen: List[np.ndarray] = []
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            term_id = self.vocab[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def _compact_seen(self):
+        if self._pending_seen:
+            self.seen = np.union1d(self.seen, np.concatenate(self._pending_seen))
+            self._pending_seen = []
+
+    def _new_rows(self, tweet_ids: pd.Series) -> np.ndarray:
+        """Máscara de las filas con `tweet_id` aún no indexado (o sin id), que quedan marcadas como vistas."""
+        if len(self._pending_seen) >= COMPACT_EVERY:
+            self._compact_seen()
+        known = tweet_ids.notna().to_numpy()
+        ids = tweet_ids[known]
+        if pd.api.types.is_float_dtype(ids):  # Ids numéricos leídos como float por los nulos de la columna
+            ids = ids.astype("int64")
+        hashes = pd.util.hash_array(ids.astype(str).to_numpy(dtype=object))
+        fresh = ~pd.Series(hashes).duplicated().to_numpy()
+        if len(self.seen):
+            positions = np.minimum(np.searchsorted(self.seen, hashes), len(self.seen) - 1)
+            fresh &= self.seen[positions] != hashes
+        if self._pending_seen:
+            fresh &= ~np.isin(hashes, np.concatenate(self._pending_seen))
+        self._pending_seen.append(hashes[fresh])
+        mask = np.ones(len(tweet_ids), dtype=bool)
+        mask[known] = fresh
+        return mask
+
+    def update(self, records: Iterable[Dict[str, Any]]):
+        """Añade un bloque de resultados con `hashtags`, `keywords`, `created_at`, `score`, `retweets` y `likes`."""
+        self.update_frame(pd.DataFrame(list(records)))
+
+    def update_frame(self, df: pd.DataFrame):
+        # Solo se indexan comentarios con puntaje; los no puntuados no aportan sentimiento
+        if "score" in df:
+            df = df[pd.to_numeric(df["score"], errors="coerce").notna()]
+        if "tweet_id" in df:
+            df = df[self._new_rows(df["tweet_id"])]
+        if df.empty:
+            return
+        df = df.reset_index(drop=True)
+        # Matriz término × comentario en COO: (fila de comentario, id de término)
+        rows, cols = [], []
+        for column in ("hashtags", "keywords"):
+            if column not in df:
+                continue
+            for row, terms in enumerate(df[column]):
+                if isinstance(terms, str):  # Listas serializadas en CSV
+                    terms = ast.literal_eval(terms) if terms.startswith("[") else [terms]
+                if isinstance(terms, np.ndarray):  # Columnas de listas leídas de Parquet/Arrow
+                    terms = terms.tolist()
+                for term in dict.fromkeys(terms if isinstance(terms, list) else []):
+                    rows.append(row)
+                    cols.append(self._term_id(term))
+        self.tweets += len(df)
+        if not rows:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+
+        timestamps = to_utc(df["created_at"])
+        # Buckets como enteros desde la época; -1 para fechas inválidas
+        buckets = ((timestamps - pd.Timestamp(0)) // pd.Timedelta(seconds=BUCKET_SECONDS[self.bucket]))
+        buckets = buckets.fillna(-1).to_numpy(dtype=np.int64)
+        scores = pd.to_numeric(df.get("score"), errors="coerce").fillna(0).to_numpy(dtype=float)
+        weights = engagement_weight(df.get("retweets", 0), df.get("likes", 0)) * np.ones(len(df))
+
+        incidence = pd.DataFrame({
+            "term": cols,
+            "bucket": buckets[rows],
+            "count": 1.0,
+            "score_sum": scores[rows],
+            "weighted_sum": (weights * scores)[rows],
+            "weight_sum": weights[rows],
+        })
+        self._pending_stats.append(incidence.groupby(["term", "bucket"])[STAT_COLUMNS].sum())
+
+        # XᵀX por autounión sobre el comentario: pares (a, b) con a < b
+        coo = pd.DataFrame({"row": rows, "term": cols})
+        joined = coo.merge(coo, on="row", suffixes=("_a", "_b"))
+        joined = joined[joined["term_a"] < joined["term_b"]]
+        if not joined.empty:
+            pairs = joined.groupby(["term_a", "term_b"]).size()
+            pairs.index.names = ["a", "b"]
+            self._pending_pairs.append(pairs)
+        if len(self._pending_stats) >= COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        """Consolida los bloques pendientes y aplica el límite de pares."""
+        self._compact_seen()
+        if self._pending_stats:
+            frames = [self.stats] if not self.stats.empty else []
+            self.stats = pd.concat(frames + self._pending_stats).groupby(level=[0, 1]).sum()
+            self._pending_stats = []
+        if self._pending_pairs:
+            series = [self.pairs] if not self.pairs.empty else []
+            self.pairs = pd.concat(series + self._pending_pairs).groupby(level=[0, 1]).sum().astype("int64")
+            self._pending_pairs = []
+        if len(self.pairs) > self.max_pairs:
+            kept = self.pairs.nlargest(self.max_pairs, keep="first")
+            self.pair_error = max(self.pair_error, int(self.pairs.drop(kept.index).max()))
+            self.pairs = kept.sort_index()
+
+    def _range_stats(self, start=None, end=None) -> pd.DataFrame:
+        """Estadísticas por término dentro de [start, end)."""
+        self.compact()
+        stats = self.stats
+        if stats.empty:
+            return pd.DataFrame(columns=STAT_COLUMNS)
+        buckets = stats.index.get_level_values("bucket")
+        mask = np.ones(len(stats), dtype=bool)
+        seconds = BUCKET_SECONDS[self.bucket]
+        if start is not None:
+            mask &= buckets >= pd.Timestamp(start).value // 10 ** 9 // seconds
+        if end is not None:
+            mask &= buckets < -(-pd.Timestamp(end).value // 10 ** 9 // seconds)
+        if start is not None or end is not None:
+            mask &= buckets >= 0
+        return stats[mask].groupby(level="term").sum()
+
+    @staticmethod
+    def _with_means(stats: pd.DataFrame) -> pd.DataFrame:
+        return stats.assign(mean_score=stats["score_sum"] / stats["count"],
+                            weighted_mean_score=stats["weighted_sum"] / stats["weight_sum"])
+
+    def _rows(self, frame: pd.DataFrame, columns: List[str]) -> List[Dict[str, Any]]:
+        out = frame[columns].round(4).copy()
+        out.insert(0, "term", [self.terms[i] for i in frame.index])
+        out["count"] = out["count"].astype(int)
+        return out.replace({np.nan: None}).to_dict(orient="records")
+
+    def top_terms(self, start=None, end=None, by: str = "volume", n: int = 20,
+                  min_count: int = 5) -> List[Dict[str, Any]]:
+        """
+        Términos principales en un rango de tiempo.
+
+        `by="volume"` ordena por número de comentarios, `by="sentiment"` por media ponderada y
+        `by="shift"` por el cambio de la media ponderada en el rango frente al resto del índice.
+        """
+        in_range = self._with_means(self._range_stats(start, end))
+        in_range = in_range[in_range["count"] >= min_count]
+        if in_range.empty:
+            return []
+        if by == "volume":
+            return self._rows(in_range.nlargest(n, "count"), ["count", "mean_score", "weighted_mean_score"])
+        if by == "sentiment":
+            return self._rows(in_range.nlargest(n, "weighted_mean_score"),
+                              ["count", "mean_score", "weighted_mean_score"])
+        if by == "shift":
+            total = self._range_stats()
+            rest = total.sub(self._range_stats(start, end), fill_value=0).reindex(in_range.index)
+            baseline = rest["weighted_sum"] / rest["weight_sum"]
+            in_range = in_range.assign(baseline_score=baseline,
+                                       shift=in_range["weighted_mean_score"] - baseline).dropna(subset=["shift"])
+            order = in_range["shift"].abs().sort_values(ascending=False).index[:n]
+            return self._rows(in_range.loc[order], ["count", "weighted_mean_score", "baseline_score", "shift"])
+        raise ValueError(f"Criterio no soportado: {by}")
+
+    def cooccurring(self, term: str, n: int = 20) -> List[Dict[str, Any]]:
+        """Términos que más aparecen junto a `term`, con su sentimiento medio global."""
+        self.compact()
+        term_id = self.vocab.get(term)
+        if term_id is None or self.pairs.empty:
+            return []
+        a = self.pairs.index.get_level_values("a")
+        b = self.pairs.index.get_level_values("b")
+        mask = (a == term_id) | (b == term_id)
+        partners = np.where(a[mask] == term_id, b[mask], a[mask])
+        counts = pd.Series(self.pairs.to_numpy()[mask], index=partners).nlargest(n)
+        stats = self._with_means(self._range_stats())
+        return [{"term": self.terms[i], "cooccurrences": int(count),
+                 "weighted_mean_score": round(float(stats.at[i, "weighted_mean_score"]), 4)}
+                for i, count in counts.items()]
+
+    def save(self, path: str):
+        """Guarda el índice en un .npz comprimido que puede volver a cargarse y actualizarse."""
+        self.compact()
+        stats = self.stats.reset_index()
+        pairs = self.pairs.reset_index()
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            meta=np.array(json.dumps({"bucket": self.bucket, "max_pairs": self.max_pairs,
+                                      "pair_error": self.pair_error, "tweets": self.tweets})),
+            terms=np.array(self.terms, dtype=str),
+            stat_keys=stats[["term", "bucket"]].to_numpy(dtype=np.int64),
+            stat_values=stats[STAT_COLUMNS].to_numpy(dtype=np.float64),
+            pair_keys=pairs[["a", "b"]].to_numpy(dtype=np.int64) if not pairs.empty else np.zeros((0, 2), np.int64),
+            pair_counts=pairs.iloc[:, -1].to_numpy(dtype=np.int64) if not pairs.empty else np.zeros(0, np.int64),
+            seen=self.seen,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TermIndex":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(meta["bucket"], meta["max_pairs"])
+            index.pair_error = meta["pair_error"]
+            index.tweets = meta["tweets"]
+            index.terms = [str(term) for term in data["terms"]]
+            index.vocab = {term: i for i, term in enumerate(index.terms)}
+            keys = data["stat_keys"]
+            index.stats = pd.DataFrame(data["stat_values"], columns=STAT_COLUMNS,
+                                       index=pd.MultiIndex.from_arrays([keys[:, 0], keys[:, 1]],
+                                                                       names=["term", "bucket"]))
+            pair_keys = data["pair_keys"]
+            index.pairs = pd.Series(data["pair_counts"],
+                                    index=pd.MultiIndex.from_arrays([pair_keys[:, 0], pair_keys[:, 1]],
+                                                                    names=["a", "b"]))
+            if "seen" in data:  # Índices anteriores no guardaban los tweet_id
+                index.seen = data["seen"]
+        return index
+
+    @classmethod
+    def open(cls, path: str, bucket: str = "hour", max_pairs: int = DEFAULT_MAX_PAIRS) -> "TermIndex":
+        """Carga el índice si existe o crea uno vacío."""
+        return cls.load(path) if os.path.exists(path) else cls(bucket, max_pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice de hashtags y palabras clave con sentimiento")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Crea o actualiza el índice con un archivo de resultados")
+    build.add_argument("input", help="Archivo de resultados (JSON, JSONL o CSV)")
+    build.add_argument("--index", required=True, help="Archivo .npz del índice")
+    build.add_argument("--bucket", choices=list(BUCKET_SECONDS), default="hour")
+    build.add_argument("--max-pairs", type=int, default=DEFAULT_MAX_PAIRS)
+    build.add_argument("--chunk-size", type=int, default=100000)
+    top = sub.add_parser("top", help="Términos principales en un rango de tiempo")
+    top.add_argument("--index", required=True)
+    top.add_argument("--by", choices=["volume", "sentiment", "shift"], default="volume")
+    top.add_argument("--start", help="Inicio del rango (ISO 8601, UTC)")
+    top.add_argument("--end", help="Fin del rango (ISO 8601, UTC)")
+    top.add_argument("-n", type=int, default=20)
+    top.add_argument("--min-count", type=int, default=5)
+    cooccur = sub.add_parser("cooccur", help="Términos que co-ocurren con uno dado")
+    cooccur.add_argument("term")
+    cooccur.add_argument("--index", required=True)
+    cooccur.add_argument("-n", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = TermIndex.open(args.index, args.bucket, args.max_pairs)
+        before = index.tweets
+        for chunk in load_results(args.input, chunksize=args.chunk_size):
+            index.update_frame(chunk)
+        index.save(args.index)
+        print(f"Índice actualizado: {len(index.terms)} términos, {len(index.pairs)} pares, "
+              f"{index.tweets} comentarios ({index.tweets - before} nuevos) -> {args.index}")
+    elif args.command == "top":
+        index = TermIndex.load(args.index)
+        print(json.dumps(index.top_terms(args.start, args.end, args.by, args.n, args.min_count),
+                         ensure_ascii=False, indent=2))
+    else:
+        index = TermIndex.load(args.index)
+        print(json.dumps(index.cooccurring(args.term, args.n), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
 import re
-from typing import List, Tuple
+from typing import Dict, Iterable, List
+
+import pandas as pd
 
 HASHTAG_PATTERN = re.compile(r"#\w+")
 URL_PATTERN = re.compile(r"https?://\S+")
+SPECIAL_CHARS_PATTERN = re.compile(r"[^\w\s#]")
+
+# Con pocas palabras clave la búsqueda lineal de subcadenas es más rápida que la expresión regular
+LINEAR_SCAN_MAX_KEYWORDS = 32
 
 
 def clean_text(text: str) -> str:
     """Normaliza el texto: minúsculas, elimina enlaces e imágenes, caracteres especiales."""
     text = text.lower()
     text = URL_PATTERN.sub("", text)
-    text = re.sub(r"[^\w\s#]", "", text)
+    text = SPECIAL_CHARS_PATTERN.sub("", text)
     return text.strip()
 
 
@@ -21,4 +27,117 @@ def extract_hashtags(text: str) -> List[str]:
 def extract_keywords(text: str, keywords: List[str]) -> List[str]:
     """Extrae palabras clave relevantes del texto."""
     found = [kw for kw in keywords if kw in text]
-    return found 
\ No newline at end of file
+    return found
+
+
+def _trie_regex(node: Dict) -> str:
+    """Convierte un trie de caracteres en una expresión regular sin alternativas redundantes."""
+    end = "" in node
+    branches = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if end:
+        return f"(?:{body})?"
+    return body
+
+
+class KeywordMatcher:
+    """
+    Busca muchas palabras clave a la vez con una sola expresión regular construida como trie.
+
+    El coste por texto depende de la longitud del texto y no del número de palabras clave. Por
+    defecto reproduce la semántica de `extract_keywords` (subcadena); con `whole_words=True` solo
+    acepta coincidencias delimitadas por límites de palabra.
+    """
+
+    def __init__(self, keywords: Iterable[str], whole_words: bool = False):
+        self.keywords = list(dict.fromkeys(kw for kw in keywords if kw))
+        self.order = {kw: i for i, kw in enumerate(self.keywords)}
+        self.whole_words = whole_words
+        self.linear_scan = not whole_words and len(self.keywords) <= LINEAR_SCAN_MAX_KEYWORDS
+        trie: Dict = {}
+        for kw in self.keywords:
+            node = trie
+            for char in kw:
+                node = node.setdefault(char, {})
+            node[""] = True
+        # Palabras clave que son prefijo de cada una (incluida ella misma): la expresión regular solo
+        # devuelve la coincidencia más larga en cada posición
+        self.prefixes = {kw: [kw[:end] for end in range(1, len(kw) + 1) if kw[:end] in self.order]
+                         for kw in self.keywords}
+        body = _trie_regex(trie) if self.keywords else "(?!)"
+        if whole_words:
+            self.pattern = re.compile(rf"(?<!\w)(?:{body})(?!\w)")
+        else:
+            self.pattern = re.compile(body)
+
+    def _expand(self, matches: List[str]) -> List[str]:
+        """Ordena las coincidencias como la lista original, añadiendo palabras clave que son prefijo de otras."""
+        if not matches:
+            return []
+        if self.whole_words:
+            found = set(matches)
+        else:
+            found = {kw for match in matches for kw in self.prefixes[match]}
+        if len(found) == 1:
+            return list(found)
+        return sorted(found, key=self.order.__getitem__)
+
+    def _matches(self, text: str) -> List[str]:
+        """Coincidencias más largas en cada posición, incluidas las solapadas."""
+        search = self.pattern.search
+        matches = []
+        match = search(text)
+        while match:
+            matches.append(match.group(0))
+            match = search(text, match.start() + 1)
+        return matches
+
+    def find(self, text: str) -> List[str]:
+        """Devuelve las palabras clave presentes en el texto, en el orden en que fueron definidas."""
+        if self.linear_scan:
+            return [kw for kw in self.keywords if kw in text]
+        return self._expand(self._matches(text))
+
+    def find_series(self, texts: pd.Series) -> pd.Series:
+        """Aplica `find` a una columna completa."""
+        find = self.find
+        return pd.Series([find(text) for text in texts], index=texts.index, dtype=object)
+
+
+# Las funciones por columna iteran con los patrones precompilados en lugar de usar `.str`: sobre
+# dtype object pandas también recorre fila a fila, y con cadenas respaldadas por Arrow `\w` deja
+# de reconocer caracteres acentuados como hace `re`.
+def clean_text_series(texts: pd.Series) -> pd.Series:
+    """Versión por columna de clean_text; los valores nulos se tratan como texto vacío."""
+    url_sub, special_sub = URL_PATTERN.sub, SPECIAL_CHARS_PATTERN.sub
+    cleaned = [special_sub("", url_sub("", text.lower())).strip() if isinstance(text, str) else ""
+               for text in texts]
+    return pd.Series(cleaned, index=texts.index, dtype=object)
+
+
+def extract_hashtags_series(texts: pd.Series) -> pd.Series:
+    """Versión por columna de extract_hashtags."""
+    findall = HASHTAG_PATTERN.findall
+    return pd.Series([findall(text) for text in texts], index=texts.index, dtype=object)
+
+
+def preprocess_texts(texts: pd.Series, matcher: KeywordMatcher) -> pd.DataFrame:
+    """Limpia una columna de textos y extrae hashtags y palabras clave en una sola pasada por bloque."""
+    cleaned = clean_text_series(texts)
+    return pd.DataFrame({
+        "clean_text": cleaned,
+        "hashtags": extract_hashtags_series(cleaned),
+        "keywords": matcher.find_series(cleaned),
+    }, index=texts.index)
+
+
+def to_utc(values) -> pd.Series:
+    """Convierte `created_at` (ISO o epoch en milisegundos, como lo exporta pandas) a marcas UTC sin zona."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        parsed = pd.to_datetime(values, unit="ms", utc=True, errors="coerce")
+    else:
+        parsed = pd.to_datetime(values, utc=True, errors="coerce", format="mixed")
+    return parsed.dt.tz_localize(None)